@@ -1,7 +1,6 @@
 import json
 from admin_state import AdminState
 import asyncio
-import time
 import os
 
 uri = os.environ.get(
@@ -15,24 +14,14 @@ class Admin():
         self._client.set_game_tick_callback(self._on_game_tick)
 
         loop = asyncio.get_event_loop()
-        connection = loop.run_until_complete(self._client.connect())
-        tasks = [
-            asyncio.ensure_future(self._client._handle_messages(connection)),
-        ]
-        loop.run_until_complete(asyncio.wait(tasks))
+        # reconnects with backoff when the connection drops, this object and its state stay (see reconnect.py)
+        loop.run_until_complete(self._client.run())
 
     async def _on_game_tick(self, tick_number, game_state):
         pass
 
 def main():
-    for i in range(0,10):
-        while True:
-            try:
-                Admin()
-            except:
-                time.sleep(5)
-                continue
-            break
+    Admin()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
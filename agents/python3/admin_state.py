@@ -1,125 +1,108 @@
 import asyncio
-from typing import Union
+import os
+import reconnect
+from typing import Dict, List, Optional, Union
 import websockets
-import json
 
 from websockets.client import WebSocketClientProtocol
+from entity_store import EntityStore
+from json_codec import decode_packet, dumps
+from game_analytics import AnalyticsWriter
 
 _move_set = set(("up", "down", "left", "right"))
 
+analytics_directory = os.environ.get("ANALYTICS_DIR") or "/app/data"
+
 
 class AdminState:
-    def __init__(self, connection_string: str):
+    def __init__(self, connection_string: str, analytics_directory: str = analytics_directory,
+                 analytics: Optional[AnalyticsWriter] = None, world_seed: int = -1, prng_seed: int = -1):
         self._game_count = 1
         self._connection_string = connection_string
         self._state = None
+        self.entity_store = EntityStore()
         self._tick_callback = None
-
-        # Variables for a reward function
-        self._winner = None # Either "a" or "b"
-        self._total_ticks = 0 # Total number of ticks in the game
-        self._a_invalid_moves = 0 # Not implemented
-        self._a_valid_moves = 0 # Not implemented
-        self._a_agents = [] # List of tuples per unit (unit_id, hp, initial_position, final_position, bombs_used)
-        self._b_invalid_moves = 0 # Not implemented
-        self._b_valid_moves = 0 # Not implemented
-        self._b_agents = [] # List of tuples per unit (unit_id, hp, initial_position, final_position, bombs_used)
+        self._endgame_callback = None
+        self._winner = None  # Either "a" or "b"
+        # several admins (see match_runner.py) can share one writer, an own writer
+        # stores every game right away so a stopped admin loses none of them
+        self._analytics = analytics if analytics is not None else AnalyticsWriter(
+            analytics_directory, games_per_shard=1)
+        # seeds of the running game, -1 when the engine picked them
+        self._world_seed = world_seed
+        self._prng_seed = prng_seed
+        self.connection: Optional[WebSocketClientProtocol] = None
+        self._backoff = reconnect.Backoff()
+        self.reconnects = 0
+        self.game_states_received = 0
+        self.games_finished = 0
+        # packets sent while the connection was down, since the last reconnect
+        self.unsent_packets: List[Dict] = []
 
     def set_game_tick_callback(self, generate_agent_action_callback):
         self._tick_callback = generate_agent_action_callback
 
-    def save_vars_from_state_to_disk(self):
-        def agent_dict(agent_data):
-            return {
-                "hp": agent_data[1],
-                "initial_position": agent_data[2],
-                "final_position": agent_data[3],
-                "bombs_used": agent_data[4]
-            }
-        
-        dict_to_save = {
-            "winner": self._winner,
-            "total_ticks": self._total_ticks,
-            "a": {
-                "invalid_moves": self._a_invalid_moves,
-                "valid_moves": self._a_valid_moves,
-                **{str(self._a_agents[i][0]): agent_dict(self._a_agents[i]) for i in range(3)}
-            },
-            "b": {
-                "invalid_moves": self._b_invalid_moves,
-                "valid_moves": self._b_valid_moves,
-                **{str(self._b_agents[i][0]): agent_dict(self._b_agents[i]) for i in range(3)}
-            }
-        }
-
-        with open(f"/app/data/game{self._game_count}.txt", "w") as file:
-            file.write(json.dumps(dict_to_save))
-
-    def reset_vars(self):
-        self._winner = None
-        self._total_ticks = 0
-        self._unit_hps = {}
-        self._a_invalid_moves = 0
-        self._a_valid_moves = 0
-        self._a_agents = []
-        self._b_invalid_moves = 0
-        self._b_valid_moves = 0
-        self._b_agents = []
-
+    """
+    `endgame_callback(payload)` is awaited after every finished game instead
+    of requesting the next game, so the caller decides when to reset
+    """
+    def set_endgame_callback(self, endgame_callback):
+        self._endgame_callback = endgame_callback
+
+    """
+    computes per unit / per team metrics of the finished game in one pass
+    over its history and appends them to the analytics shards
+    """
     def parse_endgame_state(self, payload):
         self._winner = payload.get("winning_agent_id")
-        self._total_ticks = payload.get("history")[-1].get("tick")
-        self._unit_hps = self.get_damage_dealt(payload)
-
-        agents_a = self._state.get("agents").get("a").get("unit_ids")
-        for agent in agents_a:
-            unit_state = self._state.get("unit_state").get(agent)
-            payload_unit_state = payload.get("initial_state").get("unit_state").get(agent)
-            bombs_used = payload_unit_state.get("inventory").get("bombs") - unit_state.get("inventory").get("bombs")
-            self._a_agents.append((unit_state.get("unit_id"), unit_state.get("hp"), payload_unit_state.get("coordinates"), unit_state.get("coordinates"), bombs_used))
-
-        agents_b = self._state.get("agents").get("b").get("unit_ids")
-        for agent in agents_b:
-            unit_state = self._state.get("unit_state").get(agent)
-            payload_unit_state = payload.get("initial_state").get("unit_state").get(agent)
-            bombs_used = payload_unit_state.get("inventory").get("bombs") - unit_state.get("inventory").get("bombs")
-            self._b_agents.append((unit_state.get("unit_id"), unit_state.get("hp"), payload_unit_state.get("coordinates"), unit_state.get("coordinates"), bombs_used))
-
-    # Wytse with the sauce
-    def get_damage_dealt(self, payload):
-        unit_hps = {}
-
-        for unit in payload.get("initial_state").get("unit_state"):
-            unit_hps[unit] = payload.get("initial_state").get("unit_state").get(unit).get("hp")
-
-        for tick in payload.get("history"):
-            tick_id = tick.get("tick")
-            events = tick.get("events")
-
-            for event in events:
-                if(event.get("type") == "unit_state"):
-                    affected_unit = event.get("data").get("unit_id")
-                    affected_unit_hp = unit_hps[affected_unit]
-                    affected_unit_current_hp = event.get("data").get("hp")
-
-                    if(affected_unit_hp != affected_unit_current_hp):
-                        print(f"{affected_unit} took damage on tick {tick_id}. Remaining HP: {affected_unit_current_hp}") # Convert to dict?
-                        unit_hps[affected_unit] = affected_unit_current_hp
-        return unit_hps
+        tables = self._analytics.add_game(
+            payload, self._world_seed, self._prng_seed)
+        units = tables.get("units")
+        for unit_id, hp, damage_dealt, kills in zip(units.get("unit_id"), units.get("final_hp"), units.get("damage_dealt"), units.get("kills")):
+            print(f"{unit_id}: {hp} hp left, dealt {damage_dealt} damage, {kills} kills")
 
     async def connect(self):
         self.connection = await websockets.connect(self._connection_string)
         if self.connection.open:
             return self.connection
 
+    async def connect_with_backoff(self):
+        return await reconnect.connect_with_backoff(self.connect, self._backoff)
+
+    """
+    plays `max_games` games, reconnecting with jittered exponential backoff
+    whenever the connection drops (see GameState.run), the analytics writer
+    and game count are kept
+    """
+    async def run(self, max_games: Optional[int] = reconnect.max_games,
+                  connection: Optional[WebSocketClientProtocol] = None):
+        await reconnect.run_games(self, max_games, connection)
+
+    async def _on_reconnected(self, outage: float):
+        self.reconnects += 1
+        print(f"reconnected after {outage:.2f}s, {len(self.unsent_packets)} packets were not sent while disconnected")
+        self.unsent_packets = []
+
     async def _send(self, packet):
-        await self.connection.send(json.dumps(packet))
+        if self.connection is not None:
+            try:
+                await self.connection.send(dumps(packet))
+                return
+            except websockets.exceptions.ConnectionClosed:
+                pass
+        print(f"not connected, {packet.get('type')} was not sent")
+        self.unsent_packets.append(packet)
+
+    async def request_game_reset(self, world_seed: int, prng_seed: int):
+        self._world_seed = world_seed
+        self._prng_seed = prng_seed
+        await self._send({"type": "request_game_reset", "world_seed": world_seed, "prng_seed": prng_seed})
 
     async def _handle_messages(self, connection: WebSocketClientProtocol):
         while True:
             try:
                 raw_data = await connection.recv()
-                data = json.loads(raw_data)
+                data = decode_packet(raw_data)
                 await self._on_data(data)
             except websockets.exceptions.ConnectionClosed:
                 print('Connection with server closed')
@@ -133,6 +116,7 @@ class AdminState:
             pass
         elif data_type == "game_state":
             payload = data.get("payload")
+            self.game_states_received += 1
             self._on_game_state(payload)
         elif data_type == "tick":
             payload = data.get("payload")
@@ -140,22 +124,26 @@ class AdminState:
 
         elif data_type == "endgame_state":
             payload = data.get("payload")
+            self.games_finished += 1
             self.parse_endgame_state(payload)
             print(f"Game over. Winner: Agent {self._winner}")
-            self.save_vars_from_state_to_disk()
-            self.reset_vars()
 
-            if self._game_count < 2:
-                await self._send({"type": "request_game_reset", "world_seed": 1234, "prng_seed": 1234})
+            if self._endgame_callback is not None:
+                await self._endgame_callback(payload)
+            elif self._game_count < 2:
+                await self.request_game_reset(1234, 1234)
                 self._game_count += 1
                 print(f"Game reset requested to start game {self._game_count}")
             else:
+                self._analytics.close()
                 print("Game count limit reached. Exiting.")
         else:
             print(f"unknown packet \"{data_type}\": {data}")
 
     def _on_game_state(self, game_state):
         self._state = game_state
+        self.entity_store = EntityStore(game_state.get("entities"))
+        self._state["entities"] = self.entity_store.entities
 
     async def _on_game_tick(self, game_tick):
         events = game_tick.get("events")
@@ -177,6 +165,7 @@ class AdminState:
                 self._on_unit_action(unit_action)
             else:
                 print(f"unknown event type {event_type}: {event}")
+        self._state["entities"] = self.entity_store.entities
         if self._tick_callback is not None:
             tick_number = game_tick.get("tick")
             self._state["tick"] = tick_number
@@ -184,30 +173,18 @@ class AdminState:
 
     def _on_entity_spawned(self, spawn_event):
         spawn_payload = spawn_event.get("data")
-        self._state["entities"].append(spawn_payload)
+        self.entity_store.add(spawn_payload)
 
     def _on_entity_expired(self, spawn_event):
-        expire_payload = spawn_event.get("data")
-
-        def filter_entity_fn(entity):
-            [x, y] = expire_payload
-            entity_x = entity.get("x")
-            entity_y = entity.get("y")
-            should_remove = entity_x == x and entity_y == y
-            return should_remove == False
-
-        self._state["entities"] = list(filter(
-            filter_entity_fn, self._state["entities"]))
+        [x, y] = spawn_event.get("data")
+        self.entity_store.remove_at(x, y)
 
     def _on_unit_state(self, unit_state):
         unit_id = unit_state.get("unit_id")
         self._state["unit_state"][unit_id] = unit_state
 
     def _on_entity_state(self, x, y, updated_entity):
-        for entity in self._state.get("entities"):
-            if entity.get("x") == x and entity.get("y") == y:
-                self._state["entities"].remove(entity)
-        self._state["entities"].append(updated_entity)
+        self.entity_store.replace_at(x, y, updated_entity)
 
     def _on_unit_action(self, action_packet):
         unit_id = action_packet["unit_id"]
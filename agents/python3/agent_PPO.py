@@ -1,53 +1,89 @@
 from typing import Union
 from game_state import GameState
 import asyncio
+import functools
 import random
 import os
-import time
-import create_cnn
 import numpy as np
+from inference_server import InferenceClient
+from model_loader import load_policy
+from tick_timing import StartupTimings
+from observation_encoder import ObservationEncoder, NUM_PLANES, NUM_FEATURES
 
 uri = os.environ.get(
     'GAME_CONNECTION_STRING') or "ws://127.0.0.1:3000/?role=agent&agentId=agentId&name=defaultName"
 
 actions = ["up", "down", "left", "right", "bomb", "detonate"]
+# model outputs 0 - 3 are moves in this order
+moves = ["up", "right", "down", "left"]
 
-input_shape = (15, 15, 1)
-num_channels = 1 
+input_shape = (15, 15, NUM_PLANES)
+num_channels = NUM_FEATURES
 num_actions = 6 
 hidden_units = 64
 
+# unix socket of a running inference_server.py, the agent then neither loads tensorflow nor the model
+inference_socket = os.environ.get("INFERENCE_SOCKET")
+
+# a .tflite file or a SavedModel directory (see model_loader.py), a fresh create_cnn model when not set
+model_path = os.environ.get("MODEL_PATH")
+
+
+def load_policy_in_background(timings: StartupTimings) -> asyncio.Future:
+    # opening the connection mostly waits on the network, it goes on while the model loads in a thread
+    return asyncio.get_event_loop().run_in_executor(None, functools.partial(
+        load_policy, model_path, input_shape, num_channels, num_actions, hidden_units, timings))
+
+
 class Agent():
     def __init__(self):
 
         self._client = GameState(uri)
+        self._timings = StartupTimings()
 
         # any initialization code can go here
 
-        # Create cnn
-        self.cnn = create_cnn.create_cnn(input_shape, num_channels, num_actions, hidden_units)
+        loop = asyncio.get_event_loop()
+        if inference_socket:
+            self._inference = InferenceClient(inference_socket)
+            model_ready = self._inference.connect()
+        else:
+            self._inference = None
+            model_ready = load_policy_in_background(self._timings)
+
+        # Keep the model input up to date from game events
+        self._encoder = ObservationEncoder()
+        self._client.add_state_listener(self._encoder)
 
         self._client.set_game_tick_callback(self._on_game_tick)
 
-        loop = asyncio.get_event_loop()
-        connection = loop.run_until_complete(self._client.connect())
-        tasks = [
-            asyncio.ensure_future(self._client._handle_messages(connection)),
-        ]
-        loop.run_until_complete(asyncio.wait(tasks))
+        connection, self._policy = loop.run_until_complete(
+            asyncio.gather(self._connect(), model_ready))
+        self._timings.start("first_tick")
+        self._waiting_for_first_tick = True
+        # reconnects with backoff when the connection drops, the model stays loaded (see reconnect.py)
+        loop.run_until_complete(self._client.run(connection=connection))
+
+    async def _connect(self):
+        self._timings.start("connect")
+        connection = await self._client.connect_with_backoff()
+        self._timings.end("connect")
+        return connection
 
     # returns coordinates of the first bomb placed by a unit
     def _get_bomb_to_detonate(self, unit) -> Union[int, int] or None:
-        entities = self._client._state.get("entities")
-        bombs = list(filter(lambda entity: entity.get(
-            "unit_id") == unit and entity.get("type") == "b", entities))
-        bomb = next(iter(bombs or []), None)
+        bombs = self._client.entity_store.get_bombs(unit)
+        bomb = next(iter(bombs), None)
         if bomb != None:
             return [bomb.get("x"), bomb.get("y")]
         else:
             return None
 
     async def _on_game_tick(self, tick_number, game_state):
+        if self._waiting_for_first_tick:
+            self._waiting_for_first_tick = False
+            self._timings.end("first_tick")
+            print(self._timings.format_summary())
 
         # get my units
         my_agent_id = game_state.get("connection").get("agent_id")
@@ -55,51 +91,44 @@ class Agent():
 
         # TO DO:
 
-        # Run neural network once for all units, instead of calling it multiple times
         # Add code to detonate specific bombs, currently the action "detonate" will detonate the bomb placed first by the unit
 
-        # send each unit a random action
-        for unit_id in my_units:
-            
-            # Generate a random test sample
-            spatial_data = np.random.rand(1, *input_shape)
-            non_spatial_data = np.random.rand(1, num_channels)
-
-            # Perform inference
-            output_probabilities = self.cnn([spatial_data, non_spatial_data], training=False)
-
-            # Select action
-            action = np.argmax(output_probabilities)
-
-            if action == 0:
-                await self._client.send_move("up", unit_id)
-            elif action == 1:
-                await self._client.send_move("right", unit_id)
-            elif action == 2:
-                await self._client.send_move("down", unit_id)
-            elif action == 3:
-                await self._client.send_move("left", unit_id)
+        spatial_data, non_spatial_data = self._encoder.get_inputs(tick_number)
+
+        # Perform inference for all units at once
+        if self._inference is not None:
+            probabilities = await self._inference.infer(spatial_data, non_spatial_data)
+            unit_actions = np.argmax(probabilities, axis=1)
+        else:
+            unit_actions, _ = self._policy(spatial_data, non_spatial_data)
+
+        # send each unit an action
+        packets = []
+        for row, unit_id in enumerate(my_units):
+            action = unit_actions[row]
+
+            if action < 4:
+                packets.append(
+                    {"type": "move", "move": moves[action], "unit_id": unit_id})
             elif action == 4:
-                await self._client.send_bomb(unit_id)
+                packets.append({"type": "bomb", "unit_id": unit_id})
             elif action == 5:
                 bomb_coordinates = self._get_bomb_to_detonate(unit_id)
                 if bomb_coordinates != None:
-                    x, y = bomb_coordinates
-                    await self._client.send_detonate(x, y, unit_id)
+                    packets.append(
+                        {"type": "detonate", "coordinates": bomb_coordinates, "unit_id": unit_id})
 
             else:
                 print(f"Unhandled action: {action} for unit {unit_id}")
 
+        # all units' actions go out together
+        dropped = await self._client.send_actions(packets)
+        for packet, reason in dropped:
+            print(f"dropped {packet}: {reason}")
+
 
 def main():
-    for i in range(0,10):
-        while True:
-            try:
-                Agent()
-            except:
-                time.sleep(5)
-                continue
-            break
+    Agent()
 
 
 if __name__ == "__main__":
@@ -1,9 +1,9 @@
-from typing import Union
 from forward_model import ForwardModel
 from game_state import GameState
+from local_forward_model import LocalForwardModel
+from mcts import MCTSPlanner
 import asyncio
 import os
-import random
 
 fwd_model_uri = os.environ.get(
     "FWD_MODEL_CONNECTION_STRING") or "ws://127.0.0.1:6969/?role=admin"
@@ -11,16 +11,21 @@ fwd_model_uri = os.environ.get(
 uri = os.environ.get(
     "GAME_CONNECTION_STRING") or "ws://127.0.0.1:3000/?role=agent&agentId=agentId&name=defaultName"
 
-actions = ["up", "down", "left", "right", "bomb", "detonate"]
+# fraction of the tick period spent searching, the rest is left for sending the action
+search_budget = float(os.environ.get("SEARCH_BUDGET") or 0.7)
 
 
 class Agent():
     def __init__(self):
-        self._client_fwd = ForwardModel(fwd_model_uri)
+        # set FWD_MODEL_IN_PROCESS=1 to search with the Python forward model
+        if os.environ.get("FWD_MODEL_IN_PROCESS") == "1":
+            self._client_fwd = LocalForwardModel()
+        else:
+            self._client_fwd = ForwardModel(fwd_model_uri)
         self._client = GameState(uri)
+        self._planner = None
 
         self._client.set_game_tick_callback(self._on_game_tick)
-        self._client_fwd.set_next_state_callback(self._on_next_game_state)
         self.connect()
 
     def connect(self):
@@ -37,55 +42,32 @@ class Agent():
             self._client_fwd._handle_messages(client_fwd_connection))
         loop.run_forever()
 
-    def _get_bomb_to_detonate(self, game_state) -> Union[int, int] or None:
-        agent_number = game_state.get("connection").get("agent_number")
-        entities = self._client._state.get("entities")
-        bombs = list(filter(lambda entity: entity.get(
-            "owner") == agent_number and entity.get("type") == "b", entities))
-        bomb = next(iter(bombs or []), None)
-        if bomb != None:
-            return [bomb.get("x"), bomb.get("y")]
-        else:
-            return None
-
     async def _on_game_tick(self, tick_number, game_state):
-        await self._send_eval_next_state()
-        random_action = self.generate_random_action()
-        if random_action in ["up", "left", "right", "down"]:
-            await self._client.send_move(random_action)
-        elif random_action == "bomb":
-            await self._client.send_bomb()
-        elif random_action == "detonate":
-            bomb_coordinates = self._get_bomb_to_detonate(game_state)
-            if bomb_coordinates != None:
-                x, y = bomb_coordinates
-                await self._client.send_detonate(x, y)
-        else:
-            print(f"Unhandled action: {random_action}")
-
-    async def _send_eval_next_state(self):
-        actions = [
-            {
-                "action": {"move": "right", "type": "move"},
-                "agent_number": 0,
-            }, {
-                "action": {"move": "left", "type": "move"},
-                "agent_number": 1,
-            }
-        ]
-        await self._client_fwd.send_next_state(1, self._client._state, actions)
-
-    def generate_random_action(self):
-        actions_length = len(actions)
-        return actions[random.randint(0, actions_length - 1)]
-
-    async def _on_next_game_state(self, state):
-        # print(state)
-        pass
-
-    def generate_random_action(self):
-        actions_length = len(actions)
-        return actions[random.randint(0, actions_length - 1)]
+        loop = asyncio.get_event_loop()
+        tick_start = loop.time()
+        tick_period = 1 / game_state.get("config").get("tick_rate_hz")
+        if self._planner is None:
+            agent_id = game_state.get("connection").get("agent_id")
+            self._planner = MCTSPlanner(self._client_fwd, agent_id)
+
+        joint_action = await self._planner.plan(game_state, tick_start + tick_period * search_budget)
+        print(f"tick {tick_number}: {self._planner.last_simulations} simulations, depth {self._planner.last_depth}, {(loop.time() - tick_start) * 1000:.1f}ms")
+
+        packets = []
+        for unit_id, action in joint_action.items():
+            if action is None:
+                continue
+            if action[0] == "move":
+                packets.append(
+                    {"type": "move", "move": action[1], "unit_id": unit_id})
+            elif action[0] == "bomb":
+                packets.append({"type": "bomb", "unit_id": unit_id})
+            elif action[0] == "detonate":
+                packets.append({"type": "detonate", "coordinates": [
+                               action[1], action[2]], "unit_id": unit_id})
+        dropped = await self._client.send_actions(packets)
+        for packet, reason in dropped:
+            print(f"dropped {packet}: {reason}")
 
 
 def main():
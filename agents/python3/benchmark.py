@@ -0,0 +1,340 @@
+from abc import ABC, abstractmethod
+from admin_state import AdminState
+from game_analytics import AnalyticsWriter
+from game_state import GameState
+from json_codec import StateEncoder, decode_packet, dumps, encode_evaluate_next_state
+from observation_encoder import ObservationEncoder, NUM_FEATURES, NUM_PLANES
+from typing import Callable, Dict, List, Optional, Tuple
+import copy
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+_directory = os.path.dirname(os.path.abspath(__file__))
+
+# endgame_state packets (as saved by the engine's SAVE_REPLAY_ENABLED) whose history is replayed,
+# the engine's replay runs well into the end-game fire phase
+replay_paths = (os.environ.get("BENCHMARK_REPLAYS") or ",".join([
+    os.path.join(_directory, "..", "replay.json"),
+    os.path.join(_directory, "..", "..", "engine", "bomberland-engine", "replay.json"),
+])).split(",")
+
+baseline_path = os.environ.get(
+    "BENCHMARK_BASELINE") or os.path.join(_directory, "benchmark_baseline.json")
+
+# BENCHMARK_SAVE_BASELINE=1 stores this run as the baseline instead of comparing against it
+save_baseline = os.environ.get("BENCHMARK_SAVE_BASELINE") == "1"
+
+repeat = int(os.environ.get("BENCHMARK_REPEAT") or 20)
+
+# a benchmark regressed when it is this much slower (or allocates this much more) than the baseline
+tolerance = float(os.environ.get("BENCHMARK_TOLERANCE") or 0.2)
+
+# comma separated benchmark names, default all
+selected_benchmarks = os.environ.get("BENCHMARKS")
+
+# the agent the observation is encoded for
+_agent_id = "a"
+
+
+class TickStream:
+    """
+    initial state and tick payloads of one recorded game, kept as the raw
+    packets a client would receive
+    """
+
+    def __init__(self, name: str, endgame_payload: Dict):
+        self.name = name
+        initial_state = dict(endgame_payload.get("initial_state"))
+        initial_state.setdefault(
+            "connection", {"id": 0, "role": "agent", "agent_id": _agent_id})
+        self.raw_game_state = dumps({"type": "game_state", "payload": initial_state})
+        history = endgame_payload.get("history")
+        self.raw_ticks = [dumps({"type": "tick", "payload": tick})
+                          for tick in history]
+
+    def __len__(self) -> int:
+        return len(self.raw_ticks)
+
+    def decode(self) -> Tuple[Dict, List[Dict]]:
+        return decode_packet(self.raw_game_state), [decode_packet(raw_tick) for raw_tick in self.raw_ticks]
+
+
+def load_tick_streams(paths: List[str]) -> List[TickStream]:
+    streams = []
+    for path in paths:
+        with open(path) as replay_file:
+            streams.append(TickStream(os.path.relpath(path, _directory),
+                                      json.load(replay_file).get("payload")))
+    return streams
+
+
+def _run_sync(coroutine):
+    # the clients' handlers only await the tick callback, none is set here
+    try:
+        coroutine.send(None)
+    except StopIteration:
+        return
+    coroutine.close()
+    raise RuntimeError("benchmarked handler awaited")
+
+
+class Benchmark(ABC):
+    """
+    `setup(stream)` prepares a fresh run over one stream (not measured),
+    `step(index)` handles tick `index` and is what gets measured
+    """
+    name = ""
+
+    def setup(self, stream: TickStream):
+        pass
+
+    @abstractmethod
+    def step(self, index: int):
+        pass
+
+
+class DecodeBenchmark(Benchmark):
+    name = "json_decode"
+
+    def setup(self, stream: TickStream):
+        self._raw_ticks = stream.raw_ticks
+
+    def step(self, index: int):
+        decode_packet(self._raw_ticks[index])
+
+
+class GameStateBenchmark(Benchmark):
+    name = "game_state_apply"
+
+    def _create_client(self):
+        return GameState("")
+
+    def setup(self, stream: TickStream):
+        # applying ticks mutates the packets, every run needs its own copy
+        game_state, self._ticks = stream.decode()
+        self._client = self._create_client()
+        _run_sync(self._client._on_data(game_state))
+
+    def step(self, index: int):
+        _run_sync(self._client._on_data(self._ticks[index]))
+
+
+class AdminStateBenchmark(GameStateBenchmark):
+    name = "admin_state_apply"
+
+    def __init__(self):
+        self._analytics_directory = tempfile.TemporaryDirectory()
+
+    def _create_client(self):
+        return AdminState("", analytics=AnalyticsWriter(self._analytics_directory.name))
+
+
+class ForwardModelEncodeBenchmark(Benchmark):
+    """
+    encodes an `evaluate_next_state` request for the state of every tick
+    with the actions the units took in the next one
+    """
+    name = "forward_model_encode"
+
+    def setup(self, stream: TickStream):
+        game_state, ticks = stream.decode()
+        client = GameState("")
+        _run_sync(client._on_data(game_state))
+        self._states = []
+        self._actions = []
+        for tick in ticks:
+            _run_sync(client._on_data(tick))
+            self._states.append(copy.deepcopy(client._state))
+        for tick in ticks[1:] + [{"payload": {"events": []}}]:
+            self._actions.append([{"agent_id": event.get("agent_id"), "action": event.get("data")}
+                                  for event in tick.get("payload").get("events") if event.get("type") == "unit"])
+        # the encoder ForwardModel uses for its requests
+        self._state_encoder = StateEncoder()
+
+    def step(self, index: int):
+        encode_evaluate_next_state(index, self._state_encoder.encode(
+            self._states[index]), self._actions[index])
+
+
+class ObservationBenchmark(Benchmark):
+    name = "observation_encode"
+
+    def setup(self, stream: TickStream):
+        game_state, ticks = stream.decode()
+        self._ticks = [tick.get("payload") for tick in ticks]
+        self._encoder = ObservationEncoder(_agent_id)
+        self._encoder.on_game_state(game_state.get("payload"))
+
+    def step(self, index: int):
+        tick = self._ticks[index]
+        tick_number = tick.get("tick")
+        encoder = self._encoder
+        for event in tick.get("events"):
+            encoder.on_event(tick_number, event)
+        encoder.get_inputs(tick_number)
+
+
+class InferenceBenchmark(Benchmark):
+    name = "cnn_inference"
+
+    def __init__(self):
+        # tensorflow is only needed for this benchmark
+        import create_cnn
+        self._create_cnn = create_cnn
+        self._policies = {}
+
+    def setup(self, stream: TickStream):
+        game_state, ticks = stream.decode()
+        state = game_state.get("payload")
+        world = state.get("world")
+        input_shape = (world.get("height"), world.get("width"), NUM_PLANES)
+        if input_shape not in self._policies:
+            model = self._create_cnn.create_cnn(
+                input_shape, NUM_FEATURES, 6, 64)
+            self._policies[input_shape] = self._create_cnn.create_policy_fn(
+                model, input_shape, NUM_FEATURES)
+        self._policy = self._policies[input_shape]
+        encoder = ObservationEncoder(_agent_id)
+        encoder.on_game_state(state)
+        self._inputs = []
+        for tick in ticks:
+            payload = tick.get("payload")
+            for event in payload.get("events"):
+                encoder.on_event(payload.get("tick"), event)
+            self._inputs.append([array.copy()
+                                for array in encoder.get_inputs(payload.get("tick"))])
+
+    def step(self, index: int):
+        actions, _ = self._policy(*self._inputs[index])
+        actions.numpy()
+
+
+benchmark_types = [DecodeBenchmark, GameStateBenchmark, AdminStateBenchmark, ForwardModelEncodeBenchmark,
+                   ObservationBenchmark, InferenceBenchmark]
+
+
+"""
+runs `benchmark` over every stream `repeat` times and returns the time
+per tick of the fastest run (like timeit, the others only add noise), plus the memory allocated per tick (peak traced memory
+above what was in use before the step, measured in a separate pass since
+tracing slows everything down)
+"""
+def measure(benchmark: Benchmark, streams: List[TickStream], repeat: int = 20) -> Dict:
+    ticks = sum(len(stream) for stream in streams)
+    durations = []
+    for _ in range(repeat):
+        elapsed = 0
+        for stream in streams:
+            benchmark.setup(stream)
+            step = benchmark.step
+            start = time.perf_counter_ns()
+            for index in range(len(stream)):
+                step(index)
+            elapsed += time.perf_counter_ns() - start
+        durations.append(elapsed / ticks)
+
+    allocated = 0
+    reset_peak = getattr(tracemalloc, "reset_peak", None)
+    for stream in streams:
+        benchmark.setup(stream)
+        tracemalloc.start()
+        try:
+            for index in range(len(stream)):
+                before = tracemalloc.get_traced_memory()[0]
+                if reset_peak is not None:
+                    reset_peak()
+                benchmark.step(index)
+                allocated += max(tracemalloc.get_traced_memory()[1] - before, 0)
+        finally:
+            tracemalloc.stop()
+
+    ns_per_tick = min(durations)
+    return {
+        "ticks": ticks,
+        "us_per_tick": ns_per_tick / 1000,
+        "ticks_per_second": 1e9 / ns_per_tick if ns_per_tick > 0 else float("inf"),
+        "bytes_per_tick": allocated / ticks,
+    }
+
+
+def run_benchmarks(streams: List[TickStream], repeat: int = 20, names: Optional[List[str]] = None,
+                   log: Callable[[str], None] = print) -> Dict[str, Dict]:
+    results = {}
+    for benchmark_type in benchmark_types:
+        if names is not None and benchmark_type.name not in names:
+            continue
+        try:
+            benchmark = benchmark_type()
+        except ImportError as e:
+            log(f"skipping {benchmark_type.name}: {e}")
+            continue
+        results[benchmark_type.name] = measure(benchmark, streams, repeat)
+    return results
+
+
+"""
+(name, metric, baseline, current) of every metric that got worse than
+the baseline by more than `tolerance`
+"""
+def find_regressions(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float = 0.2) -> List[Tuple[str, str, float, float]]:
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for metric in ("us_per_tick", "bytes_per_tick"):
+            if result[metric] > previous[metric] * (1 + tolerance) and result[metric] - previous[metric] > 1:
+                regressions.append(
+                    (name, metric, previous[metric], result[metric]))
+    return regressions
+
+
+def format_results(results: Dict[str, Dict], baseline: Optional[Dict[str, Dict]] = None) -> str:
+    lines = [f"{'benchmark':<22}{'ticks':>7}{'us/tick':>11}{'ticks/s':>11}{'bytes/tick':>12}{'vs baseline':>13}"]
+    for name, result in results.items():
+        previous = (baseline or {}).get(name)
+        change = f"{result['us_per_tick'] / previous['us_per_tick'] - 1:+.1%}" if previous else ""
+        lines.append(f"{name:<22}{result['ticks']:>7}{result['us_per_tick']:>11.2f}{result['ticks_per_second']:>11.0f}"
+                     f"{result['bytes_per_tick']:>12.0f}{change:>13}")
+    return "\n".join(lines)
+
+
+def main():
+    streams = load_tick_streams(replay_paths)
+    names = selected_benchmarks.split(",") if selected_benchmarks else None
+    print(f"replaying {sum(len(stream) for stream in streams)} ticks of {', '.join(stream.name for stream in streams)}, "
+          f"{repeat} runs")
+    results = run_benchmarks(streams, repeat, names)
+
+    if save_baseline:
+        with open(baseline_path, "w") as baseline_file:
+            json.dump({"replays": [stream.name for stream in streams],
+                      "results": results}, baseline_file, indent=2)
+        print(format_results(results))
+        print(f"baseline saved to {baseline_path}")
+        return
+
+    baseline = None
+    if os.path.exists(baseline_path):
+        with open(baseline_path) as baseline_file:
+            stored = json.load(baseline_file)
+        if stored.get("replays") != [stream.name for stream in streams]:
+            print(f"{baseline_path} was recorded on other replays, not comparing")
+        else:
+            baseline = stored.get("results")
+    print(format_results(results, baseline))
+    if baseline is None:
+        return
+    regressions = find_regressions(results, baseline, tolerance)
+    for name, metric, previous, current in regressions:
+        print(f"REGRESSION {name} {metric}: {previous:.2f} -> {current:.2f}")
+    if len(regressions) > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
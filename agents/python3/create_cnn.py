@@ -1,10 +1,7 @@
 import tensorflow as tf
 import os
 
-# TO DO:
-# Add value function estimation head of neural network, as used by the PPO algorithm
-
-def create_cnn(input_shape, num_channels, num_actions, hidden_units):
+def _create_trunk(input_shape, num_channels, hidden_units):
     # Define input layer for spatial data
     spatial_input = tf.keras.layers.Input(shape=input_shape, name='spatial_input')
 
@@ -26,6 +23,11 @@ def create_cnn(input_shape, num_channels, num_actions, hidden_units):
 
     # Add fully connected layers for further processing
     x = tf.keras.layers.Dense(hidden_units, activation='relu', kernel_initializer='he_normal')(merged_input)
+    return spatial_input, non_spatial_input, x
+
+
+def create_cnn(input_shape, num_channels, num_actions, hidden_units):
+    spatial_input, non_spatial_input, x = _create_trunk(input_shape, num_channels, hidden_units)
     x = tf.keras.layers.Dropout(0.5)(x)
     x = tf.keras.layers.Dense(hidden_units, activation='relu', kernel_initializer='he_normal')(x)
 
@@ -39,6 +41,41 @@ def create_cnn(input_shape, num_channels, num_actions, hidden_units):
     return model
 
 
+# Actor-critic variant for PPO (see ppo.py): the same trunk feeds a policy head of action logits and a
+# value head. There is no dropout, it would make the probability ratio of the clipped objective noisy,
+# and the model is not compiled since ppo.py runs its own training step.
+def create_actor_critic(input_shape, num_channels, num_actions, hidden_units):
+    spatial_input, non_spatial_input, x = _create_trunk(input_shape, num_channels, hidden_units)
+    x = tf.keras.layers.Dense(hidden_units, activation='relu', kernel_initializer='he_normal')(x)
+    policy_logits = tf.keras.layers.Dense(num_actions, name='policy_logits')(x)
+    value = tf.keras.layers.Dense(1, name='value')(x)
+    return tf.keras.Model(inputs=[spatial_input, non_spatial_input], outputs=[policy_logits, value])
+
+
+# Build a compiled decision function that evaluates all units of an agent in one forward pass.
+# The units share the spatial observation, which is broadcast to one row per unit inside the graph.
+# The input signature is fixed (only the number of units is left open) so the function is traced
+# once, by the warm-up call below, and never retraced mid-game.
+def create_policy_fn(model, input_shape, num_channels, greedy=True):
+    @tf.function(input_signature=[
+        tf.TensorSpec(shape=(1, *input_shape), dtype=tf.float32),
+        tf.TensorSpec(shape=(None, num_channels), dtype=tf.float32),
+    ])
+    def policy_fn(spatial_data, non_spatial_data):
+        num_units = tf.shape(non_spatial_data)[0]
+        spatial_batch = tf.repeat(spatial_data, num_units, axis=0)
+        probabilities = model([spatial_batch, non_spatial_data], training=False)
+        if greedy:
+            actions = tf.argmax(probabilities, axis=-1, output_type=tf.int32)
+        else:
+            actions = tf.random.categorical(tf.math.log(probabilities), 1, dtype=tf.int32)[:, 0]
+        return actions, probabilities
+
+    # Warm up (trace) before the first tick
+    policy_fn(tf.zeros((1, *input_shape), dtype=tf.float32), tf.zeros((1, num_channels), dtype=tf.float32))
+    return policy_fn
+
+
 # # Example usage:
 # # Specify the input shape, number of channels, and other parameters
 # input_shape = (15, 15, 1)
@@ -0,0 +1,196 @@
+import heapq
+import math
+from typing import Dict, List, Tuple
+import numpy as np
+
+# explosion tick of cells no bomb or blast reaches
+NO_DANGER = np.iinfo(np.int32).max
+
+NO_OWNER = -1
+
+_directions = ((0, 1), (0, -1), (-1, 0), (1, 0))
+
+
+class DangerMap:
+    """
+    For every cell the earliest tick a blast covers it, given the bombs and
+    blasts on the map (register it with `GameState.add_state_listener` or use
+    `GameState.enable_danger_map()`):
+
+    - `explosion_tick`: (height, width) int32, NO_DANGER where nothing
+      reaches, the tick a blast started for cells that are burning now
+    - `owner`: (height, width) int8 index into `agent_ids` of the agent whose
+      bomb gets there first, NO_OWNER for fire without an owner
+
+    Blasts follow the engine: they reach ceil((blast_diameter - 1) / 2)
+    cells in each direction and stop at the first entity that is not a
+    blast, and a bomb in a blast explodes in the same tick (chain
+    reactions). Bombs detonated early show up as expired bombs and new
+    blasts, so the map only assumes bombs run out their fuse.
+
+    Events only recompute the blast footprints of bombs in the row or
+    column of the changed cell; chains and the arrays are rebuilt with
+    numpy on the first read after a change.
+    """
+
+    def __init__(self):
+        self.width = 0
+        self.height = 0
+        self.agent_ids: List[str] = []
+        self._agent_indexes: Dict[str, int] = {}
+        # cells holding an entity a blast stops at
+        self._stops = np.zeros((0, 0), dtype=np.bool_)
+        self._bombs: Dict[Tuple[int, int], Dict] = {}
+        self._footprints: Dict[Tuple[int, int], np.ndarray] = {}
+        self._blasts: Dict[Tuple[int, int], Dict] = {}
+        self._explosion_tick = np.zeros((0, 0), dtype=np.int32)
+        self._owner = np.zeros((0, 0), dtype=np.int8)
+        self._bomb_ticks: Dict[Tuple[int, int], int] = {}
+        self._dirty = False
+
+    @property
+    def explosion_tick(self) -> np.ndarray:
+        if self._dirty:
+            self._rebuild()
+        return self._explosion_tick
+
+    @property
+    def owner(self) -> np.ndarray:
+        if self._dirty:
+            self._rebuild()
+        return self._owner
+
+    """
+    ticks until a blast covers each cell (0 for burning cells), NO_DANGER
+    where nothing reaches
+    """
+    def get_time_to_explosion(self, tick_number: int) -> np.ndarray:
+        explosion_tick = self.explosion_tick
+        return np.where(explosion_tick == NO_DANGER, NO_DANGER, np.maximum(explosion_tick - tick_number, 0))
+
+    """
+    tick each bomb explodes at, chain reactions included
+    """
+    def get_bomb_explosion_ticks(self) -> Dict[Tuple[int, int], int]:
+        if self._dirty:
+            self._rebuild()
+        return dict(self._bomb_ticks)
+
+    def on_game_state(self, game_state: Dict):
+        self.width = game_state.get("world").get("width")
+        self.height = game_state.get("world").get("height")
+        self.agent_ids = list(game_state.get("agents").keys())
+        self._agent_indexes = {agent_id: index for index,
+                               agent_id in enumerate(self.agent_ids)}
+        self._stops = np.zeros((self.height, self.width), dtype=np.bool_)
+        self._bombs = {}
+        self._footprints = {}
+        self._blasts = {}
+        for entity in game_state.get("entities"):
+            self._add_entity(entity)
+        for cell in self._bombs:
+            self._footprints[cell] = self._get_footprint(cell)
+        self._dirty = True
+
+    def on_event(self, tick_number: int, event: Dict):
+        event_type = event.get("type")
+        if event_type == "entity_spawned":
+            entity = event.get("data")
+            self._add_entity(entity)
+            self._on_cell_changed(entity.get("x"), entity.get("y"))
+        elif event_type == "entity_expired":
+            [x, y] = event.get("data")
+            self._remove_entities(x, y)
+            self._on_cell_changed(x, y)
+        elif event_type == "entity_state":
+            [x, y] = event.get("coordinates")
+            self._remove_entities(x, y)
+            self._add_entity(event.get("updated_entity"))
+            self._on_cell_changed(x, y)
+
+    def _add_entity(self, entity: Dict):
+        cell = (entity.get("x"), entity.get("y"))
+        entity_type = entity.get("type")
+        if entity_type == "x":
+            self._blasts[cell] = entity
+            return
+        self._stops[cell[1], cell[0]] = True
+        if entity_type == "b":
+            self._bombs[cell] = entity
+
+    def _remove_entities(self, x: int, y: int):
+        self._stops[y, x] = False
+        self._bombs.pop((x, y), None)
+        self._footprints.pop((x, y), None)
+        self._blasts.pop((x, y), None)
+
+    def _on_cell_changed(self, x: int, y: int):
+        # a changed cell can only lengthen or shorten the rays of bombs in its row or column
+        for cell in self._bombs:
+            if cell[0] == x or cell[1] == y:
+                self._footprints[cell] = self._get_footprint(cell)
+        self._dirty = True
+
+    """
+    flat indices of the cells the blast of the bomb at `cell` covers
+    """
+    def _get_footprint(self, cell: Tuple[int, int]) -> np.ndarray:
+        x, y = cell
+        steps = math.ceil((self._bombs[cell].get("blast_diameter") - 1) / 2)
+        width = self.width
+        cells = [np.array([y * width + x])]
+        for dx, dy in _directions:
+            if dx == 0:
+                ray = np.arange(y + dy, y + dy * (steps + 1), dy)
+                ray = ray[(ray >= 0) & (ray < self.height)]
+                stops = self._stops[ray, x]
+                ray = ray * width + x
+            else:
+                ray = np.arange(x + dx, x + dx * (steps + 1), dx)
+                ray = ray[(ray >= 0) & (ray < width)]
+                stops = self._stops[y, ray]
+                ray = y * width + ray
+            if stops.any():
+                ray = ray[:int(np.argmax(stops)) + 1]
+            cells.append(ray)
+        return np.concatenate(cells)
+
+    def _rebuild(self):
+        width = self.width
+        explosion_tick = np.full((self.height, self.width),
+                                 NO_DANGER, dtype=np.int32)
+        owner = np.full((self.height, self.width), NO_OWNER, dtype=np.int8)
+        flat_tick = explosion_tick.reshape(-1)
+        flat_owner = owner.reshape(-1)
+        for (x, y), blast in self._blasts.items():
+            flat_tick[y * width + x] = blast.get("created", 0)
+            flat_owner[y * width + x] = self._agent_indexes.get(
+                blast.get("agent_id"), NO_OWNER)
+
+        # chain reactions: bombs explode in tick order, each one sets off the bombs in its footprint
+        bomb_cells = {y * width + x: (x, y) for x, y in self._bombs}
+        bomb_ticks = {cell: bomb.get("expires", NO_DANGER)
+                      for cell, bomb in self._bombs.items()}
+        queue = [(tick, cell) for cell, tick in bomb_ticks.items()]
+        heapq.heapify(queue)
+        done = set()
+        while queue:
+            tick, cell = heapq.heappop(queue)
+            if cell in done:
+                continue
+            done.add(cell)
+            footprint = self._footprints[cell]
+            for hit in footprint[1:]:
+                other = bomb_cells.get(int(hit))
+                if other is not None and other not in done and tick < bomb_ticks[other]:
+                    bomb_ticks[other] = tick
+                    heapq.heappush(queue, (tick, other))
+            earlier = flat_tick[footprint] > tick
+            flat_tick[footprint[earlier]] = tick
+            flat_owner[footprint[earlier]] = self._agent_indexes.get(
+                self._bombs[cell].get("agent_id"), NO_OWNER)
+
+        self._explosion_tick = explosion_tick
+        self._owner = owner
+        self._bomb_ticks = bomb_ticks
+        self._dirty = False
@@ -6,6 +6,9 @@ import time
 
 fwd_model_uri = os.environ.get(
     "FWD_MODEL_CONNECTION_STRING") or "ws://127.0.0.1:6969/?role=admin"
+# set FWD_MODEL_IN_PROCESS=1 to step the gym without an engine
+if os.environ.get("FWD_MODEL_IN_PROCESS") == "1":
+    fwd_model_uri = None
 
 mock_6x6_state: Dict = {
   "game_id": "dev",
@@ -0,0 +1,137 @@
+from typing import Dict, List, Optional
+import numpy as np
+
+# distance between cells that are not connected (or to a blocked cell)
+UNREACHABLE = 1 << 29
+
+# entities units cannot walk through that never move, only wood and ore get destroyed
+_block_types = set(("m", "w", "o"))
+
+_moves = [("up", 0, 1), ("down", 0, -1), ("left", -1, 0), ("right", 1, 0)]
+
+
+class DistanceField:
+    """
+    All-pairs shortest path distances between the cells of the map, walking
+    around metal, wood and ore blocks (bombs and units are not obstacles,
+    they come and go every few ticks). Register it with
+    `GameState.add_state_listener` or use `GameState.enable_distances()`.
+
+    The full table is computed once per game with a breadth-first search
+    from every cell at the same time, vectorized over the map. Blocks are
+    only ever destroyed, so when one expires the table is updated in place:
+    a path through the opened cell c is d(s, c) + d(c, t), which is one
+    O(cells^2) numpy minimum instead of a new search. `distance`,
+    `next_step` and `distances_from` are then O(1) lookups.
+    """
+
+    def __init__(self):
+        self.width = 0
+        self.height = 0
+        self.blocked = np.zeros((0, 0), dtype=np.bool_)
+        self._distances = np.zeros((0, 0), dtype=np.int32)
+
+    def on_game_state(self, game_state: Dict):
+        self.width = game_state.get("world").get("width")
+        self.height = game_state.get("world").get("height")
+        blocked = np.zeros((self.height, self.width), dtype=np.bool_)
+        for entity in game_state.get("entities"):
+            if entity.get("type") in _block_types:
+                blocked[entity.get("y"), entity.get("x")] = True
+        # the game_state resent after a reconnect has the blocks the table was kept up to date with
+        if np.array_equal(blocked, self.blocked):
+            return
+        self.blocked = blocked
+        self._compute_all_pairs()
+
+    def on_event(self, tick_number: int, event: Dict):
+        event_type = event.get("type")
+        if event_type == "entity_expired":
+            [x, y] = event.get("data")
+            if self.blocked[y, x]:
+                self._open_cell(x, y)
+        elif event_type == "entity_spawned":
+            entity = event.get("data")
+            x, y = entity.get("x"), entity.get("y")
+            # the engine does not place blocks during a game, distances could only grow so start over
+            if entity.get("type") in _block_types and not self.blocked[y, x]:
+                self.blocked[y, x] = True
+                self._compute_all_pairs()
+
+    """
+    number of moves from (from_x, from_y) to (to_x, to_y), None if there is
+    no path
+    """
+    def distance(self, from_x: int, from_y: int, to_x: int, to_y: int) -> Optional[int]:
+        distance = self._distances[from_y * self.width + from_x, to_y * self.width + to_x]
+        return None if distance == UNREACHABLE else int(distance)
+
+    """
+    first move ("up", "down", "left" or "right") of a shortest path, None if
+    there is no path or both cells are the same
+    """
+    def next_step(self, from_x: int, from_y: int, to_x: int, to_y: int) -> Optional[str]:
+        width = self.width
+        target = to_y * width + to_x
+        distance = self._distances[from_y * width + from_x, target]
+        if distance == UNREACHABLE or distance == 0:
+            return None
+        for move, dx, dy in _moves:
+            x, y = from_x + dx, from_y + dy
+            if 0 <= x < width and 0 <= y < self.height and self._distances[y * width + x, target] == distance - 1:
+                return move
+        return None
+
+    """
+    (height, width) view of the distances from (x, y) to every cell,
+    UNREACHABLE where there is no path. Valid until the next update
+    """
+    def distances_from(self, x: int, y: int) -> np.ndarray:
+        return self._distances[y * self.width + x].reshape(self.height, self.width)
+
+    def _compute_all_pairs(self):
+        height, width = self.height, self.width
+        cells = height * width
+        passable = ~self.blocked
+        distances = np.full((cells, height, width),
+                            UNREACHABLE, dtype=np.int32)
+        # frontier[s] is the set of cells at the current distance from cell s
+        frontier = np.zeros((cells, height, width), dtype=np.bool_)
+        sources = np.flatnonzero(passable)
+        frontier.reshape(cells, cells)[sources, sources] = True
+        visited = frontier.copy()
+        distance = 0
+        while frontier.any():
+            distances[frontier] = distance
+            expanded = np.zeros_like(frontier)
+            expanded[:, 1:, :] |= frontier[:, :-1, :]
+            expanded[:, :-1, :] |= frontier[:, 1:, :]
+            expanded[:, :, 1:] |= frontier[:, :, :-1]
+            expanded[:, :, :-1] |= frontier[:, :, 1:]
+            expanded &= passable
+            expanded &= ~visited
+            visited |= expanded
+            frontier = expanded
+            distance += 1
+        self._distances = distances.reshape(cells, cells)
+
+    def _open_cell(self, x: int, y: int):
+        self.blocked[y, x] = False
+        distances = self._distances
+        cell = y * self.width + x
+        neighbours = self._get_open_neighbours(x, y)
+        if len(neighbours) == 0:
+            distances[cell, cell] = 0
+            return
+        # distance from every cell to the opened one, then every pair may take a shortcut through it
+        through = np.minimum(distances[neighbours].min(axis=0) + 1, UNREACHABLE)
+        through[cell] = 0
+        np.minimum(distances, through[:, None] + through[None, :], out=distances)
+
+    def _get_open_neighbours(self, x: int, y: int) -> List[int]:
+        neighbours = []
+        for _, dx, dy in _moves:
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < self.width and 0 <= ny < self.height and not self.blocked[ny, nx]:
+                neighbours.append(ny * self.width + nx)
+        return neighbours
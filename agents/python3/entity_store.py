@@ -0,0 +1,93 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class EntityStore:
+    """
+    Entities indexed by (x, y) with secondary indexes per entity type,
+    bombs per unit_id and blasts per expiry tick.
+
+    Every event touches only the indexes of the affected cell, so
+    spawn / expire / state updates are O(1). `entities` is a list view in
+    the same order the engine would have produced (insertion order, updated
+    entities moved to the back) and is only rebuilt when something changed.
+    """
+
+    def __init__(self, entities: Optional[Iterable[Dict]] = None):
+        self._next_key = 0
+        self._ordered: Dict[int, Dict] = {}
+        self._cells: Dict[Tuple[int, int], Dict[int, Dict]] = {}
+        self._by_type: Dict[str, Dict[int, Dict]] = {}
+        self._bombs_by_unit: Dict[str, Dict[int, Dict]] = {}
+        self._blasts_by_expiry: Dict[int, Dict[int, Dict]] = {}
+        self._view: Optional[List[Dict]] = None
+        for entity in entities or []:
+            self.add(entity)
+
+    def __len__(self) -> int:
+        return len(self._ordered)
+
+    @property
+    def entities(self) -> List[Dict]:
+        if self._view is None:
+            self._view = list(self._ordered.values())
+        return self._view
+
+    def add(self, entity: Dict):
+        key = self._next_key
+        self._next_key += 1
+        self._ordered[key] = entity
+        self._cells.setdefault((entity.get("x"), entity.get("y")), {})[key] = entity
+        entity_type = entity.get("type")
+        self._by_type.setdefault(entity_type, {})[key] = entity
+        if entity_type == "b":
+            self._bombs_by_unit.setdefault(
+                entity.get("unit_id"), {})[key] = entity
+        elif entity_type == "x":
+            self._blasts_by_expiry.setdefault(
+                entity.get("expires"), {})[key] = entity
+        self._view = None
+
+    def remove_at(self, x: int, y: int) -> List[Dict]:
+        cell = self._cells.pop((x, y), None)
+        if cell is None:
+            return []
+        for key, entity in cell.items():
+            del self._ordered[key]
+            entity_type = entity.get("type")
+            _discard(self._by_type, entity_type, key)
+            if entity_type == "b":
+                _discard(self._bombs_by_unit, entity.get("unit_id"), key)
+            elif entity_type == "x":
+                _discard(self._blasts_by_expiry, entity.get("expires"), key)
+        self._view = None
+        return list(cell.values())
+
+    def replace_at(self, x: int, y: int, entity: Dict):
+        self.remove_at(x, y)
+        self.add(entity)
+
+    def get_at(self, x: int, y: int) -> List[Dict]:
+        cell = self._cells.get((x, y))
+        return list(cell.values()) if cell else []
+
+    def is_occupied(self, x: int, y: int) -> bool:
+        return (x, y) in self._cells
+
+    def get_by_type(self, entity_type: str) -> List[Dict]:
+        return list(self._by_type.get(entity_type, {}).values())
+
+    # bombs are returned in the order they were placed
+    def get_bombs(self, unit_id: str) -> List[Dict]:
+        return list(self._bombs_by_unit.get(unit_id, {}).values())
+
+    def get_blasts_expiring(self, tick: int) -> List[Dict]:
+        return list(self._blasts_by_expiry.get(tick, {}).values())
+
+
+def _discard(index: Dict, index_key, key: int):
+    bucket = index.get(index_key)
+    if bucket is None:
+        return
+    bucket.pop(key, None)
+    if not bucket:
+        del index[index_key]
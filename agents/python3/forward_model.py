@@ -1,13 +1,25 @@
-from typing import Dict, List
+import asyncio
+from typing import Dict, List, Optional
 import websockets
-import json
+from json_codec import StateEncoder, decode_packet, encode_evaluate_next_state
 
 
 class ForwardModel:
-    def __init__(self, connection_string: str):
+    """
+    `max_in_flight` caps how many `evaluate_next_state` requests can wait for
+    a reply at once, further requests wait for a free slot. `timeout` is the
+    default number of seconds to wait for a reply (None waits forever).
+    """
+    def __init__(self, connection_string: str, max_in_flight: int = 256, timeout: Optional[float] = None):
         self._connection_string = connection_string
         self._next_state_callback = None
         self.connection = None
+        self._max_in_flight = max_in_flight
+        self._timeout = timeout
+        self._in_flight: Optional[asyncio.Semaphore] = None
+        self._next_sequence_id = 0
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._state_encoder = StateEncoder()
 
     async def close(self):
         if self.connection is not None:
@@ -25,10 +37,11 @@ class ForwardModel:
         while True:
             try:
                 raw_data = await connection.recv()
-                data = json.loads(raw_data)
+                data = decode_packet(raw_data)
                 await self._on_data(data)
-            except websockets.exceptions.ConnectionClosed:
+            except websockets.exceptions.ConnectionClosed as e:
                 print('Connection with server closed')
+                self._fail_pending(e)
                 break
 
     async def _on_data(self, data):
@@ -47,9 +60,40 @@ class ForwardModel:
             print(f"unknown packet \"{data_type}\": {data}")
 
     async def _on_next_state(self, payload):
+        future = self._pending.pop(payload.get("sequence_id"), None)
+        if future is not None and not future.done():
+            future.set_result(payload)
         if self._next_state_callback != None:
             await self._next_state_callback(payload)
 
+    def _fail_pending(self, error: Exception):
+        pending = self._pending
+        self._pending = {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(error)
+
+    """
+    sends an `evaluate_next_state` request with a unique `sequence_id` and
+    returns its payload ({next_state, is_complete, tick_result, sequence_id})
+    once the reply arrives. Many requests can be in flight at once, raises
+    asyncio.TimeoutError if no reply arrives within `timeout` seconds
+    """
+    async def evaluate_next_state(self, game_state: Dict, actions: List[Dict], timeout: Optional[float] = None) -> Dict:
+        if self._in_flight is None:
+            self._in_flight = asyncio.Semaphore(self._max_in_flight)
+        timeout = self._timeout if timeout is None else timeout
+        async with self._in_flight:
+            sequence_id = self._next_sequence_id
+            self._next_sequence_id += 1
+            future = asyncio.get_event_loop().create_future()
+            self._pending[sequence_id] = future
+            try:
+                await self.send_next_state(sequence_id, game_state, actions)
+                return await asyncio.wait_for(future, timeout)
+            finally:
+                self._pending.pop(sequence_id, None)
+
     """
     sample moves payload:
     [
@@ -68,7 +112,5 @@ class ForwardModel:
     It should ideally be unique
     """
     async def send_next_state(self, sequence_id: int, game_state: Dict, actions: List[Dict]):
-        game_state.pop("connection", None)
-        packet = {"actions": actions,
-                  "type": "evaluate_next_state", "state": game_state, "sequence_id": sequence_id}
-        await self.connection.send(json.dumps(packet))
+        encoded_state = self._state_encoder.encode(game_state)
+        await self.connection.send(encode_evaluate_next_state(sequence_id, encoded_state, actions))
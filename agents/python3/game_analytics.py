@@ -0,0 +1,196 @@
+import glob
+import os
+from typing import Dict, List, Optional
+import numpy as np
+
+_unit_columns = ["game", "unit_id", "agent_id", "initial_hp", "final_hp", "damage_taken", "damage_dealt",
+                 "kills", "deaths", "bombs_placed", "detonations", "moves", "initial_x", "initial_y", "final_x", "final_y"]
+_team_columns = ["game", "agent_id", "won", "damage_taken",
+                 "damage_dealt", "kills", "bombs_placed", "detonations", "moves"]
+_damage_columns = ["game", "tick", "unit_id", "attacker_unit_id", "hp"]
+_game_columns = ["game", "game_id", "winner",
+                 "total_ticks", "world_seed", "prng_seed"]
+_string_columns = set(
+    ("unit_id", "agent_id", "attacker_unit_id", "game_id", "winner"))
+_move_deltas = {"up": (0, 1), "down": (0, -1),
+                "left": (-1, 0), "right": (1, 0)}
+
+
+def analyze_endgame(payload: Dict, game: int = 0, world_seed: int = -1, prng_seed: int = -1) -> Dict[str, Dict[str, list]]:
+    """
+    Computes every metric of one `endgame_state` payload in a single pass over
+    its history. Returns one table per level ("units", "teams", "damage",
+    "games"), each a dict of equally long column lists.
+
+    Damage is attributed to the owner of the blast that covers the unit's cell
+    at the end of the tick; end-game fire has no owner (attacker "").
+    The payload does not carry the seeds, -1 marks them as unknown.
+    """
+    initial_state = payload.get("initial_state")
+    units: Dict[str, Dict] = {}
+    for unit_id, unit_state in initial_state.get("unit_state").items():
+        x, y = unit_state.get("coordinates")
+        units[unit_id] = {"agent_id": unit_state.get("agent_id"), "initial_hp": unit_state.get("hp"), "hp": unit_state.get("hp"),
+                          "damage_taken": 0, "damage_dealt": 0, "kills": 0, "deaths": 0, "bombs_placed": 0, "detonations": 0,
+                          "moves": 0, "initial_x": x, "initial_y": y, "x": x, "y": y}
+    blast_owners: Dict[tuple, str] = {}
+    for entity in initial_state.get("entities"):
+        if entity.get("type") == "x":
+            blast_owners[(entity.get("x"), entity.get("y"))] = entity.get(
+                "unit_id") or ""
+    damage: Dict[str, list] = {column: [] for column in _damage_columns}
+
+    last_tick = initial_state.get("tick")
+    for game_tick in payload.get("history"):
+        tick = game_tick.get("tick")
+        last_tick = tick
+        damaged = []
+        for event in game_tick.get("events"):
+            event_type = event.get("type")
+            if event_type == "unit_state":
+                data = event.get("data")
+                unit = units[data.get("unit_id")]
+                hp = data.get("hp")
+                # dead units keep taking damage from end-game fire, that does not count
+                if hp < unit["hp"] and unit["hp"] > 0:
+                    unit["damage_taken"] += unit["hp"] - max(hp, 0)
+                    damaged.append((data.get("unit_id"), unit["hp"], hp))
+                unit["hp"] = hp
+                unit["x"], unit["y"] = data.get("coordinates")
+            elif event_type == "unit":
+                data = event.get("data")
+                unit = units[data.get("unit_id")]
+                action_type = data.get("type")
+                if action_type == "move":
+                    unit["moves"] += 1
+                    dx, dy = _move_deltas.get(data.get("move"), (0, 0))
+                    unit["x"] += dx
+                    unit["y"] += dy
+                elif action_type == "bomb":
+                    unit["bombs_placed"] += 1
+                elif action_type == "detonate":
+                    unit["detonations"] += 1
+            elif event_type == "entity_spawned":
+                entity = event.get("data")
+                if entity.get("type") == "x":
+                    blast_owners[(entity.get("x"), entity.get("y"))] = entity.get(
+                        "unit_id") or ""
+            elif event_type == "entity_expired":
+                blast_owners.pop(tuple(event.get("data")), None)
+
+        # a unit is hit before the blast is placed on its cell, so attribute
+        # the tick's damage once all of its events are applied
+        for unit_id, hp_before, hp in damaged:
+            unit = units[unit_id]
+            attacker_id = blast_owners.get((unit["x"], unit["y"]), "")
+            attacker = units.get(attacker_id)
+            if attacker is not None and attacker["agent_id"] != unit["agent_id"]:
+                attacker["damage_dealt"] += hp_before - max(hp, 0)
+                if hp <= 0:
+                    attacker["kills"] += 1
+            if hp <= 0:
+                unit["deaths"] += 1
+            damage["game"].append(game)
+            damage["tick"].append(tick)
+            damage["unit_id"].append(unit_id)
+            damage["attacker_unit_id"].append(attacker_id)
+            damage["hp"].append(hp)
+
+    winner = payload.get("winning_agent_id") or ""
+    unit_table: Dict[str, list] = {column: [] for column in _unit_columns}
+    team_rows: Dict[str, Dict] = {}
+    for unit_id, unit in units.items():
+        values = {**unit, "game": game, "unit_id": unit_id,
+                  "final_hp": unit["hp"], "final_x": unit["x"], "final_y": unit["y"]}
+        for column in _unit_columns:
+            unit_table[column].append(values[column])
+        team = team_rows.setdefault(unit["agent_id"], {column: 0 for column in _team_columns})
+        for column in ["damage_taken", "damage_dealt", "kills", "bombs_placed", "detonations", "moves"]:
+            team[column] += unit[column]
+    team_table: Dict[str, list] = {column: [] for column in _team_columns}
+    for agent_id, team in team_rows.items():
+        team.update(game=game, agent_id=agent_id, won=agent_id == winner)
+        for column in _team_columns:
+            team_table[column].append(team[column])
+
+    games = {"game": [game], "game_id": [initial_state.get("game_id") or ""],
+             "winner": [winner], "total_ticks": [last_tick], "world_seed": [world_seed], "prng_seed": [prng_seed]}
+    return {"units": unit_table, "teams": team_table, "damage": damage, "games": games}
+
+
+class AnalyticsWriter:
+    """
+    Appends analyzed games to `directory` as numbered `.npz` shards of
+    `games_per_shard` games each. Every table column is stored as one array
+    named `<table>.<column>` (e.g. `units.damage_dealt`), so `load_analytics`
+    can read thousands of games back as a handful of arrays.
+    """
+
+    def __init__(self, directory: str, games_per_shard: int = 100):
+        self._directory = directory
+        self._games_per_shard = games_per_shard
+        self._buffer: Dict[str, Dict[str, list]] = {}
+        self._buffered_games = 0
+        os.makedirs(directory, exist_ok=True)
+        existing_games = load_analytics(directory, "games").get("games.game")
+        self._next_game = int(existing_games.max()) + \
+            1 if existing_games is not None and len(existing_games) > 0 else 0
+        self._next_shard = len(_get_shard_paths(directory))
+
+    """
+    analyzes an endgame_state payload, buffers its rows and writes a shard
+    once `games_per_shard` games are buffered. Returns the analyzed tables
+    """
+    def add_game(self, payload: Dict, world_seed: int = -1, prng_seed: int = -1) -> Dict[str, Dict[str, list]]:
+        tables = analyze_endgame(
+            payload, self._next_game, world_seed, prng_seed)
+        self._next_game += 1
+        for table_name, table in tables.items():
+            buffered = self._buffer.setdefault(table_name, {})
+            for column, values in table.items():
+                buffered.setdefault(column, []).extend(values)
+        self._buffered_games += 1
+        if self._buffered_games >= self._games_per_shard:
+            self.flush()
+        return tables
+
+    def flush(self):
+        if self._buffered_games == 0:
+            return
+        arrays = {f"{table_name}.{column}": _to_array(column, values)
+                  for table_name, table in self._buffer.items() for column, values in table.items()}
+        path = os.path.join(self._directory,
+                            f"games_{self._next_shard:05d}.npz")
+        np.savez_compressed(path, **arrays)
+        self._next_shard += 1
+        self._buffer = {}
+        self._buffered_games = 0
+
+    def close(self):
+        self.flush()
+
+
+def _to_array(column: str, values: list) -> np.ndarray:
+    if column in _string_columns:
+        return np.asarray(values, dtype=str)
+    if column == "won":
+        return np.asarray(values, dtype=bool)
+    return np.asarray(values, dtype=np.int64)
+
+
+def _get_shard_paths(directory: str) -> List[str]:
+    return sorted(glob.glob(os.path.join(directory, "games_*.npz")))
+
+
+def load_analytics(directory: str, table: Optional[str] = None) -> Dict[str, np.ndarray]:
+    """
+    reads every shard in `directory` and concatenates each column, optionally
+    only the columns of one table ("units", "teams", "damage" or "games")
+    """
+    columns: Dict[str, List[np.ndarray]] = {}
+    for path in _get_shard_paths(directory):
+        with np.load(path) as shard:
+            for name in shard.files:
+                if table is None or name.startswith(f"{table}."):
+                    columns.setdefault(name, []).append(shard[name])
+    return {name: np.concatenate(arrays) for name, arrays in columns.items()}
@@ -1,54 +1,416 @@
 import asyncio
-from typing import Union
+import os
+import reconnect
+import time
+from typing import Dict, List, Optional, Tuple, Union
 import websockets
-import json
 
 from websockets.client import WebSocketClientProtocol
+from websockets.frames import OP_TEXT
+from danger_map import DangerMap
+from distance_field import DistanceField
+from entity_store import EntityStore
+from json_codec import decode_packet, dumps, encode_bomb, encode_detonate, encode_move, loads
+from state_snapshot import SnapshotHistory
+from tick_timing import TickTimings
 
 _move_set = set(("up", "down", "left", "right"))
+_action_types = set(("move", "bomb", "detonate"))
+
+
+def _get_decision_error(decision: Optional[asyncio.Future]) -> Optional[BaseException]:
+    if decision is None or not decision.done() or decision.cancelled():
+        return None
+    return decision.exception()
+
+
+def _raise_decision_error(decision: Optional[asyncio.Future]):
+    # errors of the tick callback would otherwise stay in a task nothing awaits
+    error = _get_decision_error(decision)
+    if error is not None:
+        raise error
 
 
 class GameState:
     def __init__(self, connection_string: str):
         self._connection_string = connection_string
         self._state = None
+        self.entity_store = EntityStore()
         self._tick_callback = None
+        self._fallback_callback = None
+        # fraction of the tick period the callback may take in deadline mode, None = sequential mode
+        self._deadline_budget: Optional[float] = None
+        self.stale_ticks_skipped = 0
+        self.deadline_fallbacks = 0
+        self._callback_task: Optional[asyncio.Future] = None
+        self._state_listeners = []
+        self.connection: Optional[WebSocketClientProtocol] = None
+        self._backoff = reconnect.Backoff()
+        self._reconnect_callback = None
+        self.reconnects = 0
+        self.game_states_received = 0
+        self.games_finished = 0
+        # actions the callback sent while the connection was down, since the last reconnect
+        self.unsent_actions: List[Dict] = []
+        self.unsent_action_count = 0
+        self.timings: Optional[TickTimings] = None
+        self.snapshots: Optional[SnapshotHistory] = None
+        self.distances: Optional[DistanceField] = None
+        self.danger: Optional[DangerMap] = None
+        if os.environ.get("TICK_TIMING") == "1":
+            self.enable_timing()
 
     def set_game_tick_callback(self, generate_agent_action_callback):
         self._tick_callback = generate_agent_action_callback
 
+    """
+    In deadline mode packets are read by a separate task and the tick
+    callback runs as a task that is cancelled once `budget` of the tick
+    period has passed since its tick arrived; `fallback_callback(tick_number,
+    game_state)` is then awaited to send a fallback (or best-so-far) action.
+    All packets that arrived while the agent was busy are applied before the
+    next decision, only the newest tick gets one: stale ticks are skipped
+    and a decision still running when a newer tick arrives is cancelled
+    without a fallback. Counted in `stale_ticks_skipped` and
+    `deadline_fallbacks`.
+    """
+    def enable_deadline_mode(self, budget: float = 0.8, fallback_callback=None):
+        self._deadline_budget = budget
+        self._fallback_callback = fallback_callback
+
+    """
+    `reconnect_callback(outage_seconds, unsent_actions)` is awaited after
+    `run` reconnected a dropped connection, before the fresh game_state
+    is handled. `unsent_actions` are {"tick", "action", "reason"} of every
+    action sent while the connection was down
+    """
+    def set_reconnect_callback(self, reconnect_callback):
+        self._reconnect_callback = reconnect_callback
+
+    """
+    A state listener is notified with `on_game_state(game_state)` when a new
+    game starts and with `on_event(tick_number, event)` after every tick event
+    has been applied, so it can keep derived data (observations, distances,
+    ...) up to date incrementally instead of rebuilding it every tick.
+    """
+    def add_state_listener(self, listener):
+        self._state_listeners.append(listener)
+
+    """
+    records per-stage latency histograms and deadline misses of every tick
+    in `self.timings` (see tick_timing.py), a summary is printed at the end
+    of each game. Disabled, the only cost is a few `is None` checks
+    """
+    def enable_timing(self, enabled: bool = True):
+        if not enabled:
+            self.timings = None
+        elif self.timings is None:
+            self.timings = TickTimings()
+            if self._state is not None:
+                self.timings.set_tick_rate(
+                    self._state.get("config").get("tick_rate_hz"))
+
+    """
+    keeps an immutable StateSnapshot of each of the last `history_length`
+    ticks in `self.snapshots` (see state_snapshot.py). Consecutive snapshots
+    share every unit and entity row the tick did not change, so holding on
+    to them or branching them for search needs no deepcopy of the state
+    """
+    def enable_snapshots(self, history_length: int = 1):
+        self.snapshots = SnapshotHistory(history_length)
+        if self._state is not None:
+            self.snapshots.on_game_state(self._state)
+
+    """
+    keeps shortest path distances between all cells of the map in
+    `self.distances` (see distance_field.py), updated when blocks are
+    destroyed, for O(1) `distance` and `next_step` lookups in the callback
+    """
+    def enable_distances(self):
+        if self.distances is None:
+            self.distances = DistanceField()
+            self.add_state_listener(self.distances)
+            if self._state is not None:
+                self.distances.on_game_state(self._state)
+
+    """
+    keeps the earliest tick a blast reaches every cell, chain reactions
+    included, in `self.danger` (see danger_map.py)
+    """
+    def enable_danger_map(self):
+        if self.danger is None:
+            self.danger = DangerMap()
+            self.add_state_listener(self.danger)
+            if self._state is not None:
+                self.danger.on_game_state(self._state)
+
     async def connect(self):
         self.connection = await websockets.connect(self._connection_string)
         if self.connection.open:
             return self.connection
 
+    async def connect_with_backoff(self):
+        return await reconnect.connect_with_backoff(self.connect, self._backoff)
+
+    """
+    plays `max_games` games, reconnecting with jittered exponential backoff
+    (see reconnect.py) whenever the connection drops or closes at the end
+    of a game, starting with `connection` if one is already open. The
+    state, listeners and everything the caller holds (models, caches) are
+    kept: the engine sends a fresh game_state on every connection, which
+    replaces the state before the next tick. Only a connection that closed
+    mid-game counts as an outage for `reconnects` and the reconnect callback
+    """
+    async def run(self, max_games: Optional[int] = reconnect.max_games,
+                  connection: Optional[WebSocketClientProtocol] = None):
+        await reconnect.run_games(self, max_games, connection)
+
+    async def _on_reconnected(self, outage: float):
+        self.reconnects += 1
+        unsent_actions = self.unsent_actions
+        self.unsent_actions = []
+        print(f"reconnected after {outage:.2f}s, {len(unsent_actions)} actions were not sent while disconnected")
+        if self._reconnect_callback is not None:
+            await self._reconnect_callback(outage, unsent_actions)
+
+    def _add_unsent(self, actions: List, reason: str) -> List[Tuple[Dict, str]]:
+        tick = self._state.get("tick") if self._state is not None else None
+        for action in actions:
+            self.unsent_actions.append(
+                {"tick": tick, "action": action, "reason": reason})
+        self.unsent_action_count += len(actions)
+        return [(action, reason) for action in actions]
+
     async def _send(self, packet):
-        await self.connection.send(json.dumps(packet))
+        await self._send_raw(dumps(packet))
+
+    async def _send_raw(self, raw_data: str):
+        timings = self.timings
+        start = time.perf_counter_ns() if timings is not None else 0
+        if self.connection is None:
+            # unsent actions are packets like the ones send_actions drops, decoding only happens on this path
+            self._add_unsent([loads(raw_data)], "not connected")
+            return
+        try:
+            await self.connection.send(raw_data)
+        except websockets.exceptions.ConnectionClosed:
+            self._add_unsent([loads(raw_data)], "not connected")
+            return
+        if timings is not None:
+            timings.add_send(time.perf_counter_ns() - start)
 
     async def send_move(self, move: str, unit_id: str):
         if move in _move_set:
-            packet = {"type": "move", "move": move, "unit_id": unit_id}
-            await self._send(packet)
+            await self._send_raw(encode_move(move, unit_id))
 
     async def send_bomb(self, unit_id: str):
-        packet = {"type": "bomb", "unit_id": unit_id}
-        await self._send(packet)
+        await self._send_raw(encode_bomb(unit_id))
 
     async def send_detonate(self, x, y, unit_id: str):
-        packet = {"type": "detonate", "coordinates": [
-            x, y], "unit_id": unit_id}
-        await self._send(packet)
+        await self._send_raw(encode_detonate(x, y, unit_id))
+
+    """
+    sends the actions of all units for this tick at once. `actions` are
+    action packets ({"type": "move", "move": "up", "unit_id": ...},
+    {"type": "bomb", ...}, {"type": "detonate", "coordinates": [x, y], ...}).
+    Invalid actions are dropped before anything is sent and returned as
+    (action, reason) pairs, the rest are encoded in one pass and written
+    with a single flush. When the connection is down they are returned with
+    the reason "not connected" and kept in `unsent_actions`
+    """
+    async def send_actions(self, actions: List[Dict]) -> List[Tuple[Dict, str]]:
+        dropped = []
+        valid = []
+        encoded = []
+        acting_units = set()
+        for action in actions:
+            reason = self._get_invalid_action_reason(action, acting_units)
+            if reason is not None:
+                dropped.append((action, reason))
+                continue
+            unit_id = action.get("unit_id")
+            acting_units.add(unit_id)
+            valid.append(action)
+            action_type = action.get("type")
+            if action_type == "move":
+                encoded.append(encode_move(action.get("move"), unit_id))
+            elif action_type == "bomb":
+                encoded.append(encode_bomb(unit_id))
+            else:
+                x, y = action.get("coordinates")
+                encoded.append(encode_detonate(x, y, unit_id))
+        if len(encoded) > 0:
+            timings = self.timings
+            start = time.perf_counter_ns() if timings is not None else 0
+            if self.connection is None:
+                dropped.extend(self._add_unsent(valid, "not connected"))
+                return dropped
+            try:
+                await self._send_batch(encoded)
+            except websockets.exceptions.ConnectionClosed:
+                # the engine may have received some of them, none can be counted on
+                dropped.extend(self._add_unsent(valid, "not connected"))
+                return dropped
+            if timings is not None:
+                timings.add_send(time.perf_counter_ns() - start)
+        return dropped
+
+    async def _send_batch(self, encoded: List[str]):
+        connection = self.connection
+        if hasattr(connection, "write_frame_sync"):
+            # websockets' protocol buffers every frame and flushes once, instead of draining per send.
+            # ensure_open, write_frame_sync and drain are internals of the legacy protocol of the
+            # websockets==10.1 pin in requirements.txt, test_send_actions checks them against a real server
+            await connection.ensure_open()
+            for raw_data in encoded:
+                connection.write_frame_sync(True, OP_TEXT, raw_data.encode())
+            await connection.drain()
+        else:
+            for raw_data in encoded:
+                await connection.send(raw_data)
+
+    def _get_invalid_action_reason(self, action: Dict, acting_units: set) -> Optional[str]:
+        action_type = action.get("type")
+        unit_id = action.get("unit_id")
+        if action_type not in _action_types:
+            return f"unknown action type {action_type}"
+        if action_type == "move" and action.get("move") not in _move_set:
+            return f"unknown move {action.get('move')}"
+        if unit_id in acting_units:
+            return "unit already has an action this tick"
+        if self._state is None:
+            return None
+        unit = self._state.get("unit_state").get(unit_id)
+        if unit is None:
+            return "unknown unit"
+        agent_id = (self._state.get("connection") or {}).get("agent_id")
+        if agent_id is not None and unit.get("agent_id") != agent_id:
+            return "unit belongs to another agent"
+        if unit.get("hp") <= 0:
+            return "unit is dead"
+        if action_type == "detonate":
+            coordinates = action.get("coordinates")
+            if coordinates is None or len(coordinates) != 2:
+                return "detonate needs coordinates"
+            x, y = coordinates
+            if not any(entity.get("type") == "b" and entity.get("unit_id") == unit_id for entity in self.entity_store.get_at(x, y)):
+                return "no bomb of the unit at the coordinates"
+        return None
 
     async def _handle_messages(self, connection: WebSocketClientProtocol):
+        if self._deadline_budget is not None:
+            await self._handle_messages_with_deadline(connection)
+            return
         while True:
             try:
                 raw_data = await connection.recv()
-                data = json.loads(raw_data)
+                timings = self.timings
+                if timings is not None:
+                    timings.on_received()
+                data = decode_packet(raw_data)
+                if timings is not None:
+                    timings.on_decoded()
                 await self._on_data(data)
             except websockets.exceptions.ConnectionClosed:
                 print('Connection with server closed')
                 break
 
+    async def _read_packets(self, connection: WebSocketClientProtocol, packets: asyncio.Queue):
+        loop = asyncio.get_event_loop()
+        try:
+            while True:
+                raw_data = await connection.recv()
+                timings = self.timings
+                if timings is not None:
+                    timings.on_received()
+                received = loop.time()
+                data = decode_packet(raw_data)
+                if timings is not None:
+                    timings.on_decoded()
+                packets.put_nowait((received, data))
+        except websockets.exceptions.ConnectionClosed:
+            print('Connection with server closed')
+        finally:
+            packets.put_nowait(None)
+
+    async def _handle_messages_with_deadline(self, connection: WebSocketClientProtocol):
+        packets: asyncio.Queue = asyncio.Queue()
+        reader = asyncio.ensure_future(self._read_packets(connection, packets))
+        decision = None
+        closed = False
+        try:
+            while not closed:
+                item = await packets.get()
+                latest_tick = None
+                # fold everything that queued up into the state, decide only on the newest tick
+                while True:
+                    if item is None:
+                        closed = True
+                        break
+                    received, data = item
+                    if data.get("type") == "tick":
+                        if latest_tick is not None:
+                            self.stale_ticks_skipped += 1
+                        self._apply_game_tick(data.get("payload"))
+                        latest_tick = (data.get("payload").get("tick"), received)
+                    else:
+                        if data.get("type") == "game_state":
+                            # a decision on the previous game must not send actions into the new one
+                            await self._cancel_decision(decision)
+                        await self._on_data(data)
+                    if packets.empty():
+                        break
+                    item = packets.get_nowait()
+                if latest_tick is None or self._tick_callback is None:
+                    continue
+                # a decision still waiting for its callback or its fallback is for a stale tick
+                if await self._cancel_decision(decision):
+                    self.stale_ticks_skipped += 1
+                tick_number, received = latest_tick
+                period = 1 / self._state.get("config").get("tick_rate_hz")
+                decision = asyncio.ensure_future(self._decide(
+                    tick_number, received + period * self._deadline_budget))
+                # a failed decision wakes the loop like a closed connection, so the error surfaces right away
+                decision.add_done_callback(
+                    lambda task: packets.put_nowait(None) if _get_decision_error(task) is not None else None)
+        finally:
+            reader.cancel()
+            if decision is not None and not decision.done():
+                decision.cancel()
+        _raise_decision_error(decision)
+
+    """
+    cancels `decision` if it is still running and waits until it stopped, so
+    no two decisions send actions at the same time. Returns whether it was
+    running; the error of a decision that failed is raised
+    """
+    async def _cancel_decision(self, decision: Optional[asyncio.Future]) -> bool:
+        running = decision is not None and not decision.done()
+        if running:
+            decision.cancel()
+            await asyncio.wait([decision])
+        _raise_decision_error(decision)
+        return running
+
+    async def _decide(self, tick_number: int, deadline: float):
+        self._state["tick"] = tick_number
+        task = self._callback_task = asyncio.ensure_future(
+            self._tick_callback(tick_number, self._state))
+        try:
+            await asyncio.wait([task], timeout=max(deadline - asyncio.get_event_loop().time(), 0))
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        if not task.done():
+            task.cancel()
+            self.deadline_fallbacks += 1
+            if self._fallback_callback is not None:
+                await self._fallback_callback(tick_number, self._state)
+        elif not task.cancelled() and task.exception() is not None:
+            raise task.exception()
+        if self.timings is not None:
+            self.timings.on_callback_done()
+
     async def _on_data(self, data):
         data_type = data.get("type")
 
@@ -57,21 +419,45 @@ class GameState:
             pass
         elif data_type == "game_state":
             payload = data.get("payload")
+            self.game_states_received += 1
             self._on_game_state(payload)
         elif data_type == "tick":
             payload = data.get("payload")
             await self._on_game_tick(payload)
         elif data_type == "endgame_state":
             payload = data.get("payload")
+            self.games_finished += 1
             winning_agent_id = payload.get("winning_agent_id")
             print(f"Game over. Winner: Agent {winning_agent_id}")
+            if self.timings is not None:
+                print(self.timings.format_summary())
         else:
             print(f"unknown packet \"{data_type}\": {data}")
 
     def _on_game_state(self, game_state):
         self._state = game_state
+        self.entity_store = EntityStore(game_state.get("entities"))
+        self._state["entities"] = self.entity_store.entities
+        if self.snapshots is not None:
+            self.snapshots.on_game_state(self._state)
+        if self.timings is not None:
+            self.timings.set_tick_rate(
+                game_state.get("config").get("tick_rate_hz"))
+        for listener in self._state_listeners:
+            listener.on_game_state(self._state)
 
     async def _on_game_tick(self, game_tick):
+        tick_number = game_tick.get("tick")
+        self._apply_game_tick(game_tick)
+        timings = self.timings
+        if self._tick_callback is not None:
+            self._state["tick"] = tick_number
+            await self._tick_callback(tick_number, self._state)
+        if timings is not None:
+            timings.on_callback_done()
+
+    def _apply_game_tick(self, game_tick):
+        tick_number = game_tick.get("tick")
         events = game_tick.get("events")
         for event in events:
             event_type = event.get("type")
@@ -91,37 +477,28 @@ class GameState:
                 self._on_unit_action(unit_action)
             else:
                 print(f"unknown event type {event_type}: {event}")
-        if self._tick_callback is not None:
-            tick_number = game_tick.get("tick")
-            self._state["tick"] = tick_number
-            await self._tick_callback(tick_number, self._state)
+            for listener in self._state_listeners:
+                listener.on_event(tick_number, event)
+        self._state["entities"] = self.entity_store.entities
+        if self.snapshots is not None:
+            self.snapshots.on_tick(tick_number, events)
+        if self.timings is not None:
+            self.timings.on_applied()
 
     def _on_entity_spawned(self, spawn_event):
         spawn_payload = spawn_event.get("data")
-        self._state["entities"].append(spawn_payload)
+        self.entity_store.add(spawn_payload)
 
     def _on_entity_expired(self, spawn_event):
-        expire_payload = spawn_event.get("data")
-
-        def filter_entity_fn(entity):
-            [x, y] = expire_payload
-            entity_x = entity.get("x")
-            entity_y = entity.get("y")
-            should_remove = entity_x == x and entity_y == y
-            return should_remove == False
-
-        self._state["entities"] = list(filter(
-            filter_entity_fn, self._state["entities"]))
+        [x, y] = spawn_event.get("data")
+        self.entity_store.remove_at(x, y)
 
     def _on_unit_state(self, unit_state):
         unit_id = unit_state.get("unit_id")
         self._state["unit_state"][unit_id] = unit_state
 
     def _on_entity_state(self, x, y, updated_entity):
-        for entity in self._state.get("entities"):
-            if entity.get("x") == x and entity.get("y") == y:
-                self._state["entities"].remove(entity)
-        self._state["entities"].append(updated_entity)
+        self.entity_store.replace_at(x, y, updated_entity)
 
     def _on_unit_action(self, action_packet):
         unit_id = action_packet["unit_id"]
@@ -1,9 +1,10 @@
 import asyncio
 import json
-from typing import Callable, Dict, List
+from typing import Callable, Dict, List, Optional
 
 import websockets
 from forward_model import ForwardModel
+from local_forward_model import LocalForwardModel
 
 
 class GymEnv():
@@ -24,13 +25,54 @@ class GymEnv():
         return [state.get("next_state"), state.get("is_complete"), state.get("tick_result").get("events")]
 
 
+class VecEnv():
+    """
+    Steps several GymEnvs with one call. All forward model requests are sent
+    before any reply is awaited so they are evaluated concurrently.
+
+    Finished environments are reset automatically: the observation returned
+    for them is their final state, and their next step starts again from
+    their initial state.
+    """
+    def __init__(self, envs: List[GymEnv]):
+        self._envs = envs
+
+    @property
+    def num_envs(self) -> int:
+        return len(self._envs)
+
+    async def reset(self):
+        await asyncio.gather(*[env.reset() for env in self._envs])
+
+    """
+    `actions` has one action list per environment, returns
+    [observations, dones, infos] with one entry per environment
+    """
+    async def step(self, actions: List[List[Dict]]):
+        if len(actions) != len(self._envs):
+            raise Exception(
+                f"expected actions for {len(self._envs)} environments, got {len(actions)}")
+        results = await asyncio.gather(*[env.step(env_actions)
+                                         for env, env_actions in zip(self._envs, actions)])
+        observations = [result[0] for result in results]
+        dones = [result[1] for result in results]
+        infos = [result[2] for result in results]
+        await asyncio.gather(*[env.reset() for env, done in zip(self._envs, dones) if done])
+        return [observations, dones, infos]
+
+
 class Gym():
-    def __init__(self, fwd_model_uri: str):
-        self._client_fwd = ForwardModel(fwd_model_uri)
+    """
+    `fwd_model_uri` of None evaluates next states in-process with
+    LocalForwardModel instead of going through an engine
+    """
+    def __init__(self, fwd_model_uri: Optional[str], fwd_model_config: Optional[Dict] = None, seed: Optional[int] = None, max_in_flight: int = 256, timeout: Optional[float] = None):
+        if fwd_model_uri is None:
+            self._client_fwd = LocalForwardModel(fwd_model_config, seed)
+        else:
+            self._client_fwd = ForwardModel(
+                fwd_model_uri, max_in_flight, timeout)
         self._channel_counter = 0
-        self._channel_is_busy_status: Dict[int, bool] = {}
-        self._channel_buffer: Dict[int, Dict] = {}
-        self._client_fwd.set_next_state_callback(self._on_next_game_state)
         self._environments: Dict[str, GymEnv] = {}
 
     async def connect(self):
@@ -45,11 +87,6 @@ class Gym():
     async def close(self):
         await self._client_fwd.close()
 
-    async def _on_next_game_state(self, state):
-        channel = state.get("sequence_id")
-        self._channel_is_busy_status[channel] = False
-        self._channel_buffer[channel] = state
-
     def make(self, name: str, initial_state: Dict) -> GymEnv:
         if self._environments.get(name) is not None:
             raise Exception(
@@ -59,12 +96,10 @@ class Gym():
         self._channel_counter += 1
         return self._environments[name]
 
+    def make_vec(self, name: str, initial_states: List[Dict]) -> VecEnv:
+        envs = [self.make(f"{name}_{index}", initial_state)
+                for index, initial_state in enumerate(initial_states)]
+        return VecEnv(envs)
+
     async def _send_next_state(self, state, actions, channel: int):
-        self._channel_is_busy_status[channel] = True
-        await self._client_fwd.send_next_state(channel, state, actions)
-        while self._channel_is_busy_status[channel] == True:
-            # TODO figure out why packets are not received without some sleep
-            await asyncio.sleep(0.0001)
-        result = self._channel_buffer[channel]
-        del self._channel_buffer[channel]
-        return result
+        return await self._client_fwd.evaluate_next_state(state, actions)
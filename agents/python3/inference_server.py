@@ -0,0 +1,370 @@
+from multiprocessing import shared_memory
+from observation_encoder import NUM_FEATURES, NUM_PLANES
+from tick_timing import LatencyHistogram
+from typing import Callable, Dict, List, Optional, Tuple
+import asyncio
+import json
+import os
+import struct
+import time
+import numpy as np
+
+socket_path = os.environ.get(
+    "INFERENCE_SOCKET") or "/tmp/bomberland-inference.sock"
+
+# a batch is run once it has this many rows (units) or its first request waited `max_wait_ms`
+max_batch_size = int(os.environ.get("INFERENCE_MAX_BATCH") or 64)
+max_wait_ms = float(os.environ.get("INFERENCE_MAX_WAIT_MS") or 2)
+
+max_clients = int(os.environ.get("INFERENCE_MAX_CLIENTS") or 64)
+
+# keras weights for create_cnn, random weights when not set
+model_weights_path = os.environ.get("MODEL_WEIGHTS")
+
+metrics_interval = float(os.environ.get("INFERENCE_METRICS_INTERVAL") or 10)
+
+input_shape = (15, 15, NUM_PLANES)
+num_actions = 6
+hidden_units = 64
+# rows a single request can hold
+max_units = 8
+
+# request: number of units the client wrote to its slot, response: the same number once the
+# probabilities are in the slot (0 when the request was rejected)
+_message = struct.Struct("<I")
+
+# blocks created by a server in this process, whose resource tracker must keep them
+_created_blocks = set()
+
+
+class _Layout:
+    """
+    per slot views of one shared memory block: the spatial observation
+    (shared by the units of a request), one feature row and one
+    probability row per unit
+    """
+
+    def __init__(self, buffer, slots: int, input_shape: Tuple[int, ...], num_features: int, num_actions: int,
+                 max_units: int):
+        offset = 0
+        arrays = []
+        for shape in [(slots, *input_shape), (slots, max_units, num_features), (slots, max_units, num_actions)]:
+            arrays.append(np.ndarray(shape, dtype=np.float32,
+                          buffer=buffer, offset=offset))
+            offset += int(np.prod(shape)) * 4
+        self.spatial, self.non_spatial, self.probabilities = arrays
+
+    @staticmethod
+    def get_size(slots: int, input_shape: Tuple[int, ...], num_features: int, num_actions: int, max_units: int) -> int:
+        return 4 * slots * (int(np.prod(input_shape)) + max_units * (num_features + num_actions))
+
+
+class InferenceMetrics:
+    """
+    batch sizes (in rows and in requests), time requests waited in the
+    queue before their batch started and time spent in the model
+    """
+
+    def __init__(self):
+        self.batch_rows = LatencyHistogram()
+        self.batch_requests = LatencyHistogram()
+        self.queue_us = LatencyHistogram()
+        self.inference_us = LatencyHistogram()
+
+    def summary(self) -> Dict:
+        return {
+            "batches": self.batch_rows.count,
+            "requests": self.queue_us.count,
+            "mean_batch_rows": self.batch_rows.total / self.batch_rows.count if self.batch_rows.count > 0 else 0.0,
+            "p50_batch_rows": self.batch_rows.percentile(0.5),
+            "max_batch_rows": self.batch_rows.max,
+            "mean_batch_requests": self.batch_requests.total / self.batch_requests.count if self.batch_requests.count > 0 else 0.0,
+            "p50_queue_ms": self.queue_us.percentile(0.5) / 1000,
+            "p99_queue_ms": self.queue_us.percentile(0.99) / 1000,
+            "max_queue_ms": self.queue_us.max / 1000,
+            "p50_inference_ms": self.inference_us.percentile(0.5) / 1000,
+            "p99_inference_ms": self.inference_us.percentile(0.99) / 1000,
+        }
+
+    def format_summary(self) -> str:
+        summary = self.summary()
+        return (f"{summary['requests']} requests in {summary['batches']} batches, "
+                f"{summary['mean_batch_rows']:.1f} rows / {summary['mean_batch_requests']:.1f} requests per batch "
+                f"(max {summary['max_batch_rows']} rows), queue p50 {summary['p50_queue_ms']:.3f}ms "
+                f"p99 {summary['p99_queue_ms']:.3f}ms, inference p50 {summary['p50_inference_ms']:.3f}ms "
+                f"p99 {summary['p99_inference_ms']:.3f}ms")
+
+    def reset(self):
+        for histogram in (self.batch_rows, self.batch_requests, self.queue_us, self.inference_us):
+            histogram.reset()
+
+
+class _Request:
+    __slots__ = ("slot", "num_units", "arrival", "writer")
+
+    def __init__(self, slot: int, num_units: int, arrival: int, writer: asyncio.StreamWriter):
+        self.slot = slot
+        self.num_units = num_units
+        self.arrival = arrival
+        self.writer = writer
+
+
+class InferenceServer:
+    """
+    Runs one model for many agent processes on the same machine. Every
+    client gets a slot in a shared memory block, writes its observation
+    there and sends the number of units over a unix socket; the server
+    collects requests from all clients into one batch until it has
+    `max_batch_size` rows or the oldest request waited `max_wait` seconds,
+    runs `model_fn(spatial_batch, non_spatial_batch) -> probabilities` on
+    it (one row per unit, the spatial observation repeated per unit) in a
+    worker thread, writes the probabilities back to the slots and answers
+    each client. Batch sizes and latencies are kept in `metrics`.
+    """
+
+    def __init__(self, model_fn: Callable[[np.ndarray, np.ndarray], np.ndarray], input_shape: Tuple[int, ...],
+                 num_features: int, num_actions: int, max_clients: int = 64, max_units: int = 8,
+                 max_batch_size: int = 64, max_wait: float = 0.002):
+        self._model_fn = model_fn
+        self._input_shape = tuple(input_shape)
+        self._num_features = num_features
+        self._num_actions = num_actions
+        self._max_units = max_units
+        self._max_batch_size = max_batch_size
+        self._max_wait_ns = int(max_wait * 1e9)
+        self._shared_memory = shared_memory.SharedMemory(create=True, size=_Layout.get_size(
+            max_clients, self._input_shape, num_features, num_actions, max_units))
+        _created_blocks.add(self._shared_memory.name)
+        self._layout = _Layout(self._shared_memory.buf, max_clients, self._input_shape, num_features,
+                               num_actions, max_units)
+        self._free_slots = list(range(max_clients - 1, -1, -1))
+        # requests of every slot that are queued or in a running batch, the slot of a client that
+        # disconnected is only handed out again once they are answered
+        self._pending = [0] * max_clients
+        self._closed_slots = set()
+        # a batch can overshoot max_batch_size by one request
+        rows = max_batch_size + max_units
+        self._spatial_batch = np.zeros(
+            (rows, *self._input_shape), dtype=np.float32)
+        self._non_spatial_batch = np.zeros(
+            (rows, num_features), dtype=np.float32)
+        self._requests: Optional[asyncio.Queue] = None
+        self._batcher: Optional[asyncio.Future] = None
+        self._server = None
+        self._handlers: Dict[asyncio.Task, asyncio.StreamWriter] = {}
+        self.metrics = InferenceMetrics()
+
+    async def serve(self, path: str):
+        if os.path.exists(path):
+            os.remove(path)
+        self._requests = asyncio.Queue()
+        self._batcher = asyncio.ensure_future(self._run_batches())
+        self._server = await asyncio.start_unix_server(self._handle_client, path)
+        return self._server
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        # closing the connections ends the handlers, which asyncio expects to finish on their own
+        for writer in list(self._handlers.values()):
+            writer.close()
+        await asyncio.gather(*self._handlers.keys(), return_exceptions=True)
+        if self._batcher is not None:
+            self._batcher.cancel()
+            await asyncio.gather(self._batcher, return_exceptions=True)
+        self._layout = None
+        self._shared_memory.close()
+        self._shared_memory.unlink()
+        _created_blocks.discard(self._shared_memory.name)
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        if len(self._free_slots) == 0:
+            writer.write(json.dumps({"error": "no free slot"}).encode() + b"\n")
+            writer.close()
+            return
+        slot = self._free_slots.pop()
+        handler = asyncio.current_task()
+        self._handlers[handler] = writer
+        writer.write(json.dumps({"slot": slot, "shared_memory": self._shared_memory.name,
+                                 "slots": len(self._layout.spatial), "input_shape": self._input_shape,
+                                 "num_features": self._num_features, "num_actions": self._num_actions,
+                                 "max_units": self._max_units}).encode() + b"\n")
+        try:
+            while True:
+                (num_units,) = _message.unpack(await reader.readexactly(_message.size))
+                if num_units < 1 or num_units > self._max_units:
+                    writer.write(_message.pack(0))
+                    continue
+                self._pending[slot] += 1
+                self._requests.put_nowait(
+                    _Request(slot, num_units, time.perf_counter_ns(), writer))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+            self._closed_slots.add(slot)
+            self._release_slot(slot)
+            self._handlers.pop(handler, None)
+
+    def _release_slot(self, slot: int):
+        if slot in self._closed_slots and self._pending[slot] == 0:
+            self._closed_slots.discard(slot)
+            self._free_slots.append(slot)
+
+    async def _run_batches(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            first = await self._requests.get()
+            batch = [first]
+            rows = first.num_units
+            deadline = first.arrival + self._max_wait_ns
+            while rows < self._max_batch_size:
+                if self._requests.empty():
+                    timeout = (deadline - time.perf_counter_ns()) / 1e9
+                    if timeout <= 0:
+                        break
+                    try:
+                        request = await asyncio.wait_for(self._requests.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    request = self._requests.get_nowait()
+                batch.append(request)
+                rows += request.num_units
+            started = time.perf_counter_ns()
+            self._fill_batch(batch)
+            probabilities = await loop.run_in_executor(None, self._model_fn, self._spatial_batch[:rows],
+                                                       self._non_spatial_batch[:rows])
+            self._answer(batch, np.asarray(probabilities), started)
+
+    def _fill_batch(self, batch: List[_Request]):
+        layout = self._layout
+        row = 0
+        for request in batch:
+            end = row + request.num_units
+            self._spatial_batch[row:end] = layout.spatial[request.slot]
+            self._non_spatial_batch[row:end] = layout.non_spatial[request.slot, :request.num_units]
+            row = end
+
+    def _answer(self, batch: List[_Request], probabilities: np.ndarray, started: int):
+        done = time.perf_counter_ns()
+        metrics = self.metrics
+        metrics.batch_rows.record(len(probabilities))
+        metrics.batch_requests.record(len(batch))
+        metrics.inference_us.record((done - started) // 1000)
+        layout = self._layout
+        row = 0
+        for request in batch:
+            end = row + request.num_units
+            layout.probabilities[request.slot, :request.num_units] = probabilities[row:end]
+            row = end
+            metrics.queue_us.record((started - request.arrival) // 1000)
+            if not request.writer.is_closing():
+                request.writer.write(_message.pack(request.num_units))
+            self._pending[request.slot] -= 1
+            self._release_slot(request.slot)
+
+
+class InferenceClient:
+    """
+    Agent side of InferenceServer: `await infer(spatial, non_spatial)` with
+    the ObservationEncoder inputs ((1, H, W, planes) and (units, features))
+    returns (units, num_actions) probabilities. The arrays only go through
+    shared memory, the socket carries four bytes each way.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._shared_memory: Optional[shared_memory.SharedMemory] = None
+        self._layout: Optional[_Layout] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self.slot = -1
+
+    async def connect(self):
+        self._reader, self._writer = await asyncio.open_unix_connection(self._path)
+        info = json.loads(await self._reader.readline())
+        if "error" in info:
+            raise ConnectionError(info.get("error"))
+        self.slot = info.get("slot")
+        self._shared_memory = _attach_shared_memory(info.get("shared_memory"))
+        self._layout = _Layout(self._shared_memory.buf, info.get("slots"), tuple(info.get("input_shape")),
+                               info.get("num_features"), info.get("num_actions"), info.get("max_units"))
+        self._lock = asyncio.Lock()
+
+    async def infer(self, spatial: np.ndarray, non_spatial: np.ndarray) -> np.ndarray:
+        num_units = len(non_spatial)
+        async with self._lock:
+            layout = self._layout
+            layout.spatial[self.slot] = spatial[0]
+            layout.non_spatial[self.slot, :num_units] = non_spatial
+            self._writer.write(_message.pack(num_units))
+            (answered,) = _message.unpack(await self._reader.readexactly(_message.size))
+            if answered != num_units:
+                raise ValueError(
+                    f"inference server rejected a request of {num_units} units")
+            return layout.probabilities[self.slot, :num_units].copy()
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._layout = None
+        if self._shared_memory is not None:
+            self._shared_memory.close()
+
+
+def _attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # before python 3.13 attaching registers the block with this process' resource tracker,
+        # which would unlink it when the agent exits
+        from multiprocessing import resource_tracker
+        block = shared_memory.SharedMemory(name=name)
+        if name not in _created_blocks:
+            resource_tracker.unregister(block._name, "shared_memory")
+        return block
+
+
+def create_keras_model_fn(model) -> Callable[[np.ndarray, np.ndarray], np.ndarray]:
+    import tensorflow as tf
+
+    @tf.function(reduce_retracing=True)
+    def predict(spatial_batch, non_spatial_batch):
+        return model([spatial_batch, non_spatial_batch], training=False)
+
+    def model_fn(spatial_batch: np.ndarray, non_spatial_batch: np.ndarray) -> np.ndarray:
+        return predict(spatial_batch, non_spatial_batch).numpy()
+    return model_fn
+
+
+async def _print_metrics(server: InferenceServer):
+    while True:
+        await asyncio.sleep(metrics_interval)
+        if server.metrics.queue_us.count > 0:
+            print(server.metrics.format_summary())
+            server.metrics.reset()
+
+
+def main():
+    import create_cnn
+    model = create_cnn.create_cnn(
+        input_shape, NUM_FEATURES, num_actions, hidden_units)
+    if model_weights_path:
+        model.load_weights(model_weights_path)
+    server = InferenceServer(create_keras_model_fn(model), input_shape, NUM_FEATURES, num_actions,
+                             max_clients=max_clients, max_units=max_units, max_batch_size=max_batch_size,
+                             max_wait=max_wait_ms / 1000)
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(server.serve(socket_path))
+    print(f"serving {model_weights_path or 'untrained create_cnn'} on {socket_path}")
+    try:
+        loop.run_until_complete(_print_metrics(server))
+    finally:
+        loop.run_until_complete(server.close())
+
+
+if __name__ == "__main__":
+    main()
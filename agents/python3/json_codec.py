@@ -0,0 +1,126 @@
+import json
+import os
+from json.encoder import encode_basestring
+from typing import Dict, List, Union
+
+from packets import ServerPacket, payload_types
+
+# fastest available backend: orjson, then msgspec, then the stdlib
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+# VALIDATE_PACKETS=1 checks inbound payloads against packets.py (needs msgspec), a second pass over every packet
+validate_packets = os.environ.get("VALIDATE_PACKETS") == "1"
+
+# characters of an invalid packet that are printed
+_max_printed_packet = 200
+
+if orjson is not None:
+    backend = "orjson"
+elif msgspec is not None:
+    backend = "msgspec"
+else:
+    backend = "json"
+
+
+def loads(raw_data: Union[str, bytes]):
+    if orjson is not None:
+        return orjson.loads(raw_data)
+    if msgspec is not None:
+        return msgspec.json.decode(raw_data)
+    return json.loads(raw_data)
+
+
+# always returns str so websockets keeps sending text frames
+def dumps(value) -> str:
+    if orjson is not None:
+        return orjson.dumps(value).decode()
+    if msgspec is not None:
+        return msgspec.json.encode(value).decode()
+    return json.dumps(value)
+
+
+"""
+decodes a server packet into a dict matching packets.ServerPacket, the
+same dict with every backend. With `validate` (and msgspec installed) the
+payload is also checked against the TypedDict of its packet type; a packet
+that does not match is printed and returned as decoded, so a schema
+change in the engine shows up in the logs instead of ending the connection
+"""
+def decode_packet(raw_data: Union[str, bytes], validate: bool = validate_packets) -> ServerPacket:
+    data = loads(raw_data)
+    if not validate or msgspec is None or not isinstance(data, dict):
+        return data
+    payload_type = payload_types.get(data.get("type"))
+    if payload_type is not None:
+        try:
+            msgspec.convert(data.get("payload"), payload_type)
+        except msgspec.ValidationError as e:
+            print(f"invalid \"{data.get('type')}\" packet ({e}): {raw_data[:_max_printed_packet]!r}")
+    return data
+
+
+# outbound packets are written directly instead of dumping a temporary dict
+
+def encode_move(move: str, unit_id: str) -> str:
+    return f'{{"type": "move", "move": {encode_basestring(move)}, "unit_id": {encode_basestring(unit_id)}}}'
+
+
+def encode_bomb(unit_id: str) -> str:
+    return f'{{"type": "bomb", "unit_id": {encode_basestring(unit_id)}}}'
+
+
+def encode_detonate(x: int, y: int, unit_id: str) -> str:
+    return f'{{"type": "detonate", "coordinates": [{int(x)}, {int(y)}], "unit_id": {encode_basestring(unit_id)}}}'
+
+
+def encode_evaluate_next_state(sequence_id: int, encoded_state: str, actions: List[Dict]) -> str:
+    return f'{{"actions": {dumps(actions)}, "type": "evaluate_next_state", "state": {encoded_state}, "sequence_id": {int(sequence_id)}}}'
+
+
+class StateEncoder:
+    """
+    Encodes game states for `evaluate_next_state` without touching the
+    caller's dict: the `connection` key is skipped instead of popped.
+
+    With the stdlib backend the encoded form of every entity is cached by its
+    content, so blocks and other entities that did not change since the last
+    call are not re-encoded; only entries used by the latest state are kept.
+    orjson and msgspec encode a whole state faster than the cache lookups, so
+    they encode it directly. The output is identical either way.
+    """
+
+    def __init__(self):
+        self._entity_cache: Dict[tuple, str] = {}
+
+    def encode(self, game_state: Dict) -> str:
+        if backend != "json":
+            return dumps({key: value for key, value in game_state.items() if key != "connection"})
+        fields = []
+        for key, value in game_state.items():
+            if key == "connection":
+                continue
+            encoded = self._encode_entities(
+                value) if key == "entities" else json.dumps(value)
+            fields.append(f"{encode_basestring(key)}: {encoded}")
+        return "{" + ", ".join(fields) + "}"
+
+    def _encode_entities(self, entities: List[Dict]) -> str:
+        cache = self._entity_cache
+        used_entries: Dict[tuple, str] = {}
+        parts = []
+        for entity in entities:
+            key = tuple(entity.items())
+            encoded = cache.get(key)
+            if encoded is None:
+                encoded = json.dumps(entity)
+            used_entries[key] = encoded
+            parts.append(encoded)
+        self._entity_cache = used_entries
+        return "[" + ", ".join(parts) + "]"
@@ -0,0 +1,581 @@
+import math
+import random
+from typing import Dict, List, Optional
+
+# engine defaults (see bomberland-engine/src/Config/getConfig.ts), override
+# them to match the environment of the engine you are comparing against
+default_config: Dict = {
+    "ammo_duration_ticks": 40,
+    "ammo_spawn_weighting": 0.0,
+    "blast_duration_ticks": 5,
+    "blast_powerup_duration_ticks": 40,
+    "blast_powerup_spawn_weighting": 0.5,
+    "bomb_armed_ticks": 5,
+    "bomb_duration_ticks": 30,
+    "entity_spawn_probability_per_tick": 0.0,
+    "freeze_debuff_duration_ticks": 15,
+    "freeze_powerup_spawn_weighting": 0.5,
+    "invulnerability_ticks": 5,
+    "maximum_concurrent_bombs": 3,
+    "object_destruction_item_drop_probability": 0.5,
+}
+
+_action_order = {"bomb": 0, "detonate": 1, "move": 2}
+_move_deltas = {"up": (0, 1), "down": (0, -1),
+                "left": (-1, 0), "right": (1, 0)}
+_walkable_types = set(("a", "t", "x", "bp", "fp"))
+_block_types = set(("m", "w", "o"))
+_block_hp = {"m": None, "w": 1, "o": 3}
+
+
+class _ActionFailed(Exception):
+    pass
+
+
+def _entity(created, x, y, entity_type, unit_id=None, agent_id=None, expires=None, hp=None, blast_diameter=None) -> Dict:
+    # same key order as AbstractEntity.ToJSON so serialized output matches the engine byte for byte
+    entity = {"created": created, "x": x, "y": y, "type": entity_type}
+    if unit_id is not None:
+        entity["unit_id"] = unit_id
+    if agent_id is not None:
+        entity["agent_id"] = agent_id
+    if expires is not None:
+        entity["expires"] = expires
+    if hp is not None:
+        entity["hp"] = hp
+    if blast_diameter is not None:
+        entity["blast_diameter"] = blast_diameter
+    return entity
+
+
+def _unit_json(unit: Dict) -> Dict:
+    return {
+        "coordinates": list(unit["coordinates"]),
+        "hp": unit["hp"],
+        "inventory": {"bombs": unit["inventory"]["bombs"]},
+        "blast_diameter": unit["blast_diameter"],
+        "unit_id": unit["unit_id"],
+        "agent_id": unit["agent_id"],
+        "invulnerable": unit["invulnerable"],
+        "stunned": unit["stunned"],
+    }
+
+
+def generate_growing_fire_progression(width: int, height: int) -> List[int]:
+    """
+    Order in which the end-game fire fills the map: two clockwise spirals,
+    one from the top left and one from the bottom right corner, that take
+    turns claiming the next free cell.
+    """
+    used_cells: Dict[int, None] = {}
+    total_cells = width * height
+    # directions in clockwise order: right, down, left, up
+    directions = [(1, 0), (0, -1), (-1, 0), (0, 1)]
+
+    def is_free(x, y):
+        return 0 <= x < width and 0 <= y < height and (x + y * width) not in used_cells
+
+    spirals = [[0, height - 1, 0], [width - 1, 0, 2]]
+    for x, y, _ in spirals:
+        used_cells[x + y * width] = None
+    for _ in range(total_cells):
+        for spiral in spirals:
+            if len(used_cells) >= total_cells:
+                continue
+            x, y, direction = spiral
+            dx, dy = directions[direction]
+            if not is_free(x + dx, y + dy):
+                direction = (direction + 1) % 4
+                dx, dy = directions[direction]
+            x, y = x + dx, y + dy
+            used_cells[x + y * width] = None
+            spiral[:] = [x, y, direction]
+    return list(used_cells)
+
+
+_fire_progressions: Dict = {}
+
+
+def _get_fire_progression(width: int, height: int) -> List[int]:
+    key = (width, height)
+    if key not in _fire_progressions:
+        _fire_progressions[key] = generate_growing_fire_progression(
+            width, height)
+    return _fire_progressions[key]
+
+
+class _Simulation:
+    """
+    Mirror of the engine's createGameFromState + Game.GetTickResult. The
+    order of every check and event is kept identical to the TypeScript so the
+    resulting tick events and next state match the engine exactly, including
+    the way createGameFromState reconstructs entities (bomb and ammo expiry
+    recomputed from `created`, ore hp reset to 3, powerup expiry restarted at
+    the current tick).
+    """
+
+    def __init__(self, state: Dict, config: Dict, rng: random.Random):
+        self._config = config
+        self._rng = rng
+        self._game_id = state.get("game_id")
+        self._tick = state.get("tick")
+        self._width = state["world"]["width"]
+        self._height = state["world"]["height"]
+        state_config = state["config"]
+        self._tick_rate_hz = state_config.get("tick_rate_hz")
+        self._game_duration_ticks = state_config.get("game_duration_ticks")
+        self._fire_spawn_interval_ticks = state_config.get(
+            "fire_spawn_interval_ticks")
+        self._events: List[Dict] = []
+        self._last_action: Dict[str, int] = {}
+        self._active_bombs: Dict[str, set] = {}
+
+        self._units: Dict[str, Dict] = {}
+        for unit in state["unit_state"].values():
+            self._units[unit["unit_id"]] = _unit_json(unit)
+        self._unit_cells = set(self._cell(*unit["coordinates"])
+                               for unit in self._units.values())
+
+        self._entities: Dict[int, Dict] = {}
+        for entity in state["entities"]:
+            reconstructed = self._reconstruct_entity(entity)
+            self._track_entity(reconstructed)
+
+    # -- reconstruction --
+
+    def _reconstruct_entity(self, entity: Dict) -> Dict:
+        entity_type = entity.get("type")
+        x, y = entity.get("x"), entity.get("y")
+        unit_id, agent_id = entity.get("unit_id"), entity.get("agent_id")
+        created = entity.get("created")
+        if entity_type in _block_types:
+            return _entity(created, x, y, entity_type, unit_id, agent_id, hp=_block_hp[entity_type])
+        elif entity_type == "a":
+            return _entity(created, x, y, "a", expires=created + self._config["ammo_duration_ticks"], hp=1)
+        elif entity_type == "x":
+            return _entity(created, x, y, "x", unit_id, agent_id, expires=entity.get("expires"))
+        elif entity_type in ("bp", "fp"):
+            return _entity(self._tick, x, y, entity_type, expires=self._tick + self._config["blast_powerup_duration_ticks"], hp=1)
+        elif entity_type == "b":
+            # the engine takes the blast diameter of the first unit of the owning agent
+            owner = next((unit for unit in self._units.values()
+                          if unit["agent_id"] == agent_id), None)
+            if owner is None:
+                raise ValueError(
+                    "Agent cannot be undefined since bombs must have an owner")
+            return _entity(created, x, y, "b", unit_id, agent_id,
+                           expires=created + self._config["bomb_duration_ticks"], hp=1,
+                           blast_diameter=owner["blast_diameter"])
+        raise ValueError(
+            f"Unhandled entity type {entity_type} when reconstructing entity")
+
+    # -- helpers --
+
+    def _cell(self, x: int, y: int) -> int:
+        return x + y * self._width
+
+    def _coordinates(self, cell: int) -> List[int]:
+        return [cell % self._width, cell // self._width]
+
+    def _entity_cell(self, entity: Dict) -> int:
+        return entity["x"] + entity["y"] * self._width
+
+    def _units_in_cell(self, cell: int) -> List[Dict]:
+        return [unit for unit in self._units.values() if self._cell(*unit["coordinates"]) == cell]
+
+    def _roll(self, probability: float) -> bool:
+        return self._rng.random() < probability
+
+    def _track_entity(self, entity: Dict):
+        cell = self._entity_cell(entity)
+        self._entities[cell] = entity
+        if entity["type"] == "b" and entity.get("agent_id") is not None:
+            self._active_bombs.setdefault(entity["agent_id"], set()).add(cell)
+
+    def _push_unit_state(self, unit: Dict):
+        self._events.append({"type": "unit_state", "data": _unit_json(unit)})
+
+    def _flush(self) -> List[Dict]:
+        events = self._events
+        self._events = []
+        return events
+
+    # -- world --
+
+    def _is_coordinate_vacant(self, x: int, y: int) -> bool:
+        if x < 0 or x >= self._width or y < 0 or y >= self._height:
+            return False
+        entity = self._entities.get(self._cell(x, y))
+        return entity is None or entity["type"] in _walkable_types
+
+    def _contains_unit(self, x: int, y: int) -> bool:
+        return any(unit["coordinates"][0] == x and unit["coordinates"][1] == y for unit in self._units.values())
+
+    def _place_entity(self, entity: Dict):
+        self._track_entity(entity)
+        self._events.append({"type": "entity_spawned", "data": dict(entity)})
+
+    def _remove_entity(self, cell: int) -> bool:
+        entity = self._entities.pop(cell, None)
+        if entity is None:
+            return False
+        if entity["type"] == "b" and entity.get("agent_id") is not None:
+            self._active_bombs.get(entity["agent_id"], set()).discard(cell)
+        self._events.append(
+            {"type": "entity_expired", "data": self._coordinates(cell)})
+        return True
+
+    def _expire_entity(self, entity: Dict):
+        self._remove_entity(self._entity_cell(entity))
+        if entity["type"] == "b":
+            self._create_blast_from_origin(
+                entity["x"], entity["y"], entity["blast_diameter"], entity.get("unit_id"))
+
+    def _place_bomb(self, cell: int, unit: Dict):
+        x, y = self._coordinates(cell)
+        if self._is_coordinate_vacant(x, y):
+            bomb = _entity(self._tick, x, y, "b", unit["unit_id"], unit["agent_id"],
+                           expires=self._tick + self._config["bomb_duration_ticks"], hp=1,
+                           blast_diameter=unit["blast_diameter"])
+            self._place_entity(bomb)
+            unit["inventory"]["bombs"] -= 1
+            self._push_unit_state(unit)
+
+    def _reduce_unit_health(self, unit: Dict):
+        if unit["invulnerable"] < self._tick:
+            unit["hp"] -= 1
+            unit["invulnerable"] = self._tick + \
+                self._config["invulnerability_ticks"]
+            self._push_unit_state(unit)
+
+    def _create_blast_from_origin(self, x: int, y: int, blast_diameter: int, unit_id: Optional[str]):
+        steps = math.ceil((blast_diameter - 1) / 2)
+        self._generate_blast_in_cell(self._cell(x, y), unit_id)
+        # up, down, left, right
+        for dx, dy in ((0, 1), (0, -1), (-1, 0), (1, 0)):
+            for i in range(1, steps + 1):
+                blast_x, blast_y = x + dx * i, y + dy * i
+                if 0 <= blast_x < self._width and 0 <= blast_y < self._height:
+                    blast = self._generate_blast_in_cell(
+                        self._cell(blast_x, blast_y), unit_id)
+                    if blast is None:
+                        break
+
+    def _generate_blast_in_cell(self, cell: int, unit_id: Optional[str]) -> Optional[Dict]:
+        entity = self._entities.get(cell)
+        owner = self._units.get(unit_id) if unit_id is not None else None
+        agent_id = owner["agent_id"] if owner is not None else None
+        x, y = self._coordinates(cell)
+
+        if cell in self._unit_cells:
+            for unit in self._units_in_cell(cell):
+                self._reduce_unit_health(unit)
+
+        if entity is None:
+            blast = _entity(self._tick, x, y, "x", unit_id, agent_id,
+                            expires=self._tick + self._config["blast_duration_ticks"])
+            self._place_entity(blast)
+            return blast
+        elif entity["type"] == "x":
+            expires = self._tick + \
+                self._config["blast_duration_ticks"] if entity.get(
+                    "expires") is not None else None
+            blast = _entity(self._tick, x, y, "x",
+                            unit_id, agent_id, expires=expires)
+            self._expire_entity(entity)
+            self._place_entity(blast)
+            return blast
+
+        hp = entity.get("hp")
+        if hp is not None:
+            hp -= 1
+            entity["hp"] = hp
+            self._events.append({"type": "entity_state", "coordinates": [
+                                entity["x"], entity["y"]], "updated_entity": dict(entity)})
+            if hp <= 0:
+                self._remove_entity(cell)
+                if entity["type"] == "b":
+                    self._create_blast_from_origin(
+                        entity["x"], entity["y"], entity["blast_diameter"], entity.get("unit_id"))
+                elif entity["type"] in ("w", "o"):
+                    if self._roll(self._config["object_destruction_item_drop_probability"]):
+                        self._place_random_spawn(cell)
+        return None
+
+    def _place_random_spawn(self, cell: int):
+        x, y = self._coordinates(cell)
+        roll = self._rng.random()
+        config = self._config
+        if roll < config["ammo_spawn_weighting"]:
+            entity = _entity(self._tick, x, y, "a",
+                             expires=self._tick + config["ammo_duration_ticks"], hp=1)
+        elif roll < config["ammo_spawn_weighting"] + config["blast_powerup_spawn_weighting"]:
+            entity = _entity(self._tick, x, y, "bp",
+                             expires=self._tick + config["blast_powerup_duration_ticks"], hp=1)
+        else:
+            entity = _entity(self._tick, x, y, "fp",
+                             expires=self._tick + config["blast_powerup_duration_ticks"], hp=1)
+        self._place_entity(entity)
+
+    def _spread_fire(self):
+        if self._tick < self._game_duration_ticks:
+            return
+        delta = self._tick - self._game_duration_ticks
+        if delta % self._fire_spawn_interval_ticks != 0:
+            return
+        progression = _get_fire_progression(self._width, self._height)
+        index = delta // self._fire_spawn_interval_ticks
+        if index >= len(progression):
+            return
+        cell = progression[index]
+        x, y = self._coordinates(cell)
+        blast = _entity(self._tick, x, y, "x")
+        entity = self._entities.get(cell)
+        self._remove_entity(cell)
+        if entity is not None and entity["type"] == "b":
+            self._create_blast_from_origin(
+                entity["x"], entity["y"], entity["blast_diameter"], entity.get("unit_id"))
+        self._place_entity(blast)
+
+    def _world_tick(self) -> List[Dict]:
+        for entity in list(self._entities.values()):
+            expires = entity.get("expires")
+            if expires is not None and expires <= self._tick:
+                self._expire_entity(entity)
+        self._check_unit_entity_collision()
+        if self._roll(self._config["entity_spawn_probability_per_tick"]):
+            free_cells = [cell for cell in range(self._width * self._height)
+                          if cell not in self._entities and cell not in self._unit_cells]
+            if len(free_cells) > 0:
+                self._place_random_spawn(self._rng.choice(free_cells))
+        return self._flush()
+
+    def _check_unit_entity_collision(self):
+        for entity in list(self._entities.values()):
+            cell = self._entity_cell(entity)
+            if cell not in self._unit_cells:
+                continue
+            entity_type = entity["type"]
+            for unit in self._units_in_cell(cell):
+                if entity_type == "x":
+                    self._reduce_unit_health(unit)
+                elif entity_type == "a":
+                    unit["inventory"]["bombs"] += 1
+                    self._push_unit_state(unit)
+                    self._remove_entity(cell)
+                elif entity_type == "bp":
+                    unit["blast_diameter"] += 2
+                    self._push_unit_state(unit)
+                    self._remove_entity(cell)
+                elif entity_type == "fp":
+                    self._freeze_random_enemy(unit)
+                    self._remove_entity(cell)
+
+    def _freeze_random_enemy(self, unit: Dict):
+        agent_to_punish = "b" if unit["agent_id"] == "a" else "a"
+        alive_units = [enemy for enemy in self._units.values(
+        ) if enemy["agent_id"] == agent_to_punish and enemy["hp"] > 0]
+        if len(alive_units) == 0:
+            return
+        enemy = alive_units[math.floor(self._rng.random() * len(alive_units))]
+        enemy["stunned"] = self._tick + \
+            self._config["freeze_debuff_duration_ticks"]
+        self._push_unit_state(enemy)
+
+    # -- unit actions --
+
+    def queue_action(self, queue: List, agent_id: str, packet: Dict):
+        unit_id = packet.get("unit_id")
+        unit = self._units.get(unit_id)
+        if unit is None or unit["agent_id"] != agent_id:
+            return
+        if unit["hp"] <= 0:
+            return
+        if self._last_action.get(unit_id, -1) >= self._tick:
+            return
+        if unit["stunned"] >= self._tick:
+            return
+        self._last_action[unit_id] = self._tick
+        if packet.get("type") == "move" and packet.get("move") not in _move_deltas:
+            return
+        if packet.get("type") in _action_order:
+            queue.append((agent_id, packet))
+
+    def _move(self, unit: Dict, move: str):
+        x, y = unit["coordinates"]
+        dx, dy = _move_deltas[move]
+        new_x, new_y = x + dx, y + dy
+        if not self._is_coordinate_vacant(new_x, new_y) or self._contains_unit(new_x, new_y):
+            raise _ActionFailed(f"Cannot move {move}, cell is not vacant")
+        self._unit_cells.discard(self._cell(x, y))
+        self._unit_cells.add(self._cell(new_x, new_y))
+        unit["coordinates"] = [new_x, new_y]
+
+    def _bomb(self, unit: Dict):
+        if unit["inventory"]["bombs"] <= 0:
+            raise _ActionFailed("No bombs in inventory.")
+        if len(self._active_bombs.get(unit["agent_id"], ())) >= self._config["maximum_concurrent_bombs"]:
+            raise _ActionFailed("Too many concurrent bombs")
+        cell = self._cell(*unit["coordinates"])
+        entity = self._entities.get(cell)
+        if entity is None:
+            self._place_bomb(cell, unit)
+        elif entity["type"] == "x":
+            # placing a bomb on a blast detonates it straight away
+            has_expiry = entity.get("expires") is not None
+            expires = self._tick + \
+                self._config["blast_duration_ticks"] if has_expiry else None
+            blast_unit_id = entity.get("unit_id") if has_expiry else None
+            blast_agent_id = entity.get("agent_id") if has_expiry else None
+            self._remove_entity(cell)
+            self._place_bomb(cell, unit)
+            for _ in range(2):
+                in_cell = self._entities.get(cell)
+                if in_cell is not None:
+                    self._expire_entity(in_cell)
+            x, y = self._coordinates(cell)
+            self._place_entity(_entity(self._tick, x, y, "x", blast_unit_id,
+                                       blast_agent_id, expires=expires))
+        else:
+            raise _ActionFailed("Unable to place bomb already occupied")
+
+    def _detonate(self, unit: Dict, coordinates: List[int]):
+        entity = self._entities.get(self._cell(*coordinates))
+        if entity is not None and entity["type"] == "b" and entity.get("unit_id") == unit["unit_id"]:
+            if self._tick - entity["created"] > self._config["bomb_armed_ticks"]:
+                self._expire_entity(entity)
+            else:
+                raise _ActionFailed("Bomb not armed")
+
+    def _handle_actions(self, actions: List) -> List[Dict]:
+        events = []
+        for agent_id, packet in actions:
+            unit = self._units.get(packet.get("unit_id"))
+            try:
+                action_type = packet.get("type")
+                if action_type == "move":
+                    self._move(unit, packet.get("move"))
+                elif action_type == "bomb":
+                    self._bomb(unit)
+                elif action_type == "detonate":
+                    self._detonate(unit, packet.get("coordinates"))
+            except _ActionFailed:
+                continue
+            events.append(
+                {"type": "unit", "agent_id": agent_id, "data": dict(packet)})
+        return events + self._flush()
+
+    def _process_actions(self, actions: List) -> List[Dict]:
+        actions = sorted(
+            actions, key=lambda action: _action_order[action[1].get("type")])
+        non_move_actions = [
+            action for action in actions if action[1].get("type") != "move"]
+        move_actions = [
+            action for action in actions if action[1].get("type") == "move"]
+
+        # units trying to move into the same cell are all blocked
+        move_targets = [self._move_target(packet)
+                        for _, packet in move_actions]
+        target_counts: Dict[int, int] = {}
+        for target in move_targets:
+            target_counts[target] = target_counts.get(target, 0) + 1
+        move_actions = [action for action, target in zip(
+            move_actions, move_targets) if target_counts[target] == 1]
+
+        return self._handle_actions(non_move_actions) + self._handle_actions(move_actions)
+
+    def _move_target(self, packet: Dict) -> int:
+        x, y = self._units[packet.get("unit_id")]["coordinates"]
+        dx, dy = _move_deltas[packet.get("move")]
+        return self._cell(x + dx, y + dy)
+
+    # -- game --
+
+    def is_complete(self) -> bool:
+        alive_agents = set(
+            unit["agent_id"] for unit in self._units.values() if unit["hp"] > 0)
+        return len(alive_agents) <= 1
+
+    def get_state(self) -> Dict:
+        agents: Dict[str, Dict] = {}
+        for unit in self._units.values():
+            agent = agents.setdefault(
+                unit["agent_id"], {"agent_id": unit["agent_id"], "unit_ids": []})
+            agent["unit_ids"].append(unit["unit_id"])
+        return {
+            "game_id": self._game_id,
+            "agents": agents,
+            "unit_state": {unit_id: _unit_json(unit) for unit_id, unit in self._units.items()},
+            "entities": [dict(entity) for entity in self._entities.values()],
+            "world": {"width": self._width, "height": self._height},
+            "tick": self._tick,
+            "config": {
+                "tick_rate_hz": self._tick_rate_hz,
+                "game_duration_ticks": self._game_duration_ticks,
+                "fire_spawn_interval_ticks": self._fire_spawn_interval_ticks,
+            },
+        }
+
+    def get_tick_result(self, queued_actions: List) -> Dict:
+        self._tick += 1
+        self._spread_fire()
+        expiry_events = self._world_tick()
+        action_events = self._process_actions(queued_actions)
+        return {"tick": self._tick, "events": expiry_events + action_events + self._flush()}
+
+
+def evaluate_next_state(game_state: Dict, actions: List[Dict], config: Optional[Dict] = None, rng: Optional[random.Random] = None) -> Dict:
+    """
+    Python equivalent of the engine's evaluateNextState. `actions` uses the
+    `evaluate_next_state` packet format: [{"agent_id": ..., "action": {...}}].
+    The caller's `game_state` is never mutated.
+    """
+    simulation = _Simulation(game_state, config or default_config,
+                             rng or random.Random())
+    queued_actions: List = []
+    for forward_action in actions:
+        simulation.queue_action(queued_actions, forward_action.get(
+            "agent_id"), forward_action.get("action"))
+    tick_result = simulation.get_tick_result(queued_actions)
+    return {"next_state": simulation.get_state(), "is_complete": simulation.is_complete(), "tick_result": tick_result}
+
+
+class LocalForwardModel:
+    """
+    In-process drop-in for ForwardModel: `send_next_state` evaluates the next
+    state with `evaluate_next_state` and hands the same `next_game_state`
+    payload to the callback, without a websocket or an engine.
+    """
+
+    def __init__(self, config: Optional[Dict] = None, seed: Optional[int] = None):
+        self._config = {**default_config, **(config or {})}
+        self._rng = random.Random(seed)
+        self._next_state_callback = None
+        self._next_sequence_id = 0
+        self.connection = None
+
+    async def close(self):
+        pass
+
+    def set_next_state_callback(self, next_state_callback):
+        self._next_state_callback = next_state_callback
+
+    async def connect(self):
+        return self.connection
+
+    async def _handle_messages(self, connection):
+        # results are delivered directly from send_next_state
+        pass
+
+    async def send_next_state(self, sequence_id: int, game_state: Dict, actions: List[Dict]):
+        payload = evaluate_next_state(
+            game_state, actions, self._config, self._rng)
+        payload["sequence_id"] = sequence_id
+        if self._next_state_callback != None:
+            await self._next_state_callback(payload)
+        return payload
+
+    async def evaluate_next_state(self, game_state: Dict, actions: List[Dict], timeout: Optional[float] = None) -> Dict:
+        sequence_id = self._next_sequence_id
+        self._next_sequence_id += 1
+        return await self.send_next_state(sequence_id, game_state, actions)
@@ -0,0 +1,194 @@
+from admin_state import AdminState, analytics_directory
+from game_analytics import AnalyticsWriter
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import os
+import shlex
+import sys
+
+engine_command = os.environ.get(
+    "ENGINE_COMMAND") or "node ../../engine/bomberland-engine/dist/Program.js"
+
+agent_command = os.environ.get(
+    "AGENT_COMMAND") or f"{sys.executable} agent.py"
+
+base_port = int(os.environ.get("BASE_PORT") or 4000)
+
+# every instance runs one engine and two agents
+instance_count = int(os.environ.get("MATCH_INSTANCES")
+                     or max((os.cpu_count() or 1) // 3, 1))
+
+# "world_seed:prng_seed" pairs separated by commas, defaults to MATCH_COUNT games seeded 0, 1, ...
+match_seeds = os.environ.get("MATCH_SEEDS")
+match_count = int(os.environ.get("MATCH_COUNT") or 10)
+
+game_timeout = float(os.environ.get("GAME_TIMEOUT") or 600)
+
+_agent_ids = ["agentA", "agentB"]
+
+
+def parse_seed_pairs(seeds: str) -> List[Tuple[int, int]]:
+    pairs = []
+    for pair in seeds.split(","):
+        world_seed, prng_seed = pair.split(":")
+        pairs.append((int(world_seed), int(prng_seed)))
+    return pairs
+
+
+class MatchRunner():
+    """
+    Plays one game per (world_seed, prng_seed) pair on a pool of local
+    engines. Instance i listens on `base_port + i` and keeps its engine, two
+    agent processes and its own AdminState for as long as pairs are left,
+    starting every game after the first with `request_game_reset`. All
+    admins append to one AnalyticsWriter, so the results of every instance
+    end up in the same shards.
+    """
+
+    def __init__(self, engine_command: str, agent_command: str, analytics: AnalyticsWriter, instances: int = 1,
+                 base_port: int = 4000, game_timeout: Optional[float] = None, engine_env: Optional[Dict[str, str]] = None):
+        self._engine_command = engine_command
+        self._agent_command = agent_command
+        self._analytics = analytics
+        self._instances = instances
+        self._base_port = base_port
+        self._game_timeout = game_timeout
+        self._engine_env = engine_env or {}
+        self.games_played = 0
+        self.games_failed = 0
+
+    async def run(self, seed_pairs: List[Tuple[int, int]]):
+        pairs: asyncio.Queue = asyncio.Queue()
+        for pair in seed_pairs:
+            pairs.put_nowait(pair)
+        instances = min(self._instances, len(seed_pairs))
+        tasks = [asyncio.ensure_future(self._run_instance(index, pairs))
+                 for index in range(instances)]
+        try:
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            # an instance that could not be started stops the others, with their processes
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            for task in done:
+                task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            self._analytics.flush()
+
+    """
+    plays pairs from `pairs` until none are left. A game that times out, or
+    whose engine or admin connection goes away, is logged and skipped
+    (counted in `games_failed`) and the instance is restarted for the next
+    pair, since a hung engine cannot be trusted with a reset
+    """
+    async def _run_instance(self, index: int, pairs: asyncio.Queue):
+        port = self._base_port + index
+        while not pairs.empty():
+            world_seed, prng_seed = pairs.get_nowait()
+            processes = []
+            messages = None
+            try:
+                engine = await self._spawn(self._engine_command, {
+                    "ADMIN_ROLE_ENABLED": "1",
+                    "AGENT_ID_MAPPING": ",".join(_agent_ids),
+                    "SAVE_REPLAY_ENABLED": "0",
+                    "SHUTDOWN_ON_GAME_END_ENABLED": "0",
+                    "TELEMETRY_ENABLED": "0",
+                    "TRAINING_MODE_ENABLED": "0",
+                    "UI_ENABLED": "0",
+                    **self._engine_env,
+                    "PORT": str(port),
+                    "WORLD_SEED": str(world_seed),
+                    "PRNG_SEED": str(prng_seed),
+                })
+                processes.append(engine)
+                admin = AdminState(f"ws://127.0.0.1:{port}/?role=admin&name=match-runner-{index}",
+                                   analytics=self._analytics, world_seed=world_seed, prng_seed=prng_seed)
+                endgames: asyncio.Queue = asyncio.Queue()
+                admin.set_endgame_callback(endgames.put)
+                connection = await self._connect(admin, engine)
+                messages = asyncio.ensure_future(
+                    admin._handle_messages(connection))
+                for agent_id in _agent_ids:
+                    processes.append(await self._spawn(self._agent_command, {
+                        "GAME_CONNECTION_STRING": f"ws://127.0.0.1:{port}/?role=agent&agentId={agent_id}&name=match-runner-{index}-{agent_id}",
+                    }))
+
+                while True:
+                    error = await self._wait_for_game(endgames, engine, messages)
+                    if error is not None:
+                        self.games_failed += 1
+                        print(f"instance {index}: game with seeds {world_seed}:{prng_seed} {error}, skipping it "
+                              f"and restarting the instance")
+                        break
+                    self.games_played += 1
+                    print(f"instance {index}: game with seeds {world_seed}:{prng_seed} done, {self.games_played} games played")
+                    if pairs.empty():
+                        return
+                    world_seed, prng_seed = pairs.get_nowait()
+                    await admin.request_game_reset(world_seed, prng_seed)
+            finally:
+                if messages is not None:
+                    messages.cancel()
+                # agents first, so they do not see the engine go away mid game
+                for process in reversed(processes):
+                    if process.returncode is None:
+                        process.terminate()
+                        await process.wait()
+
+    """
+    waits for the endgame of the running game, returns None once it
+    arrived or why it never will: the engine exited, the admin connection
+    closed or the game took longer than `game_timeout`
+    """
+    async def _wait_for_game(self, endgames: asyncio.Queue, engine: asyncio.subprocess.Process,
+                             messages: asyncio.Future) -> Optional[str]:
+        endgame = asyncio.ensure_future(endgames.get())
+        engine_exit = asyncio.ensure_future(engine.wait())
+        try:
+            done, _ = await asyncio.wait([endgame, engine_exit, messages], timeout=self._game_timeout,
+                                         return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            endgame.cancel()
+            engine_exit.cancel()
+        if endgame in done:
+            return None
+        if engine_exit in done:
+            return f"failed, the engine exited with code {engine.returncode}"
+        if messages in done:
+            error = None if messages.cancelled() else messages.exception()
+            return f"failed, the admin connection closed{f' ({error})' if error is not None else ''}"
+        return f"timed out after {self._game_timeout}s"
+
+    async def _spawn(self, command: str, env: Dict[str, str]) -> asyncio.subprocess.Process:
+        return await asyncio.create_subprocess_exec(*shlex.split(command), env={**os.environ, **env},
+                                                    stdout=asyncio.subprocess.DEVNULL)
+
+    async def _connect(self, admin: AdminState, engine: asyncio.subprocess.Process):
+        # the engine needs a moment before it accepts connections
+        while True:
+            try:
+                return await admin.connect()
+            except OSError:
+                if engine.returncode is not None:
+                    raise RuntimeError(
+                        f"engine exited with code {engine.returncode}")
+                await asyncio.sleep(0.5)
+
+
+def main():
+    if match_seeds:
+        seed_pairs = parse_seed_pairs(match_seeds)
+    else:
+        seed_pairs = [(seed, seed) for seed in range(match_count)]
+    analytics = AnalyticsWriter(analytics_directory)
+    runner = MatchRunner(engine_command, agent_command, analytics,
+                         instances=instance_count, base_port=base_port, game_timeout=game_timeout)
+    asyncio.get_event_loop().run_until_complete(runner.run(seed_pairs))
+    print(f"{runner.games_played} games written to {analytics_directory}, {runner.games_failed} failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+import asyncio
+import math
+import random
+from typing import Dict, List, Optional, Tuple
+
+_moves = ["up", "down", "left", "right"]
+_move_deltas = {"up": (0, 1), "down": (0, -1),
+                "left": (-1, 0), "right": (1, 0)}
+_walkable_types = set(("a", "t", "x", "bp", "fp"))
+
+# a joint action holds one action per own unit (None = do nothing), in unit order
+JointAction = Tuple[Optional[Tuple], ...]
+
+
+def get_state_key(state: Dict) -> tuple:
+    units = tuple((unit.get("unit_id"), tuple(unit.get("coordinates")), unit.get("hp"), unit.get("inventory").get("bombs"),
+                   unit.get("blast_diameter"), unit.get("invulnerable"), unit.get("stunned")) for unit in state.get("unit_state").values())
+    entities = tuple(tuple(entity.items()) for entity in state.get("entities"))
+    return (state.get("tick"), units, entities)
+
+
+class _Node:
+    def __init__(self, state: Dict, is_complete: bool, value: float):
+        self.state = state
+        self.is_complete = is_complete
+        self.value = value
+        self.visits = 0
+        self.value_sum = 0.0
+        self.virtual_loss = 0
+        self.children: Dict[JointAction, "_Node"] = {}
+        self.untried: Optional[List[JointAction]] = None
+        self.expansion: Optional[asyncio.Future] = None
+
+
+class MCTSPlanner:
+    """
+    Monte Carlo tree search over the joint actions of one agent's units, using
+    a forward model (ForwardModel or LocalForwardModel) to step states.
+
+    Nodes are shared through a transposition table keyed by state content, so
+    different action orders that reach the same state share statistics. A
+    leaf is expanded by evaluating `expansion_width` sampled joint actions in
+    one batch of concurrent forward model requests, and `concurrency`
+    simulations run at once (virtual loss keeps them on different paths).
+    Opponent units are assumed to stay idle. Leaves are scored with a
+    hit-point heuristic, there are no random rollouts.
+    """
+
+    def __init__(self, fwd_model, agent_id: str, exploration: float = 1.4, expansion_width: int = 8,
+                 concurrency: int = 16, max_depth: int = 6, seed: Optional[int] = None):
+        self._fwd = fwd_model
+        self._agent_id = agent_id
+        self._exploration = exploration
+        self._expansion_width = expansion_width
+        self._concurrency = concurrency
+        self._max_depth = max_depth
+        self._random = random.Random(seed)
+        self._table: Dict[tuple, _Node] = {}
+        self._unit_ids: List[str] = []
+        self.last_simulations = 0
+        self.last_depth = 0
+
+    """
+    searches until `deadline` (in event loop time) and returns the most
+    visited joint action as {unit_id: action or None}, where an action is
+    ("move", direction), ("bomb",) or ("detonate", x, y)
+    """
+    async def plan(self, state: Dict, deadline: float) -> Dict[str, Optional[Tuple]]:
+        loop = asyncio.get_event_loop()
+        self._unit_ids = list(state.get("agents").get(
+            self._agent_id).get("unit_ids"))
+        # nodes from earlier ticks can never be reached again
+        self._table = {}
+        root = self._get_node(state, False)
+        self.last_simulations = 0
+        self.last_depth = 0
+
+        async def worker():
+            while loop.time() < deadline and not root.is_complete:
+                await self._simulate(root)
+
+        workers = [asyncio.ensure_future(worker())
+                   for _ in range(self._concurrency)]
+        done, pending = await asyncio.wait(workers, timeout=max(deadline - loop.time(), 0))
+        for task in pending:
+            task.cancel()
+        for task in done:
+            if not task.cancelled() and task.exception() is not None:
+                raise task.exception()
+
+        best = max(root.children.items(),
+                   key=lambda item: item[1].visits, default=None)
+        joint_action = best[0] if best is not None else tuple(
+            None for _ in self._unit_ids)
+        return dict(zip(self._unit_ids, joint_action))
+
+    def _get_node(self, state: Dict, is_complete: bool) -> _Node:
+        key = get_state_key(state)
+        node = self._table.get(key)
+        if node is None:
+            node = _Node(state, is_complete, self._evaluate(
+                state, is_complete))
+            self._table[key] = node
+        return node
+
+    async def _simulate(self, root: _Node):
+        path = [root]
+        node = root
+        while node.untried is not None and len(node.untried) == 0 and len(node.children) > 0 and not node.is_complete and len(path) <= self._max_depth:
+            node = self._select(node)
+            node.virtual_loss += 1
+            path.append(node)
+        try:
+            if node.is_complete or len(path) > self._max_depth:
+                values = [node.value]
+            else:
+                values = await self._expand(node)
+        finally:
+            for visited in path[1:]:
+                visited.virtual_loss -= 1
+        self.last_depth = max(self.last_depth, len(path))
+        for value in values:
+            for visited in path:
+                visited.visits += 1
+                visited.value_sum += value
+        self.last_simulations += len(values)
+
+    def _select(self, node: _Node) -> _Node:
+        log_visits = math.log(max(node.visits, 1))
+
+        def score(child: _Node):
+            visits = child.visits + child.virtual_loss
+            if visits == 0:
+                return math.inf
+            # virtual losses count as visits with a value of -1
+            mean = (child.value_sum - child.virtual_loss) / visits
+            return mean + self._exploration * math.sqrt(log_visits / visits)
+        return max(node.children.values(), key=score)
+
+    async def _expand(self, node: _Node) -> List[float]:
+        # concurrent simulations reaching the same leaf wait for one expansion
+        if node.expansion is not None:
+            await node.expansion
+            return []
+        node.expansion = asyncio.get_event_loop().create_future()
+        try:
+            if node.untried is None:
+                node.untried = self._sample_joint_actions(node.state)
+            joint_actions = node.untried
+            node.untried = []
+            results = await asyncio.gather(*[self._fwd.evaluate_next_state(
+                node.state, self._to_packets(node.state, joint_action)) for joint_action in joint_actions])
+            values = []
+            for joint_action, result in zip(joint_actions, results):
+                child = self._get_node(result.get(
+                    "next_state"), result.get("is_complete"))
+                node.children[joint_action] = child
+                child.visits += 1
+                child.value_sum += child.value
+                values.append(child.value)
+            return values
+        finally:
+            node.expansion.set_result(None)
+            node.expansion = None
+
+    def _sample_joint_actions(self, state: Dict) -> List[JointAction]:
+        options = [self._get_unit_actions(state, unit_id)
+                   for unit_id in self._unit_ids]
+        total = 1
+        for unit_options in options:
+            total *= len(unit_options)
+        samples = {tuple(None for _ in options)}
+        target = min(self._expansion_width, total)
+        while len(samples) < target:
+            samples.add(tuple(self._random.choice(unit_options)
+                              for unit_options in options))
+        return list(samples)
+
+    def _get_unit_actions(self, state: Dict, unit_id: str) -> List[Optional[Tuple]]:
+        unit = state.get("unit_state").get(unit_id)
+        tick = state.get("tick")
+        if unit.get("hp") <= 0 or unit.get("stunned") >= tick:
+            return [None]
+        width = state.get("world").get("width")
+        height = state.get("world").get("height")
+        blocked = set((entity.get("x"), entity.get("y")) for entity in state.get(
+            "entities") if entity.get("type") not in _walkable_types)
+        blocked.update(tuple(other.get("coordinates"))
+                       for other in state.get("unit_state").values())
+        x, y = unit.get("coordinates")
+        actions: List[Optional[Tuple]] = [None]
+        for move in _moves:
+            dx, dy = _move_deltas[move]
+            if 0 <= x + dx < width and 0 <= y + dy < height and (x + dx, y + dy) not in blocked:
+                actions.append(("move", move))
+        if unit.get("inventory").get("bombs") > 0:
+            actions.append(("bomb",))
+        for entity in state.get("entities"):
+            if entity.get("type") == "b" and entity.get("unit_id") == unit_id:
+                actions.append(("detonate", entity.get("x"), entity.get("y")))
+        return actions
+
+    def _to_packets(self, state: Dict, joint_action: JointAction) -> List[Dict]:
+        packets = []
+        for unit_id, action in zip(self._unit_ids, joint_action):
+            if action is None:
+                continue
+            if action[0] == "move":
+                packet = {"type": "move", "move": action[1],
+                          "unit_id": unit_id}
+            elif action[0] == "bomb":
+                packet = {"type": "bomb", "unit_id": unit_id}
+            else:
+                packet = {"type": "detonate", "coordinates": [
+                    action[1], action[2]], "unit_id": unit_id}
+            packets.append({"agent_id": self._agent_id, "action": packet})
+        return packets
+
+    def _evaluate(self, state: Dict, is_complete: bool) -> float:
+        own_hp = 0
+        enemy_hp = 0
+        for unit in state.get("unit_state").values():
+            hp = max(unit.get("hp"), 0)
+            if unit.get("agent_id") == self._agent_id:
+                own_hp += hp
+            else:
+                enemy_hp += hp
+        if is_complete:
+            if own_hp > 0 and enemy_hp == 0:
+                return 1.0
+            if enemy_hp > 0 and own_hp == 0:
+                return -1.0
+            return 0.0
+        total = own_hp + enemy_hp
+        return 0.0 if total == 0 else (own_hp - enemy_hp) / total
@@ -1,4 +1,3 @@
-import time
 from typing import Union
 from game_state import GameState
 import asyncio
@@ -18,18 +17,13 @@ class Agent():
         self._client.set_game_tick_callback(self._on_game_tick)
 
         loop = asyncio.get_event_loop()
-        connection = loop.run_until_complete(self._client.connect())
-        tasks = [
-            asyncio.ensure_future(self._client._handle_messages(connection)),
-        ]
-        loop.run_until_complete(asyncio.wait(tasks))
+        # reconnects with backoff when the connection drops, this object and its state stay (see reconnect.py)
+        loop.run_until_complete(self._client.run())
 
     # returns coordinates of the first bomb placed by a unit
     def _get_bomb_to_detonate(self, unit) -> Union[int, int] or None:
-        entities = self._client._state.get("entities")
-        bombs = list(filter(lambda entity: entity.get(
-            "unit_id") == unit and entity.get("type") == "b", entities))
-        bomb = next(iter(bombs or []), None)
+        bombs = self._client.entity_store.get_bombs(unit)
+        bomb = next(iter(bombs), None)
         if bomb != None:
             return [bomb.get("x"), bomb.get("y")]
         else:
@@ -42,34 +36,34 @@ class Agent():
         my_units = game_state.get("agents").get(my_agent_id).get("unit_ids")
 
         # send each unit a random action
+        packets = []
         for unit_id in my_units:
             action = algorithm(game_state, unit_id)
 
             if action in ["up", "left", "right", "down"]:
-                await self._client.send_move(action, unit_id)
+                packets.append(
+                    {"type": "move", "move": action, "unit_id": unit_id})
             elif action == "bomb":
-                await self._client.send_bomb(unit_id)
+                packets.append({"type": "bomb", "unit_id": unit_id})
             elif action == "detonate":
                 bomb_coordinates = self._get_bomb_to_detonate(unit_id)
                 if bomb_coordinates != None:
-                    x, y = bomb_coordinates
-                    await self._client.send_detonate(x, y, unit_id)
+                    packets.append(
+                        {"type": "detonate", "coordinates": bomb_coordinates, "unit_id": unit_id})
             else:
                 print(f"Unhandled action: {action} for unit {unit_id}")
 
+        # all units' actions go out together
+        dropped = await self._client.send_actions(packets)
+        for packet, reason in dropped:
+            print(f"dropped {packet}: {reason}")
+
 def algorithm(game_state, unit_id) -> str:
     action = random.choice(actions)
     return action
     
 def main():
-    for i in range(0,10):
-        while True:
-            try:
-                Agent()
-            except:
-                time.sleep(5)
-                continue
-            break
+    Agent()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,89 @@
+from tick_timing import StartupTimings
+from typing import Callable, Optional, Tuple
+import os
+import numpy as np
+
+# keras weights of the create_cnn model to export, random weights when not set
+model_weights_path = os.environ.get("MODEL_WEIGHTS")
+
+saved_model_path = os.environ.get("SAVED_MODEL_PATH") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "cnn_saved_model")
+
+# units in the warm-up call, the starter kit games give every agent 3
+warm_up_units = 3
+
+
+"""
+returns `policy(spatial, non_spatial) -> (actions, probabilities)` for the
+model in `path`, as numpy arrays with the greedy action of every unit:
+a `.tflite` file (see tflite_model.py) runs with the TFLite interpreter
+alone, a directory is loaded as the SavedModel written by
+`export_saved_model`, and without a path a fresh create_cnn model is
+built (with MODEL_WEIGHTS, if set). Tensorflow is only imported by the
+last two.
+"""
+def load_policy(path: Optional[str], input_shape: Tuple[int, ...], num_features: int, num_actions: int = 6,
+                hidden_units: int = 64, timings: Optional[StartupTimings] = None) -> Callable:
+    timings = timings or StartupTimings()
+    timings.start("import_runtime")
+    if path is not None and path.endswith(".tflite"):
+        from tflite_model import TFLiteRunner, load_interpreter_type
+        load_interpreter_type()
+        timings.end("import_runtime")
+        timings.start("load_model")
+        policy = TFLiteRunner(path).policy
+    elif path is not None:
+        import tensorflow as tf
+        timings.end("import_runtime")
+        timings.start("load_model")
+        policy = _create_saved_model_policy(tf.saved_model.load(path))
+    else:
+        import create_cnn
+        timings.end("import_runtime")
+        timings.start("load_model")
+        model = create_cnn.create_cnn(
+            input_shape, num_features, num_actions, hidden_units)
+        if model_weights_path:
+            model.load_weights(model_weights_path)
+        policy_fn = create_cnn.create_policy_fn(
+            model, input_shape, num_features)
+
+        def policy(spatial: np.ndarray, non_spatial: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+            actions, probabilities = policy_fn(spatial, non_spatial)
+            return actions.numpy(), probabilities.numpy()
+    timings.end("load_model")
+
+    timings.start("warm_up")
+    policy(np.zeros((1, *input_shape), dtype=np.float32),
+           np.zeros((warm_up_units, num_features), dtype=np.float32))
+    timings.end("warm_up")
+    return policy
+
+
+def _create_saved_model_policy(saved_model) -> Callable:
+    # the endpoint does not keep the loaded variables alive, the closure holds on to saved_model
+    def policy(spatial: np.ndarray, non_spatial: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        probabilities = saved_model.serve(
+            [np.repeat(spatial, len(non_spatial), axis=0), non_spatial]).numpy()
+        return np.argmax(probabilities, axis=1), probabilities
+    return policy
+
+
+def export_saved_model(model, path: str):
+    # keras' export writes a `serve` endpoint that needs neither keras nor the model code to load
+    model.export(path)
+
+
+def main():
+    import create_cnn
+    from observation_encoder import NUM_FEATURES, NUM_PLANES
+    model = create_cnn.create_cnn(
+        (15, 15, NUM_PLANES), NUM_FEATURES, 6, 64)
+    if model_weights_path:
+        model.load_weights(model_weights_path)
+    export_saved_model(model, saved_model_path)
+    print(f"exported {model_weights_path or 'untrained create_cnn'} to {saved_model_path}")
+
+
+if __name__ == "__main__":
+    main()
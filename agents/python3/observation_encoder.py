@@ -0,0 +1,167 @@
+from typing import Dict, List, Optional
+import numpy as np
+
+# spatial planes, indexed as spatial[0, y, x, plane]
+METAL_PLANE = 0
+WOOD_PLANE = 1
+ORE_PLANE = 2
+BOMB_PLANE = 3
+BLAST_PLANE = 4
+POWERUP_PLANE = 5
+OWN_UNIT_PLANE = 6
+ENEMY_UNIT_PLANE = 7
+NUM_PLANES = 8
+
+# non-spatial features, one row per own unit
+HP_FEATURE = 0
+BOMBS_FEATURE = 1
+BLAST_DIAMETER_FEATURE = 2
+STUN_FEATURE = 3
+NUM_FEATURES = 4
+
+_entity_planes = {
+    "m": METAL_PLANE,
+    "w": WOOD_PLANE,
+    "o": ORE_PLANE,
+    "b": BOMB_PLANE,
+    "x": BLAST_PLANE,
+    "a": POWERUP_PLANE,
+    "bp": POWERUP_PLANE,
+    "fp": POWERUP_PLANE,
+}
+_entity_plane_slice = slice(METAL_PLANE, POWERUP_PLANE + 1)
+
+_move_deltas = {"up": (0, 1), "down": (0, -1),
+                "left": (-1, 0), "right": (1, 0)}
+
+
+class ObservationEncoder:
+    """
+    Keeps the CNN input for one agent as preallocated float32 arrays and
+    updates them from game events (register with
+    `GameState.add_state_listener`). Only the cells touched by an event are
+    written, and `get_inputs` fills the stun column in place, so producing
+    the model input allocates nothing per tick.
+
+    `spatial` has shape (1, H, W, NUM_PLANES) and `non_spatial` has shape
+    (n_units, NUM_FEATURES) with rows in `agents[agent_id].unit_ids` order.
+    """
+
+    def __init__(self, agent_id: Optional[str] = None):
+        self._agent_id = agent_id
+        self._current_agent_id = agent_id
+        self.spatial = np.zeros((1, 0, 0, NUM_PLANES), dtype=np.float32)
+        self.non_spatial = np.zeros((0, NUM_FEATURES), dtype=np.float32)
+        self.unit_ids: List[str] = []
+        self._unit_rows: Dict[str, int] = {}
+        self._unit_agents: Dict[str, str] = {}
+        self._unit_cells: Dict[str, tuple] = {}
+        self._stunned_until = np.zeros(0, dtype=np.float32)
+
+    def on_game_state(self, game_state: Dict):
+        agent_id = self._agent_id
+        if agent_id is None:
+            agent_id = (game_state.get("connection") or {}).get("agent_id")
+        width = game_state.get("world").get("width")
+        height = game_state.get("world").get("height")
+        unit_ids = game_state.get("agents").get(agent_id).get("unit_ids")
+
+        # buffers are only reallocated when the map or team size changes
+        if self.spatial.shape[1:3] != (height, width):
+            self.spatial = np.zeros(
+                (1, height, width, NUM_PLANES), dtype=np.float32)
+        else:
+            self.spatial.fill(0)
+        if self.non_spatial.shape[0] != len(unit_ids):
+            self.non_spatial = np.zeros(
+                (len(unit_ids), NUM_FEATURES), dtype=np.float32)
+            self._stunned_until = np.zeros(len(unit_ids), dtype=np.float32)
+        else:
+            self.non_spatial.fill(0)
+            self._stunned_until.fill(0)
+
+        self._current_agent_id = agent_id
+        self.unit_ids = list(unit_ids)
+        self._unit_rows = {unit_id: row for row,
+                           unit_id in enumerate(self.unit_ids)}
+        self._unit_agents = {}
+        self._unit_cells = {}
+
+        for entity in game_state.get("entities"):
+            self._set_entity(entity)
+        for unit_state in game_state.get("unit_state").values():
+            self._set_unit(unit_state)
+
+    def on_event(self, tick_number: int, event: Dict):
+        event_type = event.get("type")
+        if event_type == "entity_spawned":
+            self._set_entity(event.get("data"))
+        elif event_type == "entity_expired":
+            [x, y] = event.get("data")
+            self._planes[y, x, _entity_plane_slice] = 0
+        elif event_type == "entity_state":
+            [x, y] = event.get("coordinates")
+            self._planes[y, x, _entity_plane_slice] = 0
+            self._set_entity(event.get("updated_entity"))
+        elif event_type == "unit_state":
+            self._set_unit(event.get("data"))
+        elif event_type == "unit":
+            action = event.get("data")
+            delta = _move_deltas.get(action.get("move"))
+            unit_id = action.get("unit_id")
+            if action.get("type") == "move" and delta is not None and unit_id in self._unit_cells:
+                x, y = self._unit_cells[unit_id]
+                self._place_unit(unit_id, x + delta[0], y + delta[1])
+
+    """
+    returns [spatial, non_spatial] for the model; both are the encoder's own
+    buffers, so copy them if they need to outlive the next tick
+    """
+    def get_inputs(self, tick_number: int):
+        stun = self.non_spatial[:, STUN_FEATURE]
+        np.subtract(self._stunned_until, tick_number, out=stun)
+        np.maximum(stun, 0, out=stun)
+        return [self.spatial, self.non_spatial]
+
+    @property
+    def _planes(self):
+        return self.spatial[0]
+
+    def _set_entity(self, entity: Dict):
+        plane = _entity_planes.get(entity.get("type"))
+        if plane is not None:
+            self._planes[entity.get("y"), entity.get("x"), plane] = 1
+
+    def _set_unit(self, unit_state: Dict):
+        unit_id = unit_state.get("unit_id")
+        self._unit_agents[unit_id] = unit_state.get("agent_id")
+        row = self._unit_rows.get(unit_id)
+        if row is not None:
+            features = self.non_spatial[row]
+            features[HP_FEATURE] = unit_state.get("hp")
+            features[BOMBS_FEATURE] = unit_state.get(
+                "inventory").get("bombs")
+            features[BLAST_DIAMETER_FEATURE] = unit_state.get(
+                "blast_diameter")
+            self._stunned_until[row] = unit_state.get("stunned") or 0
+        if unit_state.get("hp") > 0:
+            x, y = unit_state.get("coordinates")
+            self._place_unit(unit_id, x, y)
+        else:
+            self._remove_unit(unit_id)
+
+    def _unit_plane(self, unit_id: str) -> int:
+        if self._unit_agents.get(unit_id) == self._current_agent_id:
+            return OWN_UNIT_PLANE
+        return ENEMY_UNIT_PLANE
+
+    def _place_unit(self, unit_id: str, x: int, y: int):
+        self._remove_unit(unit_id)
+        self._planes[y, x, self._unit_plane(unit_id)] += 1
+        self._unit_cells[unit_id] = (x, y)
+
+    def _remove_unit(self, unit_id: str):
+        cell = self._unit_cells.pop(unit_id, None)
+        if cell is not None:
+            x, y = cell
+            self._planes[y, x, self._unit_plane(unit_id)] -= 1
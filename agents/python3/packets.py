@@ -0,0 +1,104 @@
+from typing import Any, Dict, List, Optional, TypedDict
+
+# typed views of the packets in validation.schema.json. They are plain dicts
+# at runtime, so code written against `.get(...)` keeps working; with msgspec
+# installed and VALIDATE_PACKETS=1 json_codec.decode_packet also validates
+# payloads against them.
+
+
+class _EntityRequired(TypedDict):
+    created: int
+    x: int
+    y: int
+    type: str
+
+
+class Entity(_EntityRequired, total=False):
+    unit_id: str
+    agent_id: str
+    expires: int
+    hp: int
+    blast_diameter: int
+
+
+class Inventory(TypedDict):
+    bombs: int
+
+
+class UnitState(TypedDict):
+    coordinates: List[int]
+    hp: int
+    inventory: Inventory
+    blast_diameter: int
+    unit_id: str
+    agent_id: str
+    invulnerable: int
+    stunned: int
+
+
+class AgentState(TypedDict):
+    agent_id: str
+    unit_ids: List[str]
+
+
+class World(TypedDict):
+    width: int
+    height: int
+
+
+class GameConfig(TypedDict):
+    tick_rate_hz: int
+    game_duration_ticks: int
+    fire_spawn_interval_ticks: int
+
+
+class Connection(TypedDict):
+    id: int
+    role: str
+    agent_id: Optional[str]
+
+
+class _GameStateRequired(TypedDict):
+    game_id: str
+    agents: Dict[str, AgentState]
+    unit_state: Dict[str, UnitState]
+    entities: List[Entity]
+    world: World
+    tick: int
+    config: GameConfig
+
+
+class GameState(_GameStateRequired, total=False):
+    connection: Connection
+
+
+class GameTick(TypedDict):
+    tick: int
+    # events are a union discriminated by "type", see GameEvent.types.ts
+    events: List[Dict[str, Any]]
+
+
+class EndGameState(TypedDict):
+    initial_state: GameState
+    history: List[GameTick]
+    winning_agent_id: Optional[str]
+
+
+class NextGameState(TypedDict):
+    next_state: GameState
+    is_complete: bool
+    tick_result: GameTick
+    sequence_id: int
+
+
+class ServerPacket(TypedDict, total=False):
+    type: str
+    payload: Any
+
+
+payload_types = {
+    "game_state": GameState,
+    "tick": GameTick,
+    "endgame_state": EndGameState,
+    "next_game_state": NextGameState,
+}
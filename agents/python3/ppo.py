@@ -0,0 +1,417 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import tensorflow as tf
+import create_cnn
+from gym import Gym
+from observation_encoder import ObservationEncoder, BLAST_DIAMETER_FEATURE, BOMBS_FEATURE, HP_FEATURE, NUM_FEATURES, NUM_PLANES, STUN_FEATURE
+from trajectory_buffer import TrajectoryBuffer
+
+buffer_directory = os.environ.get("TRAJECTORY_DIR") or "/app/data/trajectories"
+weights_path = os.environ.get("WEIGHTS_PATH") or "/app/data/ppo_weights.npz"
+# a game_state payload or an endgame_state packet, whose initial_state is used
+initial_state_path = os.environ.get(
+    "INITIAL_STATE_PATH") or "../replay.json"
+actor_count = int(os.environ.get("PPO_ACTORS")
+                  or max((os.cpu_count() or 2) - 1, 1))
+envs_per_actor = int(os.environ.get("PPO_ENVS_PER_ACTOR") or 8)
+rollout_size = int(os.environ.get("PPO_ROLLOUT_SIZE") or 4096)
+total_updates = int(os.environ.get("PPO_UPDATES") or 1000)
+
+num_actions = 6
+hidden_units = 64
+# units whose rows share one stream id block, see PPOActor
+_max_units = 16
+
+# engines can hand out practically unlimited bombs (9999), features are clipped to these and scaled to [0, 1]
+_feature_limits = np.ones(NUM_FEATURES, dtype=np.float32)
+_feature_limits[HP_FEATURE] = 5
+_feature_limits[BOMBS_FEATURE] = 10
+_feature_limits[BLAST_DIAMETER_FEATURE] = 10
+_feature_limits[STUN_FEATURE] = 10
+
+
+def normalize_features(non_spatial: np.ndarray) -> np.ndarray:
+    return np.minimum(non_spatial, _feature_limits) / _feature_limits
+
+
+def compute_gae(rewards: np.ndarray, values: np.ndarray, dones: np.ndarray, streams: np.ndarray, steps: np.ndarray,
+                gamma: float = 0.99, lam: float = 0.95) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Generalized advantage estimation over a whole rollout at once. Rows of
+    several trajectories may be interleaved, they are grouped by `streams`
+    and ordered by `steps`, then laid out as a (time, stream) matrix so the
+    backward recursion is one vectorized operation per time step instead of
+    a Python loop per row. The last row of a stream that is not done
+    bootstraps from its own value. Returns (advantages, returns) in the
+    order of the input rows.
+    """
+    order = np.lexsort((steps, streams))
+    stream_ids, columns = np.unique(streams[order], return_inverse=True)
+    counts = np.bincount(columns)
+    stream_starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    times = np.arange(len(order)) - stream_starts[columns]
+
+    shape = (counts.max() if len(counts) > 0 else 0, len(stream_ids))
+    grid_rewards = np.zeros(shape, dtype=np.float32)
+    grid_values = np.zeros(shape, dtype=np.float32)
+    grid_dones = np.ones(shape, dtype=np.float32)
+    grid_rewards[times, columns] = rewards[order]
+    grid_values[times, columns] = values[order]
+    grid_dones[times, columns] = dones[order]
+    # rows past the end of a stream act like a terminal state
+    next_values = np.zeros(shape, dtype=np.float32)
+    next_values[:-1] = grid_values[1:]
+    last = counts - 1
+    next_values[last, np.arange(len(stream_ids))] = grid_values[last, np.arange(len(stream_ids))]
+
+    not_done = 1 - grid_dones
+    deltas = grid_rewards + gamma * next_values * not_done - grid_values
+    grid_advantages = np.zeros(shape, dtype=np.float32)
+    advantage = np.zeros(shape[1], dtype=np.float32)
+    for time_index in range(shape[0] - 1, -1, -1):
+        advantage = deltas[time_index] + gamma * \
+            lam * not_done[time_index] * advantage
+        grid_advantages[time_index] = advantage
+
+    advantages = np.empty(len(order), dtype=np.float32)
+    advantages[order] = grid_advantages[times, columns]
+    return advantages, advantages + values
+
+
+def create_sample_fn(model):
+    """
+    compiled actor step: samples one action per row and returns
+    (actions, log_probs, values)
+    """
+    @tf.function
+    def sample_fn(spatial_data, non_spatial_data):
+        logits, values = model([spatial_data, non_spatial_data], training=False)
+        actions = tf.random.categorical(logits, 1, dtype=tf.int32)[:, 0]
+        log_probs = tf.gather(tf.nn.log_softmax(logits),
+                              actions, batch_dims=1)
+        return actions, log_probs, values[:, 0]
+    return sample_fn
+
+
+def save_weights(model, path: str):
+    # written next to the target and renamed, so actors never read half a file
+    temporary_path = f"{path}.tmp.npz"
+    np.savez(temporary_path, *model.get_weights())
+    os.replace(temporary_path, path)
+
+
+def load_weights(model, path: str):
+    with np.load(path) as weights:
+        model.set_weights([weights[f"arr_{index}"]
+                          for index in range(len(weights.files))])
+
+
+def load_initial_state(path: str) -> Dict:
+    with open(path) as file:
+        data = json.load(file)
+    if data.get("type") == "endgame_state":
+        return data.get("payload").get("initial_state")
+    return data
+
+
+class PPOLearner():
+    """
+    Clipped-objective PPO updates from a TrajectoryBuffer. Every update
+    waits for `rollout_size` new rows, computes advantages for all of them
+    with `compute_gae`, runs `epochs` passes of `train_step` (a
+    `tf.function`) over minibatches and publishes the new weights for the
+    actors. Rows may come from slightly older policies, the clipped ratio
+    against their recorded log probabilities keeps those updates bounded.
+    """
+
+    def __init__(self, model, buffer: TrajectoryBuffer, weights_path: str, rollout_size: int = 4096, batch_size: int = 256,
+                 epochs: int = 4, learning_rate: float = 3e-4, clip_ratio: float = 0.2, value_coefficient: float = 0.5,
+                 entropy_coefficient: float = 0.01, max_grad_norm: float = 0.5, gamma: float = 0.99, lam: float = 0.95,
+                 first_step: Optional[int] = None):
+        if rollout_size > buffer.capacity:
+            raise ValueError(
+                f"rollout size {rollout_size} exceeds the buffer capacity {buffer.capacity}")
+        self._model = model
+        self._buffer = buffer
+        self._weights_path = weights_path
+        self._rollout_size = rollout_size
+        self._batch_size = batch_size
+        self._epochs = epochs
+        self._gamma = gamma
+        self._lam = lam
+        self._optimizer = tf.keras.optimizers.Adam(learning_rate)
+        # by default only rows appended from now on are trained on
+        self._next_step = buffer.total_steps if first_step is None else first_step
+        self._clip_ratio = clip_ratio
+        self._value_coefficient = value_coefficient
+        self._entropy_coefficient = entropy_coefficient
+        self._max_grad_norm = max_grad_norm
+        self.train_step = tf.function(
+            self._train_step, reduce_retracing=True)
+
+    def _train_step(self, spatial, non_spatial, actions, old_log_probs, advantages, returns):
+        with tf.GradientTape() as tape:
+            logits, values = self._model(
+                [spatial, non_spatial], training=True)
+            all_log_probs = tf.nn.log_softmax(logits)
+            log_probs = tf.gather(all_log_probs, actions, batch_dims=1)
+            ratio = tf.exp(log_probs - old_log_probs)
+            clipped_ratio = tf.clip_by_value(
+                ratio, 1 - self._clip_ratio, 1 + self._clip_ratio)
+            policy_loss = -tf.reduce_mean(tf.minimum(ratio *
+                                          advantages, clipped_ratio * advantages))
+            value_loss = tf.reduce_mean(tf.square(returns - values[:, 0]))
+            entropy = -tf.reduce_mean(tf.reduce_sum(
+                tf.exp(all_log_probs) * all_log_probs, axis=-1))
+            loss = policy_loss + self._value_coefficient * \
+                value_loss - self._entropy_coefficient * entropy
+        variables = self._model.trainable_variables
+        gradients, _ = tf.clip_by_global_norm(
+            tape.gradient(loss, variables), self._max_grad_norm)
+        self._optimizer.apply_gradients(zip(gradients, variables))
+        return policy_loss, value_loss, entropy
+
+    """
+    blocks until the next rollout is complete in the buffer, trains on it
+    and returns its statistics
+    """
+    def update(self, poll_interval: float = 0.05) -> Dict[str, float]:
+        wait_start = time.perf_counter()
+        window = self._wait_for_rollout(poll_interval)
+        update_start = time.perf_counter()
+        steps = self._next_step + np.arange(self._rollout_size)
+        positions = steps % self._buffer.capacity
+        fields = self._buffer.fields
+        rewards = fields["reward"][positions]
+        values = fields["value"][positions]
+        advantages, returns = compute_gae(rewards, values, fields["done"][positions],
+                                          fields["stream"][positions], steps, self._gamma, self._lam)
+        advantages = (advantages - advantages.mean()) / \
+            (advantages.std() + 1e-8)
+
+        losses = []
+        for _ in range(self._epochs):
+            for start, stop in window:
+                batch = self._buffer.get(start, stop)
+                # offsets of the batch rows within the rollout
+                offset = (start - positions[0]) % self._buffer.capacity
+                rows = slice(offset, offset + stop - start)
+                losses.append(self.train_step(batch["spatial"], batch["non_spatial"], batch["action"], batch["log_prob"],
+                                              advantages[rows], returns[rows]))
+        save_weights(self._model, self._weights_path)
+        self._next_step += self._rollout_size
+        update_time = time.perf_counter() - update_start
+        policy_loss, value_loss, entropy = np.mean(losses, axis=0)
+        return {"samples": self._rollout_size, "wait_time": update_start - wait_start, "update_time": update_time,
+                "policy_loss": float(policy_loss), "value_loss": float(value_loss), "entropy": float(entropy),
+                "mean_reward": float(rewards.mean())}
+
+    def _wait_for_rollout(self, poll_interval: float) -> List[Tuple[int, int]]:
+        # actors may lag behind: skip rows that were overwritten before they were used
+        oldest_step = self._buffer.total_steps - self._buffer.capacity
+        if self._next_step < oldest_step:
+            self._next_step = oldest_step
+        steps = self._next_step + np.arange(self._rollout_size)
+        positions = steps % self._buffer.capacity
+        while not np.array_equal(self._buffer.fields["step"][positions], steps):
+            time.sleep(poll_interval)
+        # minibatches are contiguous slices of the files, shuffled at minibatch level
+        window = []
+        start = int(positions[0])
+        end = start + self._rollout_size
+        for batch_start in range(start, end, self._batch_size):
+            batch_stop = min(batch_start + self._batch_size, end)
+            if batch_start < self._buffer.capacity < batch_stop:
+                window.append((batch_start, self._buffer.capacity))
+                window.append((0, batch_stop - self._buffer.capacity))
+            else:
+                window.append((batch_start % self._buffer.capacity,
+                               (batch_stop - 1) % self._buffer.capacity + 1))
+        np.random.shuffle(window)
+        return window
+
+
+class PPOActor():
+    """
+    Self-play rollouts on a VecEnv of `envs` copies of `initial_state`,
+    stepped with the in-process forward model. Both agents act with the
+    latest published weights (reloaded whenever the weights file changes)
+    and every unit step becomes one buffer row. A unit's rows form one
+    stream, `actor_id` keeps the streams of different actors apart.
+
+    The reward of every unit is the change of its team's total hp minus the
+    change of the enemy team's, plus 1 / -1 for the team ahead at the end.
+    """
+
+    def __init__(self, model, buffer: TrajectoryBuffer, weights_path: str, initial_state: Dict, envs: int = 8,
+                 actor_id: int = 0, seed: Optional[int] = None):
+        self._model = model
+        self._sample = create_sample_fn(model)
+        self._buffer = buffer
+        self._weights_path = weights_path
+        self._weights_mtime = None
+        self._initial_state = initial_state
+        self._envs = envs
+        self._actor_id = actor_id
+        self._gym = Gym(None, seed=seed)
+        self._agent_ids = list(initial_state.get("agents").keys())
+        self._encoders = [ObservationEncoder(agent_id)
+                          for agent_id in self._agent_ids]
+        self.steps = 0
+
+    async def run(self, max_steps: Optional[int] = None):
+        vec_env = self._gym.make_vec(
+            f"ppo_actor_{self._actor_id}", [self._initial_state] * self._envs)
+        states = [self._initial_state] * self._envs
+        while max_steps is None or self.steps < max_steps:
+            self._reload_weights()
+            spatial, non_spatial, rows = self._encode(states)
+            if len(rows) == 0:
+                # every unit is down, the games end without further actions
+                states = [self._initial_state if done else next_state for next_state, done in zip(
+                    *(await vec_env.step([[] for _ in states]))[:2])]
+                continue
+            actions, log_probs, values = [tensor.numpy() for tensor in self._sample(
+                tf.constant(spatial), tf.constant(non_spatial))]
+            env_actions = [[] for _ in states]
+            for row, (env, agent_id, unit_id, _) in enumerate(rows):
+                packet = self._to_packet(
+                    states[env], agent_id, unit_id, actions[row])
+                if packet is not None:
+                    env_actions[env].append(packet)
+            next_states, dones, _ = await vec_env.step(env_actions)
+
+            rewards, row_dones = self._get_rewards(
+                states, next_states, dones, rows)
+            self._buffer.append(spatial, non_spatial, actions, log_probs, rewards, row_dones, values,
+                                [stream for _, _, _, stream in rows])
+            self.steps += len(rows)
+            states = [self._initial_state if done else next_state for next_state,
+                      done in zip(next_states, dones)]
+
+    def _reload_weights(self):
+        try:
+            mtime = os.stat(self._weights_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._weights_mtime:
+            load_weights(self._model, self._weights_path)
+            self._weights_mtime = mtime
+
+    def _encode(self, states: List[Dict]):
+        spatial = []
+        non_spatial = []
+        rows = []
+        for env, state in enumerate(states):
+            for agent_index, (agent_id, encoder) in enumerate(zip(self._agent_ids, self._encoders)):
+                encoder.on_game_state(state)
+                env_spatial, env_non_spatial = encoder.get_inputs(
+                    state.get("tick"))
+                for unit_index, unit_id in enumerate(encoder.unit_ids):
+                    if state.get("unit_state").get(unit_id).get("hp") <= 0:
+                        continue
+                    # the encoders' buffers are reused for the next state
+                    spatial.append(env_spatial[0].copy())
+                    non_spatial.append(env_non_spatial[unit_index].copy())
+                    stream = ((self._actor_id * self._envs + env) * len(self._agent_ids) + agent_index) * \
+                        _max_units + unit_index
+                    rows.append((env, agent_id, unit_id, stream))
+        return np.array(spatial, dtype=np.float32), normalize_features(np.array(non_spatial, dtype=np.float32)), rows
+
+    def _to_packet(self, state: Dict, agent_id: str, unit_id: str, action: int) -> Optional[Dict]:
+        if action < 4:
+            packet = {"type": "move", "move": [
+                "up", "right", "down", "left"][action], "unit_id": unit_id}
+        elif action == 4:
+            packet = {"type": "bomb", "unit_id": unit_id}
+        else:
+            bomb = next((entity for entity in state.get("entities") if entity.get(
+                "type") == "b" and entity.get("unit_id") == unit_id), None)
+            if bomb is None:
+                return None
+            packet = {"type": "detonate", "coordinates": [
+                bomb.get("x"), bomb.get("y")], "unit_id": unit_id}
+        return {"agent_id": agent_id, "action": packet}
+
+    def _get_rewards(self, states: List[Dict], next_states: List[Dict], dones: List[bool], rows):
+        team_rewards = []
+        for state, next_state, done in zip(states, next_states, dones):
+            hp_changes = {agent_id: 0 for agent_id in self._agent_ids}
+            final_hp = {agent_id: 0 for agent_id in self._agent_ids}
+            for unit_id, unit in next_state.get("unit_state").items():
+                hp = max(unit.get("hp"), 0)
+                hp_before = max(state.get("unit_state").get(
+                    unit_id).get("hp"), 0)
+                hp_changes[unit.get("agent_id")] += hp - hp_before
+                final_hp[unit.get("agent_id")] += hp
+            rewards = {}
+            for agent_id in self._agent_ids:
+                enemy_ids = [other for other in self._agent_ids if other != agent_id]
+                reward = hp_changes[agent_id] - \
+                    sum(hp_changes[other] for other in enemy_ids)
+                if done:
+                    reward += np.sign(final_hp[agent_id] -
+                                      max(final_hp[other] for other in enemy_ids))
+                rewards[agent_id] = reward
+            team_rewards.append(rewards)
+        rewards = np.array([team_rewards[env][agent_id]
+                           for env, agent_id, _, _ in rows], dtype=np.float32)
+        row_dones = np.array([dones[env] or next_states[env].get("unit_state").get(
+            unit_id).get("hp") <= 0 for env, _, unit_id, _ in rows], dtype=bool)
+        return rewards, row_dones
+
+
+def _create_model(initial_state: Dict):
+    world = initial_state.get("world")
+    input_shape = (world.get("height"), world.get("width"), NUM_PLANES)
+    return create_cnn.create_actor_critic(input_shape, NUM_FEATURES, num_actions, hidden_units), input_shape
+
+
+def _run_actor(actor_id: int, initial_state: Dict, capacity: int):
+    model, input_shape = _create_model(initial_state)
+    buffer = TrajectoryBuffer(
+        buffer_directory, capacity, input_shape, NUM_FEATURES)
+    actor = PPOActor(model, buffer, weights_path, initial_state,
+                     envs_per_actor, actor_id, seed=actor_id)
+    asyncio.run(actor.run())
+
+
+def main():
+    initial_state = load_initial_state(initial_state_path)
+    capacity = rollout_size * 4
+    model, input_shape = _create_model(initial_state)
+    buffer = TrajectoryBuffer(
+        buffer_directory, capacity, input_shape, NUM_FEATURES)
+    save_weights(model, weights_path)
+    learner = PPOLearner(model, buffer, weights_path, rollout_size)
+
+    # actors run in their own processes and only share the buffer files and the weights file
+    context = multiprocessing.get_context("spawn")
+    actors = [context.Process(target=_run_actor, args=(actor_id, initial_state, capacity), daemon=True)
+              for actor_id in range(actor_count)]
+    for actor in actors:
+        actor.start()
+
+    last_report = time.perf_counter()
+    last_steps = buffer.total_steps
+    for update in range(total_updates):
+        stats = learner.update()
+        now = time.perf_counter()
+        samples_per_second = (buffer.total_steps - last_steps) / \
+            (now - last_report)
+        last_report, last_steps = now, buffer.total_steps
+        print(f"update {update}: {samples_per_second:.0f} samples/s from {actor_count} actors, update {stats['update_time'] * 1000:.0f}ms "
+              f"(waited {stats['wait_time'] * 1000:.0f}ms), policy loss {stats['policy_loss']:.3f}, value loss {stats['value_loss']:.3f}, "
+              f"entropy {stats['entropy']:.3f}, mean reward {stats['mean_reward']:.3f}")
+    for actor in actors:
+        actor.terminate()
+    buffer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+from typing import Callable, Optional
+import asyncio
+import os
+import random
+import time
+import websockets.exceptions
+
+# first reconnect attempts come quickly so a dropped connection resumes within a tick,
+# the delay doubles (with full jitter) up to the maximum while the engine stays unreachable
+initial_delay = float(os.environ.get("RECONNECT_INITIAL_DELAY") or 0.05)
+max_delay = float(os.environ.get("RECONNECT_MAX_DELAY") or 5.0)
+
+# games an entry point finishes before it exits, like the old `for i in range(0,10)` loops
+max_games = int(os.environ.get("RECONNECT_MAX_GAMES") or 10)
+
+_connect_errors = (OSError, asyncio.TimeoutError,
+                   websockets.exceptions.WebSocketException)
+
+
+class Backoff:
+    """
+    Exponential backoff with full jitter: attempt n waits a uniformly random
+    time up to `initial_delay * 2^n`, capped at `max_delay`, so clients that
+    lost the engine together do not all come back in the same instant.
+    """
+
+    def __init__(self, initial_delay: float = initial_delay, max_delay: float = max_delay,
+                 rng: Optional[random.Random] = None):
+        self._initial_delay = initial_delay
+        self._max_delay = max_delay
+        self._rng = rng or random.Random()
+        self.attempts = 0
+
+    def next_delay(self) -> float:
+        delay = min(self._max_delay, self._initial_delay * 2 ** self.attempts)
+        self.attempts += 1
+        return self._rng.uniform(0, delay)
+
+    def reset(self):
+        self.attempts = 0
+
+
+"""
+awaits `connect()` until it returns an open connection, sleeping
+`backoff.next_delay()` after every failed attempt. The backoff is not
+reset here: a connection the server closes straight away is no success
+"""
+async def connect_with_backoff(connect: Callable, backoff: Backoff):
+    while True:
+        error = None
+        try:
+            connection = await connect()
+        except _connect_errors as e:
+            connection = None
+            error = e
+        if connection is not None:
+            return connection
+        delay = backoff.next_delay()
+        print(f"connecting failed ({error or 'closed by the server'}), retrying in {delay:.2f}s")
+        await asyncio.sleep(delay)
+
+
+"""
+the reconnect loop of GameState.run and AdminState.run: handles
+connections of `client` until it finished `max_games` games (None for no
+limit), starting with `connection` if one is already open. A connection
+that closes after an endgame_state is the normal end of a game; one that
+closes before is an outage, reported with `client._on_reconnected(outage)`
+once a new connection is open. Connections closed before the engine sent
+a game_state (a rejected agent, an engine still starting) are retried
+with the same growing backoff as failed connects
+"""
+async def run_games(client, max_games: Optional[int], connection=None):
+    games = 0
+    disconnected_at: Optional[float] = None
+    while max_games is None or games < max_games:
+        if connection is None:
+            connection = await client.connect_with_backoff()
+        if disconnected_at is not None:
+            await client._on_reconnected(time.perf_counter() - disconnected_at)
+            disconnected_at = None
+        games_finished = client.games_finished
+        game_states_received = client.game_states_received
+        await client._handle_messages(connection)
+        connection = None
+        if client.game_states_received > game_states_received:
+            client._backoff.reset()
+        else:
+            delay = client._backoff.next_delay()
+            print(f"connection closed before the game started, retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+        if client.games_finished > games_finished:
+            games += client.games_finished - games_finished
+        else:
+            disconnected_at = time.perf_counter()
@@ -0,0 +1,203 @@
+from json_codec import decode_packet, dumps
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+import asyncio
+import json
+import os
+import time
+import websockets
+
+replay_path = os.environ.get("REPLAY_PATH") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "replay.json")
+
+port = int(os.environ.get("PORT") or 3000)
+
+# "ack" sends the next tick once the agent answered the last one, "max" sends ticks back to back,
+# a number plays at that multiple of the recorded tick rate
+replay_speed = os.environ.get("REPLAY_SPEED") or "ack"
+
+# in "ack" mode, seconds to wait for an agent that sends nothing before moving on
+ack_timeout = float(os.environ.get("REPLAY_ACK_TIMEOUT") or 1.0)
+
+# actions received from the agents are appended to this file as json lines
+record_path = os.environ.get("REPLAY_RECORD_PATH")
+
+# same format and default as the engine's AGENT_SECRET_ID_MAP
+agent_secret_id_map: Dict[str, str] = json.loads(
+    os.environ.get("AGENT_SECRET_ID_MAP") or '{"agentA": "a", "agentB": "b"}')
+
+
+class ReplaySession:
+    """
+    One connection to a ReplayServer: which agent it played, the actions it
+    sent as {"tick", "agent_id", "time", "packet"} (tick is the last tick
+    sent before the action arrived) and how fast it went.
+    """
+
+    def __init__(self, connection_id: int, agent_id: Optional[str]):
+        self.connection_id = connection_id
+        self.agent_id = agent_id
+        self.actions: List[Dict] = []
+        self.ticks_sent = 0
+        self.acks_timed_out = 0
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+
+    @property
+    def duration(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def ticks_per_second(self) -> float:
+        return self.ticks_sent / self.duration if self.duration > 0 else 0.0
+
+
+class ReplayServer:
+    """
+    Stands in for the engine by replaying a recorded `endgame_state` packet
+    (its `initial_state` and `history`) to every client that connects, with
+    the engine's packet format: a `game_state` with the client's
+    `connection`, one `tick` per tick number (ticks the recording left out
+    because nothing happened are sent with no events), then the
+    `endgame_state`, after which the connection is closed.
+
+    `speed` is "ack" (send the next tick once the client has sent its
+    actions for the last one and gone quiet for `ack_quiet` seconds, or
+    after `ack_timeout` seconds), "max" (no waiting at all) or a multiple
+    of the recorded tick rate. Every client replays the whole game on its
+    own, so several agents can be measured in parallel; the ticks never
+    depend on what a client sends, only the actions are recorded (in
+    `sessions`).
+    """
+
+    def __init__(self, endgame_payload: Dict, speed="ack", ack_timeout: float = 1.0, ack_quiet: float = 0.001,
+                 agent_secret_id_map: Optional[Dict[str, str]] = None):
+        self._payload = endgame_payload
+        self._speed = speed
+        self._ack_timeout = ack_timeout
+        self._ack_quiet = ack_quiet
+        self._agent_secret_id_map = agent_secret_id_map or {}
+        initial_state = endgame_payload.get("initial_state")
+        self._initial_state = {key: value for key,
+                               value in initial_state.items() if key != "connection"}
+        self._tick_rate_hz = initial_state.get("config").get("tick_rate_hz")
+        self._initial_tick = initial_state.get("tick")
+        self._raw_ticks = _get_raw_ticks(
+            self._initial_tick, endgame_payload.get("history"))
+        self._raw_endgame = dumps(
+            {"type": "endgame_state", "payload": endgame_payload})
+        self._next_connection_id = 0
+        self.sessions: List[ReplaySession] = []
+        self._session_callback = None
+
+    """
+    `session_callback(session)` is awaited after every finished replay
+    """
+    def set_session_callback(self, session_callback):
+        self._session_callback = session_callback
+
+    async def serve(self, host: str = "0.0.0.0", port: int = 3000):
+        return await websockets.serve(self._handle_connection, host, port)
+
+    async def _handle_connection(self, connection, path: Optional[str] = None):
+        query = parse_qs(urlparse(path or connection.path).query)
+        role = (query.get("role") or ["agent"])[0]
+        agent_secret = (query.get("agentId") or [None])[0]
+        agent_id = self._agent_secret_id_map.get(agent_secret, agent_secret)
+        if role == "agent" and agent_id not in self._initial_state.get("agents"):
+            await connection.close(1008, f"unknown agentId {agent_secret}")
+            return
+        session = ReplaySession(self._next_connection_id,
+                                agent_id if role == "agent" else None)
+        self._next_connection_id += 1
+        self.sessions.append(session)
+
+        packets: asyncio.Queue = asyncio.Queue()
+        reader = asyncio.ensure_future(
+            self._read_actions(connection, session, packets))
+        try:
+            await connection.send(dumps({"type": "game_state", "payload": {
+                **self._initial_state,
+                "connection": {"id": session.connection_id, "role": role, "agent_id": session.agent_id},
+            }}))
+            session.started = time.perf_counter()
+            await self._send_ticks(connection, session, packets)
+            await connection.send(self._raw_endgame)
+            session.finished = time.perf_counter()
+            await connection.close()
+        except websockets.exceptions.ConnectionClosed:
+            session.finished = time.perf_counter()
+        finally:
+            reader.cancel()
+        print(f"connection {session.connection_id} ({session.agent_id}): {session.ticks_sent} ticks in "
+              f"{session.duration:.2f}s ({session.ticks_per_second:.0f} ticks/s), {len(session.actions)} actions, "
+              f"{session.acks_timed_out} ack timeouts")
+        if self._session_callback is not None:
+            await self._session_callback(session)
+
+    async def _send_ticks(self, connection, session: ReplaySession, packets: asyncio.Queue):
+        loop = asyncio.get_event_loop()
+        speed = self._speed
+        period = None if speed in ("ack", "max") else 1 / \
+            (self._tick_rate_hz * float(speed))
+        start = loop.time()
+        for index, raw_tick in enumerate(self._raw_ticks):
+            if period is not None:
+                delay = start + index * period - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await connection.send(raw_tick)
+            session.ticks_sent += 1
+            if speed == "ack":
+                await self._wait_for_ack(session, packets)
+
+    async def _wait_for_ack(self, session: ReplaySession, packets: asyncio.Queue):
+        try:
+            await asyncio.wait_for(packets.get(), self._ack_timeout)
+        except asyncio.TimeoutError:
+            session.acks_timed_out += 1
+            return
+        # the other actions of the tick are usually already on their way
+        while True:
+            try:
+                await asyncio.wait_for(packets.get(), self._ack_quiet)
+            except asyncio.TimeoutError:
+                return
+
+    async def _read_actions(self, connection, session: ReplaySession, packets: asyncio.Queue):
+        try:
+            async for raw_data in connection:
+                session.actions.append({"tick": self._initial_tick + session.ticks_sent, "agent_id": session.agent_id,
+                                        "time": time.perf_counter() - session.started, "packet": decode_packet(raw_data)})
+                packets.put_nowait(raw_data)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+
+def _get_raw_ticks(initial_tick: int, history: List[Dict]) -> List[str]:
+    events_by_tick = {tick.get("tick"): tick.get("events") for tick in history}
+    last_tick = max(events_by_tick.keys(), default=initial_tick)
+    return [dumps({"type": "tick", "payload": {"tick": tick, "events": events_by_tick.get(tick, [])}})
+            for tick in range(initial_tick + 1, last_tick + 1)]
+
+
+def main():
+    with open(replay_path) as replay_file:
+        payload = decode_packet(replay_file.read()).get("payload")
+    server = ReplayServer(payload, replay_speed, ack_timeout,
+                          agent_secret_id_map=agent_secret_id_map)
+    if record_path:
+        async def write_session(session: ReplaySession):
+            with open(record_path, "a") as record_file:
+                for action in session.actions:
+                    record_file.write(
+                        dumps({**action, "connection_id": session.connection_id}) + "\n")
+        server.set_session_callback(write_session)
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(server.serve(port=port))
+    print(f"replaying {replay_path} on port {port} at speed {replay_speed}")
+    loop.run_forever()
+
+
+if __name__ == "__main__":
+    main()
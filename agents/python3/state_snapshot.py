@@ -0,0 +1,215 @@
+from collections import deque
+from collections.abc import Mapping, Sequence
+from itertools import chain
+from types import MappingProxyType
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+_move_deltas = {"up": (0, 1), "down": (0, -1),
+                "left": (-1, 0), "right": (1, 0)}
+
+
+def freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+# mutable (json compatible) copy of a frozen value or snapshot
+def thaw(value):
+    if isinstance(value, Mapping):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, (tuple, EntitiesView)):
+        return [thaw(item) for item in value]
+    return value
+
+
+class EntitiesView(Sequence):
+    """
+    read-only sequence of all entities of a snapshot, row by row (y = 0
+    first), entities of a row in the order they were added
+    """
+
+    def __init__(self, rows: Tuple[Tuple[Mapping, ...], ...]):
+        self._rows = rows
+        self._length: Optional[int] = None
+
+    def __len__(self) -> int:
+        if self._length is None:
+            self._length = sum(len(row) for row in self._rows)
+        return self._length
+
+    def __iter__(self) -> Iterator[Mapping]:
+        return chain.from_iterable(self._rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(self)[index]
+        if index < 0:
+            index += len(self)
+        for row in self._rows:
+            if index < len(row):
+                return row[index]
+            index -= len(row)
+        raise IndexError("entity index out of range")
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, EntitiesView):
+            return self._rows == other._rows
+        if isinstance(other, (list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+
+class StateSnapshot(Mapping):
+    """
+    Immutable game state of one tick that reads like the state dict
+    (`snapshot.get("unit_state").get("c").get("hp")`, `for entity in
+    snapshot.get("entities")`), with dicts frozen as read-only mappings and
+    lists as tuples.
+
+    Changes return a new snapshot that shares everything they did not touch
+    with the old one: units are kept in a mapping of unit_id to frozen unit
+    and entities in one tuple per map row, so an event copies the unit
+    mapping or one row plus the tuple of rows, never the whole state.
+    Keeping a history or branching a search tree from a snapshot therefore
+    costs only the size of the changes.
+    """
+
+    __slots__ = ("_fields", "_units", "_rows")
+
+    def __init__(self, fields: Mapping, units: Mapping, rows: Tuple[Tuple[Mapping, ...], ...]):
+        self._fields = fields
+        self._units = units
+        self._rows = rows
+
+    @classmethod
+    def from_state(cls, state: Dict) -> "StateSnapshot":
+        fields = {key: freeze(value) for key, value in state.items()
+                  if key not in ("unit_state", "entities")}
+        rows: List[List[Mapping]] = [
+            [] for _ in range(state.get("world").get("height"))]
+        for entity in state.get("entities"):
+            rows[entity.get("y")].append(freeze(entity))
+        return cls(MappingProxyType(fields), freeze(state.get("unit_state")), tuple(tuple(row) for row in rows))
+
+    def __getitem__(self, key: str):
+        if key == "unit_state":
+            return self._units
+        if key == "entities":
+            return EntitiesView(self._rows)
+        return self._fields[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return chain(self._fields, ("unit_state", "entities"))
+
+    def __len__(self) -> int:
+        return len(self._fields) + 2
+
+    def __repr__(self) -> str:
+        return f"StateSnapshot(tick={self._fields.get('tick')}, units={len(self._units)}, entities={len(self['entities'])})"
+
+    @property
+    def tick(self) -> int:
+        return self._fields.get("tick")
+
+    def get_at(self, x: int, y: int) -> List[Mapping]:
+        return [entity for entity in self._rows[y] if entity.get("x") == x]
+
+    def with_tick(self, tick: int) -> "StateSnapshot":
+        return StateSnapshot(MappingProxyType({**self._fields, "tick": tick}), self._units, self._rows)
+
+    def with_unit(self, unit: Dict) -> "StateSnapshot":
+        units = dict(self._units)
+        units[unit.get("unit_id")] = freeze(unit)
+        return StateSnapshot(self._fields, MappingProxyType(units), self._rows)
+
+    def with_unit_moved(self, unit_id: str, move: str) -> "StateSnapshot":
+        unit = self._units[unit_id]
+        x, y = unit.get("coordinates")
+        dx, dy = _move_deltas[move]
+        return self.with_unit({**unit, "coordinates": [x + dx, y + dy]})
+
+    def with_entity(self, entity: Dict) -> "StateSnapshot":
+        y = entity.get("y")
+        return self._with_row(y, self._rows[y] + (freeze(entity),))
+
+    def without_entities_at(self, x: int, y: int) -> "StateSnapshot":
+        row = self._rows[y]
+        kept = tuple(entity for entity in row if entity.get("x") != x)
+        if len(kept) == len(row):
+            return self
+        return self._with_row(y, kept)
+
+    def with_entity_at(self, x: int, y: int, entity: Dict) -> "StateSnapshot":
+        return self.without_entities_at(x, y).with_entity(entity)
+
+    """
+    snapshot after one tick event, applied the same way GameState applies
+    it to the live state
+    """
+    def apply_event(self, event: Dict) -> "StateSnapshot":
+        event_type = event.get("type")
+        if event_type == "entity_spawned":
+            return self.with_entity(event.get("data"))
+        if event_type == "entity_expired":
+            x, y = event.get("data")
+            return self.without_entities_at(x, y)
+        if event_type == "unit_state":
+            return self.with_unit(event.get("data"))
+        if event_type == "entity_state":
+            x, y = event.get("coordinates")
+            return self.with_entity_at(x, y, event.get("updated_entity"))
+        if event_type == "unit":
+            action = event.get("data")
+            if action.get("type") == "move" and action.get("move") in _move_deltas:
+                return self.with_unit_moved(action.get("unit_id"), action.get("move"))
+        return self
+
+    def apply_tick(self, tick: int, events: List[Dict]) -> "StateSnapshot":
+        snapshot = self
+        for event in events:
+            snapshot = snapshot.apply_event(event)
+        return snapshot.with_tick(tick)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return thaw(self)
+
+    def _with_row(self, y: int, row: Tuple[Mapping, ...]) -> "StateSnapshot":
+        rows = self._rows
+        return StateSnapshot(self._fields, self._units, rows[:y] + (row,) + rows[y + 1:])
+
+
+class SnapshotHistory:
+    """
+    The last `length` snapshots of the current game, oldest first, kept up
+    to date by GameState (see `GameState.enable_snapshots`). `latest` is the
+    snapshot of the last tick, `get_tick(tick)` finds an older one
+    """
+
+    def __init__(self, length: int = 1):
+        self.snapshots: Deque[StateSnapshot] = deque(maxlen=length)
+
+    def __len__(self) -> int:
+        return len(self.snapshots)
+
+    def __getitem__(self, index: int) -> StateSnapshot:
+        return self.snapshots[index]
+
+    @property
+    def latest(self) -> Optional[StateSnapshot]:
+        return self.snapshots[-1] if len(self.snapshots) > 0 else None
+
+    def get_tick(self, tick: int) -> Optional[StateSnapshot]:
+        for snapshot in reversed(self.snapshots):
+            if snapshot.tick == tick:
+                return snapshot
+        return None
+
+    def on_game_state(self, game_state: Dict):
+        self.snapshots.clear()
+        self.snapshots.append(StateSnapshot.from_state(game_state))
+
+    def on_tick(self, tick: int, events: List[Dict]):
+        self.snapshots.append(self.snapshots[-1].apply_tick(tick, events))
@@ -0,0 +1,46 @@
+import os
+import unittest
+from benchmark import find_regressions, format_results, load_tick_streams, run_benchmarks
+
+try:
+    import tensorflow
+except ImportError:
+    tensorflow = None
+
+replay_path = os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), "..", "replay.json")
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_runs_every_client_benchmark(self):
+        streams = load_tick_streams([replay_path])
+        names = ["json_decode", "game_state_apply", "admin_state_apply",
+                 "forward_model_encode", "observation_encode"]
+        results = run_benchmarks(streams, repeat=1, names=names)
+        self.assertEqual(list(results.keys()), names)
+        for result in results.values():
+            self.assertEqual(result["ticks"], len(streams[0]))
+            self.assertGreater(result["us_per_tick"], 0)
+            self.assertGreater(result["bytes_per_tick"], 0)
+        self.assertIn("game_state_apply", format_results(results, results))
+        self.assertEqual(find_regressions(results, results), [])
+
+    @unittest.skipIf(tensorflow is None, "tensorflow is not installed")
+    def test_runs_the_inference_benchmark(self):
+        streams = load_tick_streams([replay_path])
+        result = run_benchmarks(streams, repeat=1, names=["cnn_inference"]).get("cnn_inference")
+        self.assertEqual(result["ticks"], len(streams[0]))
+        self.assertGreater(result["us_per_tick"], 0)
+
+    def test_find_regressions(self):
+        baseline = {"a": {"us_per_tick": 10.0, "bytes_per_tick": 1000.0},
+                    "b": {"us_per_tick": 10.0, "bytes_per_tick": 1000.0}}
+        results = {"a": {"us_per_tick": 11.0, "bytes_per_tick": 2000.0},
+                   "b": {"us_per_tick": 13.0, "bytes_per_tick": 900.0},
+                   "c": {"us_per_tick": 100.0, "bytes_per_tick": 100.0}}
+        self.assertEqual(find_regressions(results, baseline, 0.2), [
+            ("a", "bytes_per_tick", 1000.0, 2000.0), ("b", "us_per_tick", 10.0, 13.0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+import numpy as np
+from observation_encoder import NUM_FEATURES, NUM_PLANES
+
+try:
+    import create_cnn
+except ImportError:
+    create_cnn = None
+
+input_shape = (15, 15, NUM_PLANES)
+num_actions = 6
+
+
+@unittest.skipIf(create_cnn is None, "tensorflow is not installed")
+class TestCreatePolicyFn(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.model = create_cnn.create_cnn(input_shape, NUM_FEATURES, num_actions, 16)
+        rng = np.random.default_rng(0)
+        cls.spatial = rng.random((1, *input_shape), dtype=np.float32)
+        cls.non_spatial = rng.random((3, NUM_FEATURES), dtype=np.float32)
+
+    def test_greedy_actions_match_the_model(self):
+        policy_fn = create_cnn.create_policy_fn(self.model, input_shape, NUM_FEATURES)
+        actions, probabilities = policy_fn(self.spatial, self.non_spatial)
+        expected = self.model([np.repeat(self.spatial, 3, axis=0), self.non_spatial], training=False).numpy()
+        np.testing.assert_allclose(probabilities.numpy(), expected, atol=1e-5)
+        np.testing.assert_array_equal(actions.numpy(), np.argmax(expected, axis=1))
+
+    def test_unit_count_changes_do_not_retrace(self):
+        policy_fn = create_cnn.create_policy_fn(self.model, input_shape, NUM_FEATURES)
+        self.assertEqual(policy_fn.experimental_get_tracing_count(), 1)
+        for units in (1, 3, 2):
+            actions, probabilities = policy_fn(self.spatial, self.non_spatial[:units])
+            self.assertEqual(actions.shape, (units,))
+            self.assertEqual(probabilities.shape, (units, num_actions))
+        self.assertEqual(policy_fn.experimental_get_tracing_count(), 1)
+
+    def test_sampled_actions_are_valid(self):
+        policy_fn = create_cnn.create_policy_fn(self.model, input_shape, NUM_FEATURES, greedy=False)
+        for _ in range(5):
+            actions, _ = policy_fn(self.spatial, self.non_spatial)
+            self.assertEqual(actions.shape, (3,))
+            self.assertTrue(((actions.numpy() >= 0) & (actions.numpy() < num_actions)).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import copy
+import random
+import unittest
+from unittest import IsolatedAsyncioTestCase
+from danger_map import NO_DANGER, NO_OWNER, DangerMap
+from game_state import GameState
+from local_forward_model import default_config, evaluate_next_state
+from test_game_state import create_mock_tick_packet
+
+config = {**default_config, "object_destruction_item_drop_probability": 0.0}
+
+
+def unit(unit_id, agent_id, x, y, blast_diameter):
+    return {"coordinates": [x, y], "hp": 3, "inventory": {"bombs": 3}, "blast_diameter": blast_diameter, "unit_id": unit_id,
+            "agent_id": agent_id, "invulnerable": 0, "stunned": 0}
+
+
+def bomb(x, y, created, unit_id, agent_id, blast_diameter=3):
+    return {"created": created, "x": x, "y": y, "type": "b", "unit_id": unit_id, "agent_id": agent_id,
+            "expires": created + config["bomb_duration_ticks"], "hp": 1, "blast_diameter": blast_diameter}
+
+
+# c's bomb at (1, 1) goes first and sets off d's bombs at (3, 1) and, through it, (3, 4). The wood at
+# (5, 1) stops the blast of (3, 1) and is gone when the bomb at (5, 2) goes off, the metal at (5, 4) is not.
+# The forward model gives bombs the blast diameter of the owner's first unit, so every agent has one size
+mock_state = {
+    "game_id": "danger",
+    "agents": {"a": {"agent_id": "a", "unit_ids": ["c"]}, "b": {"agent_id": "b", "unit_ids": ["d"]}},
+    "unit_state": {"c": unit("c", "a", 0, 6, 5), "d": unit("d", "b", 6, 6, 7)},
+    "entities": [
+        bomb(1, 1, 0, "c", "a", blast_diameter=5),
+        bomb(3, 1, 5, "d", "b", blast_diameter=7),
+        bomb(3, 4, 9, "d", "b", blast_diameter=7),
+        bomb(5, 2, 12, "c", "a", blast_diameter=5),
+        {"created": 0, "x": 5, "y": 1, "type": "w", "hp": 1},
+        {"created": 0, "x": 5, "y": 4, "type": "m"},
+        {"created": 0, "x": 1, "y": 3, "type": "o", "hp": 3},
+    ],
+    "world": {"width": 7, "height": 7},
+    "tick": 0,
+    "config": {"tick_rate_hz": 10, "game_duration_ticks": 300, "fire_spawn_interval_ticks": 2},
+}
+
+
+class TestDangerMap(unittest.TestCase):
+    def test_chain_reactions_and_blocking(self):
+        danger = DangerMap()
+        danger.on_game_state(copy.deepcopy(mock_state))
+        explosion_tick = danger.explosion_tick
+        self.assertEqual(danger.get_bomb_explosion_ticks(), {
+                         (1, 1): 30, (3, 1): 30, (3, 4): 30, (5, 2): 42})
+        # explosion_tick is indexed [y, x]
+        self.assertEqual(explosion_tick[1, 0], 30)
+        self.assertEqual(explosion_tick[3, 3], 30)
+        self.assertEqual(explosion_tick[4, 1], 30)
+        self.assertEqual(explosion_tick[2, 4], 42)
+        self.assertEqual(explosion_tick[0, 0], NO_DANGER)
+        self.assertEqual(explosion_tick[5, 1], NO_DANGER)
+        # behind the wood and the metal
+        self.assertEqual(explosion_tick[1, 6], NO_DANGER)
+        self.assertEqual(explosion_tick[0, 5], NO_DANGER)
+        self.assertEqual(explosion_tick[4, 6], NO_DANGER)
+        # ties keep the bomb that was looked at first
+        self.assertEqual(danger.owner[1, 2], 0)
+        self.assertEqual(danger.owner[0, 3], 1)
+        self.assertEqual(danger.owner[2, 4], 0)
+        self.assertEqual(danger.owner[0, 0], NO_OWNER)
+        self.assertEqual(danger.get_time_to_explosion(25)[1, 0], 5)
+        self.assertEqual(danger.get_time_to_explosion(25)[0, 0], NO_DANGER)
+
+    def test_predictions_match_the_forward_model(self):
+        danger = DangerMap()
+        state = copy.deepcopy(mock_state)
+        danger.on_game_state(state)
+        rng = random.Random(0)
+        first_blasts = {}
+        for _ in range(50):
+            predicted = danger.explosion_tick.copy()
+            result = evaluate_next_state(state, [], config, rng)
+            tick_result = result.get("tick_result")
+            tick = tick_result.get("tick")
+            blasts = set((event["data"]["x"], event["data"]["y"]) for event in tick_result.get("events")
+                         if event.get("type") == "entity_spawned" and event["data"]["type"] == "x")
+            blocks = set((entity["x"], entity["y"]) for entity in state["entities"]
+                         if entity["type"] in ("w", "o", "m"))
+            for y in range(7):
+                for x in range(7):
+                    if (x, y) in blocks or predicted[y, x] < tick:
+                        continue
+                    self.assertEqual((x, y) in blasts, predicted[y, x] == tick, (x, y, tick))
+            for cell in blasts:
+                first_blasts.setdefault(cell, tick)
+            for event in tick_result.get("events"):
+                danger.on_event(tick, event)
+            state = result.get("next_state")
+        self.assertGreater(len(first_blasts), 20)
+        self.assertEqual(danger.get_bomb_explosion_ticks(), {})
+        # the wood went at tick 30, so the last bomb reached (5, 0)
+        self.assertEqual(first_blasts[(5, 0)], 42)
+
+
+class TestGameStateDangerMap(IsolatedAsyncioTestCase):
+    async def test_danger_follows_events(self):
+        client = GameState("")
+        client.enable_danger_map()
+        await client._on_data({"type": "game_state", "payload": copy.deepcopy(mock_state)})
+        self.assertEqual(client.danger.explosion_tick[5, 0], NO_DANGER)
+        await client._on_data(create_mock_tick_packet(20, [{"type": "entity_spawned", "data": bomb(0, 5, 20, "d", "b")}]))
+        self.assertEqual(client.danger.explosion_tick[5, 0], 50)
+        self.assertEqual(client.danger.explosion_tick[6, 0], 50)
+        self.assertEqual(client.danger.owner[5, 0], 1)
+        await client._on_data(create_mock_tick_packet(21, [{"type": "entity_expired", "data": [0, 5]}]))
+        self.assertEqual(client.danger.explosion_tick[5, 0], NO_DANGER)
+
+
+if __name__ == '__main__':
+    unittest.main()
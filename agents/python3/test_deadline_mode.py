@@ -0,0 +1,131 @@
+import asyncio
+import copy
+import json
+import unittest
+from unittest import IsolatedAsyncioTestCase
+import websockets
+from dev_gym import mock_6x6_state
+from game_state import GameState
+
+
+class TimedConnection():
+    """
+    delivers each packet `delay` seconds after the previous one was read and
+    closes `close_delay` seconds after the last one
+    """
+
+    def __init__(self, packets, delay: float, close_delay: float = 0):
+        self._packets = [json.dumps(packet) for packet in packets]
+        self._delay = delay
+        self._close_delay = close_delay
+
+    async def recv(self):
+        if len(self._packets) == 0:
+            await asyncio.sleep(self._close_delay)
+            raise websockets.exceptions.ConnectionClosed(None, None)
+        if self._delay > 0:
+            await asyncio.sleep(self._delay)
+        return self._packets.pop(0)
+
+
+def create_packets(ticks: int):
+    state = copy.deepcopy(mock_6x6_state)
+    state["config"]["tick_rate_hz"] = 50
+    return [{"type": "game_state", "payload": state}] + [
+        {"type": "tick", "payload": {"tick": tick, "events": [
+            {"type": "unit", "agent_id": "a", "data": {"type": "move", "move": "up", "unit_id": "c"}}]}}
+        for tick in range(1, ticks + 1)]
+
+
+class TestDeadlineMode(IsolatedAsyncioTestCase):
+    async def test_slow_callback_is_cancelled_and_falls_back(self):
+        client = GameState("")
+        decided = []
+        fallbacks = []
+        cancelled = []
+
+        async def on_game_tick(tick_number, game_state):
+            try:
+                await asyncio.sleep(1)
+                decided.append(tick_number)
+            except asyncio.CancelledError:
+                cancelled.append(tick_number)
+                raise
+
+        async def on_fallback(tick_number, game_state):
+            fallbacks.append(tick_number)
+        client.set_game_tick_callback(on_game_tick)
+        client.enable_deadline_mode(0.5, on_fallback)
+        await client._handle_messages(TimedConnection(create_packets(3), 0.05, 0.05))
+        await asyncio.sleep(0)
+
+        self.assertEqual(decided, [])
+        self.assertEqual(fallbacks, [1, 2, 3])
+        self.assertEqual(cancelled, [1, 2, 3])
+        self.assertEqual(client.deadline_fallbacks, 3)
+
+    async def test_slow_fallback_is_cancelled_before_the_next_decision(self):
+        client = GameState("")
+        running = []
+        overlaps = []
+        finished = []
+
+        async def on_game_tick(tick_number, game_state):
+            await asyncio.sleep(1)
+
+        async def on_fallback(tick_number, game_state):
+            if len(running) > 0:
+                overlaps.append((running[0], tick_number))
+            running.append(tick_number)
+            try:
+                await asyncio.sleep(0.03)
+                finished.append((tick_number, game_state.get("tick")))
+            finally:
+                running.remove(tick_number)
+        client.set_game_tick_callback(on_game_tick)
+        client.enable_deadline_mode(0.5, on_fallback)
+        packets = create_packets(4)
+        # a new game while the fallback of tick 4 is running
+        packets.append(packets[0])
+        await client._handle_messages(TimedConnection(packets, 0.02, 0.05))
+
+        self.assertEqual(overlaps, [])
+        self.assertEqual(running, [])
+        # every fallback that finished did so before the state moved on
+        self.assertEqual([tick for tick, state_tick in finished if tick != state_tick], [])
+        self.assertEqual(client.stale_ticks_skipped, 3)
+
+    async def test_callback_errors_reach_the_caller(self):
+        client = GameState("")
+        decided = []
+
+        async def on_game_tick(tick_number, game_state):
+            decided.append(tick_number)
+            raise ValueError(f"bad tick {tick_number}")
+        client.set_game_tick_callback(on_game_tick)
+        client.enable_deadline_mode()
+        with self.assertRaisesRegex(ValueError, "bad tick 1"):
+            await asyncio.wait_for(client._handle_messages(TimedConnection(create_packets(3), 0.05, 0.05)), 1)
+        self.assertEqual(decided, [1])
+
+    async def test_queued_ticks_are_folded_into_one_decision(self):
+        client = GameState("")
+        decided = []
+
+        async def on_game_tick(tick_number, game_state):
+            decided.append(
+                (tick_number, list(game_state.get("unit_state").get("c").get("coordinates"))))
+        client.set_game_tick_callback(on_game_tick)
+        client.enable_deadline_mode()
+        # every packet is already waiting when the client starts reading
+        connection = TimedConnection(create_packets(3), 0, 0.05)
+        await client._handle_messages(connection)
+        await asyncio.sleep(0)
+
+        # all three moves are applied, but only the newest tick is decided on
+        self.assertEqual(decided, [(3, [0, 4])])
+        self.assertEqual(client.stale_ticks_skipped, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
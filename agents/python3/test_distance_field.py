@@ -0,0 +1,103 @@
+import unittest
+from collections import deque
+from unittest import IsolatedAsyncioTestCase
+from distance_field import UNREACHABLE, DistanceField
+from game_state import GameState
+from test_game_state import copy_object, create_mock_tick_packet, mock_state, mock_state_packet
+
+
+def bfs(blocked, x, y):
+    height, width = len(blocked), len(blocked[0])
+    distances = {(x, y): 0}
+    queue = deque([(x, y)])
+    while queue:
+        cx, cy = queue.popleft()
+        for nx, ny in [(cx + 1, cy), (cx - 1, cy), (cx, cy + 1), (cx, cy - 1)]:
+            if 0 <= nx < width and 0 <= ny < height and not blocked[ny][nx] and (nx, ny) not in distances:
+                distances[(nx, ny)] = distances[(cx, cy)] + 1
+                queue.append((nx, ny))
+    return distances
+
+
+class TestDistanceField(unittest.TestCase):
+    def assert_matches_bfs(self, field: DistanceField):
+        blocked = field.blocked.tolist()
+        for y in range(field.height):
+            for x in range(field.width):
+                if blocked[y][x]:
+                    self.assertIsNone(field.distance(x, y, 7, 7))
+                    continue
+                expected = bfs(blocked, x, y)
+                for ty in range(field.height):
+                    for tx in range(field.width):
+                        self.assertEqual(field.distance(x, y, tx, ty),
+                                         expected.get((tx, ty)), (x, y, tx, ty))
+
+    def test_initial_distances_match_bfs(self):
+        field = DistanceField()
+        field.on_game_state(copy_object(mock_state))
+        self.assert_matches_bfs(field)
+
+    def test_destroyed_blocks_open_paths(self):
+        field = DistanceField()
+        field.on_game_state(copy_object(mock_state))
+        # (0, 0) is metal, (1, 1), (1, 2), (0, 3), (0, 4) wood and (2, 1) ore around the corner
+        for x, y in [(1, 1), (2, 1), (0, 3), (1, 2), (0, 4), (7, 3)]:
+            field.on_event(10, {"type": "entity_expired", "data": [x, y]})
+            self.assert_matches_bfs(field)
+        field.on_event(11, {"type": "entity_spawned", "data": {
+                       "x": 1, "y": 1, "type": "w", "hp": 1}})
+        self.assert_matches_bfs(field)
+
+    def test_resent_game_state_keeps_the_table(self):
+        field = DistanceField()
+        field.on_game_state(copy_object(mock_state))
+        table = field._distances
+        # a reconnect resends the same blocks
+        field.on_game_state(copy_object(mock_state))
+        self.assertIs(field._distances, table)
+        field.on_event(10, {"type": "entity_expired", "data": [1, 1]})
+        state = copy_object(mock_state)
+        state["entities"] = [entity for entity in state["entities"] if (entity["x"], entity["y"]) != (1, 1)]
+        field.on_game_state(state)
+        self.assert_matches_bfs(field)
+        field.on_game_state(copy_object(mock_state))
+        self.assertIsNot(field._distances, table)
+        self.assert_matches_bfs(field)
+
+    def test_next_step_follows_a_shortest_path(self):
+        field = DistanceField()
+        field.on_game_state(copy_object(mock_state))
+        moves = {"up": (0, 1), "down": (0, -1),
+                 "left": (-1, 0), "right": (1, 0)}
+        x, y = 3, 10
+        distance = field.distance(x, y, 11, 10)
+        while (x, y) != (11, 10):
+            dx, dy = moves[field.next_step(x, y, 11, 10)]
+            x, y = x + dx, y + dy
+            self.assertFalse(field.blocked[y, x])
+            distance -= 1
+            self.assertEqual(field.distance(x, y, 11, 10), distance)
+        self.assertIsNone(field.next_step(11, 10, 11, 10))
+        self.assertIsNone(field.next_step(3, 10, 0, 0))
+        self.assertEqual(field.distances_from(3, 10)[10, 11], field.distance(3, 10, 11, 10))
+        self.assertEqual(field.distances_from(3, 10)[0, 0], UNREACHABLE)
+
+
+class TestGameStateDistances(IsolatedAsyncioTestCase):
+    async def test_distances_follow_expired_blocks(self):
+        client = GameState("")
+        client.enable_distances()
+        await client._on_data(copy_object(mock_state_packet))
+        self.assertIsNone(client.distances.distance(7, 7, 1, 1))
+        await client._on_data(create_mock_tick_packet(3, [{"type": "entity_expired", "data": [1, 1]}]))
+        # still walled in by metal, ore and wood at (1, 2)
+        self.assertEqual(client.distances.distance(1, 1, 1, 1), 0)
+        self.assertIsNone(client.distances.distance(7, 7, 1, 1))
+        await client._on_data(create_mock_tick_packet(4, [{"type": "entity_expired", "data": [1, 2]}]))
+        self.assertEqual(client.distances.distance(1, 1, 2, 2), 2)
+        self.assertEqual(client.distances.next_step(1, 1, 2, 2), "up")
+
+
+if __name__ == '__main__':
+    unittest.main()
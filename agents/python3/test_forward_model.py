@@ -0,0 +1,64 @@
+import asyncio
+import json
+import unittest
+from unittest import IsolatedAsyncioTestCase
+from forward_model import ForwardModel
+
+
+class RecordingConnection():
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, raw_data):
+        self.sent.append(json.loads(raw_data))
+
+
+def create_next_state_packet(sequence_id: int, tick: int):
+    return {"type": "next_game_state", "payload": {"sequence_id": sequence_id, "is_complete": False,
+                                                   "next_state": {"tick": tick}, "tick_result": {"tick": tick, "events": []}}}
+
+
+class TestForwardModel(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.fwd_model = ForwardModel("", max_in_flight=2)
+        self.fwd_model.connection = RecordingConnection()
+
+    async def test_replies_are_matched_by_sequence_id(self):
+        first = asyncio.create_task(
+            self.fwd_model.evaluate_next_state({"tick": 1}, []))
+        second = asyncio.create_task(
+            self.fwd_model.evaluate_next_state({"tick": 2}, []))
+        third = asyncio.create_task(
+            self.fwd_model.evaluate_next_state({"tick": 3}, []))
+        await asyncio.sleep(0)
+        # the third request waits for a free slot
+        sent = self.fwd_model.connection.sent
+        self.assertEqual([packet.get("sequence_id")
+                         for packet in sent], [0, 1])
+
+        await self.fwd_model._on_data(create_next_state_packet(1, 3))
+        await self.fwd_model._on_data(create_next_state_packet(0, 2))
+        self.assertEqual((await first).get("next_state").get("tick"), 2)
+        self.assertEqual((await second).get("next_state").get("tick"), 3)
+
+        await asyncio.sleep(0)
+        self.assertEqual(sent[2].get("sequence_id"), 2)
+        await self.fwd_model._on_data(create_next_state_packet(2, 4))
+        self.assertEqual((await third).get("sequence_id"), 2)
+        self.assertEqual(self.fwd_model._pending, {})
+
+    async def test_send_next_state_does_not_mutate_state(self):
+        state = {"tick": 1, "connection": {"id": 1}}
+        await self.fwd_model.send_next_state(0, state, [])
+        self.assertEqual(state, {"tick": 1, "connection": {"id": 1}})
+        self.assertEqual(self.fwd_model.connection.sent[0].get(
+            "state"), {"tick": 1})
+
+    async def test_request_times_out(self):
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.fwd_model.evaluate_next_state({"tick": 1}, [], timeout=0.01)
+        self.assertEqual(self.fwd_model._pending, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import json
+import os
+import tempfile
+import unittest
+from game_analytics import AnalyticsWriter, analyze_endgame, load_analytics
+
+replay_path = os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), "..", "replay.json")
+
+
+def create_unit_state(unit_id: str, agent_id: str, coordinates, hp: int):
+    return {"coordinates": coordinates, "hp": hp, "inventory": {"bombs": 3}, "blast_diameter": 3,
+            "unit_id": unit_id, "agent_id": agent_id, "invulnerable": 0, "stunned": 0}
+
+
+mock_endgame_payload = {
+    "initial_state": {"game_id": "test", "tick": 0, "entities": [], "unit_state": {
+        "c": create_unit_state("c", "a", [0, 0], 1),
+        "d": create_unit_state("d", "b", [2, 0], 1)}},
+    "history": [
+        {"tick": 1, "events": [
+            {"type": "unit", "agent_id": "a", "data": {
+                "type": "bomb", "unit_id": "c"}},
+            {"type": "entity_spawned", "data": {"created": 1, "x": 1, "y": 0, "type": "b", "unit_id": "c", "agent_id": "a"}}]},
+        {"tick": 2, "events": [
+            {"type": "unit", "agent_id": "b", "data": {"type": "move", "move": "left", "unit_id": "d"}}]},
+        {"tick": 7, "events": [
+            {"type": "entity_expired", "data": [1, 0]},
+            {"type": "unit_state", "data": create_unit_state("d", "b", [1, 0], 0)},
+            {"type": "entity_spawned", "data": {"created": 7, "x": 1, "y": 0, "type": "x", "unit_id": "c", "agent_id": "a", "expires": 12}}]}],
+    "winning_agent_id": "a"}
+
+
+class TestGameAnalytics(unittest.TestCase):
+    def test_damage_is_attributed_to_blast_owner(self):
+        tables = analyze_endgame(mock_endgame_payload)
+        units = tables.get("units")
+        self.assertEqual(units.get("unit_id"), ["c", "d"])
+        self.assertEqual(units.get("damage_dealt"), [1, 0])
+        self.assertEqual(units.get("kills"), [1, 0])
+        self.assertEqual(units.get("deaths"), [0, 1])
+        self.assertEqual(units.get("bombs_placed"), [1, 0])
+        self.assertEqual(units.get("final_x"), [0, 1])
+        self.assertEqual(tables.get("damage").get("attacker_unit_id"), ["c"])
+        self.assertEqual(tables.get("teams").get("won"), [True, False])
+        self.assertEqual(tables.get("games").get("total_ticks"), [7])
+
+    def test_shards_are_appended_and_read_back(self):
+        with open(replay_path) as replay_file:
+            payload = json.load(replay_file).get("payload")
+        with tempfile.TemporaryDirectory() as directory:
+            writer = AnalyticsWriter(directory, games_per_shard=2)
+            writer.add_game(payload)
+            writer.add_game(mock_endgame_payload)
+            writer.add_game(payload)
+            writer.close()
+            # a new writer continues numbering after the existing games
+            writer = AnalyticsWriter(directory)
+            writer.add_game(mock_endgame_payload)
+            writer.close()
+            self.assertEqual(len(os.listdir(directory)), 3)
+
+            games = load_analytics(directory, "games")
+            self.assertEqual(list(games.get("games.game")), [0, 1, 2, 3])
+            units = load_analytics(directory, "units")
+            self.assertEqual(len(units.get("units.unit_id")), 6 + 2 + 6 + 2)
+            taken = units.get("units.damage_taken")
+            lost = units.get(
+                "units.initial_hp") - units.get("units.final_hp").clip(min=0)
+            self.assertTrue((taken == lost).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -37,6 +37,13 @@ mock_tick_unit_state_packet = create_mock_tick_packet(50, [{"type": "unit_state"
                                                             "data": mock_unit_state_payload}])
 
 
+mock_tick_bomb_spawn_packet = create_mock_tick_packet(23, [
+    {"type": "entity_spawned", "data": {"created": 23, "x": 3, "y": 10, "type": "b", "unit_id": "c", "agent_id": "a", "expires": 63, "hp": 1, "blast_diameter": 3}},
+    {"type": "entity_spawned", "data": {"created": 23, "x": 11, "y": 10, "type": "b", "unit_id": "d", "agent_id": "b", "expires": 63, "hp": 1, "blast_diameter": 3}}])
+
+mock_tick_entity_state_packet = create_mock_tick_packet(30, [
+    {"type": "entity_state", "coordinates": [10, 4], "updated_entity": {"created": 0, "x": 10, "y": 4, "type": "o", "hp": 2}}])
+
 mock_tick_unit_action_packet = create_mock_tick_packet(
     5, [{"type": "unit", "agent_id": "a", "data": {"type": "move", "move": "right", "unit_id": "c"}}])
 
@@ -107,6 +114,30 @@ class TestGameState(IsolatedAsyncioTestCase):
         self.assert_object_equal(
             self.client._state, expected)
 
+    async def test_on_game_entity_state_packet(self):
+        await self.client._on_data(copy_object(mock_state_packet))
+        await self.client._on_data(copy_object(mock_tick_entity_state_packet))
+        expected = copy_object(mock_state)
+        expected["entities"] = [entity for entity in expected["entities"] if not (
+            entity["x"] == 10 and entity["y"] == 4)]
+        expected["entities"].append(
+            {"created": 0, "x": 10, "y": 4, "type": "o", "hp": 2})
+        self.assert_object_equal(self.client._state, expected)
+        self.assertEqual(self.client.entity_store.get_at(10, 4), [
+                         {"created": 0, "x": 10, "y": 4, "type": "o", "hp": 2}])
+
+    async def test_entity_store_bomb_index(self):
+        await self.client._on_data(copy_object(mock_state_packet))
+        await self.client._on_data(copy_object(mock_tick_bomb_spawn_packet))
+        bombs = self.client.entity_store.get_bombs("c")
+        self.assertEqual([[bomb["x"], bomb["y"]] for bomb in bombs], [[3, 10]])
+        await self.client._on_data(create_mock_tick_packet(
+            63, [{"type": "entity_expired", "data": [3, 10]}]))
+        self.assertEqual(self.client.entity_store.get_bombs("c"), [])
+        self.assertEqual(len(self.client.entity_store.get_bombs("d")), 1)
+        self.assertEqual(len(self.client._state["entities"]), len(
+            mock_state["entities"]) + 1)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,132 @@
+import asyncio
+import os
+import struct
+import tempfile
+import threading
+import unittest
+from unittest import IsolatedAsyncioTestCase
+import numpy as np
+from inference_server import InferenceClient, InferenceServer
+
+input_shape = (5, 5, 2)
+num_features = 3
+num_actions = 4
+weights = np.arange(
+    (50 + num_features) * num_actions, dtype=np.float32).reshape(-1, num_actions) / 100
+
+
+def model_fn(spatial_batch, non_spatial_batch):
+    logits = np.concatenate([spatial_batch.reshape(len(spatial_batch), -1),
+                            non_spatial_batch], axis=1) @ weights
+    exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+def observation(seed, units):
+    rng = np.random.default_rng(seed)
+    return (rng.random((1, *input_shape), dtype=np.float32),
+            rng.random((units, num_features), dtype=np.float32))
+
+
+class TestInferenceServer(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._directory.name, "inference.sock")
+        self.server = InferenceServer(model_fn, input_shape, num_features, num_actions,
+                                      max_clients=4, max_units=3, max_batch_size=64, max_wait=0.05)
+        await self.server.serve(self.path)
+
+    async def asyncTearDown(self):
+        await self.server.close()
+        self._directory.cleanup()
+
+    async def test_batches_requests_of_many_clients(self):
+        clients = [InferenceClient(self.path) for _ in range(4)]
+        for client in clients:
+            await client.connect()
+        self.assertEqual(sorted(client.slot for client in clients), [0, 1, 2, 3])
+        observations = [observation(seed, seed % 3 + 1) for seed in range(4)]
+        results = await asyncio.gather(*[client.infer(*inputs) for client, inputs in zip(clients, observations)])
+        for (spatial, non_spatial), probabilities in zip(observations, results):
+            expected = model_fn(np.repeat(spatial, len(non_spatial), axis=0), non_spatial)
+            np.testing.assert_allclose(probabilities, expected, rtol=1e-5)
+        summary = self.server.metrics.summary()
+        self.assertEqual(summary["batches"], 1)
+        self.assertEqual(summary["requests"], 4)
+        self.assertEqual(summary["max_batch_rows"], 1 + 2 + 3 + 1)
+        self.assertGreater(summary["max_queue_ms"], 0)
+        for client in clients:
+            await client.close()
+
+    async def test_full_batch_does_not_wait(self):
+        server = InferenceServer(model_fn, input_shape, num_features, num_actions,
+                                 max_clients=2, max_units=3, max_batch_size=3, max_wait=10)
+        path = os.path.join(self._directory.name, "full.sock")
+        await server.serve(path)
+        client = InferenceClient(path)
+        await client.connect()
+        probabilities = await asyncio.wait_for(client.infer(*observation(0, 3)), 1)
+        self.assertEqual(probabilities.shape, (3, num_actions))
+        await client.close()
+        await server.close()
+
+    async def test_slots_are_reused_and_limited(self):
+        clients = [InferenceClient(self.path) for _ in range(4)]
+        for client in clients:
+            await client.connect()
+        with self.assertRaises(ConnectionError):
+            await InferenceClient(self.path).connect()
+        await clients[1].close()
+        await asyncio.sleep(0.05)
+        client = InferenceClient(self.path)
+        await client.connect()
+        self.assertEqual(client.slot, clients[1].slot)
+        with self.assertRaises(ValueError):
+            await client.infer(*observation(0, 4))
+        for other in clients + [client]:
+            await other.close()
+
+    async def test_slot_of_a_closed_client_waits_for_its_requests(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_model_fn(spatial_batch, non_spatial_batch):
+            started.set()
+            release.wait(5)
+            return model_fn(spatial_batch, non_spatial_batch)
+        server = InferenceServer(slow_model_fn, input_shape, num_features, num_actions,
+                                 max_clients=2, max_units=3, max_batch_size=1, max_wait=0)
+        path = os.path.join(self._directory.name, "slow.sock")
+        await server.serve(path)
+        closed = InferenceClient(path)
+        await closed.connect()
+        request = asyncio.ensure_future(closed.infer(*observation(0, 1)))
+        await asyncio.get_event_loop().run_in_executor(None, started.wait, 5)
+        # a second request of the closed client is still queued behind the running one
+        closed._writer.write(struct.pack("<I", 1))
+        await closed.close()
+        await asyncio.sleep(0.05)
+
+        # the slot is not handed out while its requests can still read and write it
+        client = InferenceClient(path)
+        await client.connect()
+        self.assertNotEqual(client.slot, closed.slot)
+        with self.assertRaises(ConnectionError):
+            await InferenceClient(path).connect()
+
+        release.set()
+        await asyncio.gather(request, return_exceptions=True)
+        await asyncio.sleep(0.05)
+        reused = InferenceClient(path)
+        await reused.connect()
+        self.assertEqual(reused.slot, closed.slot)
+        inputs = observation(1, 2)
+        expected = model_fn(np.repeat(inputs[0], 2, axis=0), inputs[1])
+        np.testing.assert_allclose(await asyncio.wait_for(reused.infer(*inputs), 5), expected, rtol=1e-5)
+        for other in (client, reused):
+            await other.close()
+        await server.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import json
+import os
+import unittest
+from unittest import mock
+import json_codec
+
+replay_path = os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), "..", "replay.json")
+
+
+class TestJsonCodec(unittest.TestCase):
+    def test_outbound_packets_match_json_dumps(self):
+        self.assertEqual(json.loads(json_codec.encode_move("up", "c")), {
+                         "type": "move", "move": "up", "unit_id": "c"})
+        self.assertEqual(json.loads(json_codec.encode_bomb("c")), {
+                         "type": "bomb", "unit_id": "c"})
+        self.assertEqual(json.loads(json_codec.encode_detonate(1, 2, "c")), {
+                         "type": "detonate", "coordinates": [1, 2], "unit_id": "c"})
+        state = {"tick": 1, "entities": []}
+        actions = [{"agent_id": "a", "action": {
+            "type": "bomb", "unit_id": "c"}}]
+        self.assertEqual(json.loads(json_codec.encode_evaluate_next_state(3, json_codec.dumps(state), actions)), {
+                         "actions": actions, "type": "evaluate_next_state", "state": state, "sequence_id": 3})
+
+    def test_decode_packet_matches_json_loads(self):
+        with open(replay_path) as replay_file:
+            raw_data = replay_file.read()
+        self.assertEqual(json_codec.decode_packet(
+            raw_data), json.loads(raw_data))
+        self.assertEqual(json_codec.decode_packet(
+            '{"type": "info"}'), {"type": "info"})
+
+    def test_unexpected_packets_are_decoded_like_json_loads(self):
+        for raw_data, valid in [('{"type": "tick", "payload": {"tick": 1, "events": [], "extra": 2}, "sent": 3}', True),
+                                ('{"type": "tick", "payload": {"tick": "1"}}', False),
+                                ('{"type": "endgame_state", "payload": {"winning_agent_id": "a"}}', False)]:
+            with mock.patch("builtins.print") as print_mock:
+                self.assertEqual(json_codec.decode_packet(
+                    raw_data), json.loads(raw_data))
+                self.assertFalse(print_mock.called)
+                self.assertEqual(json_codec.decode_packet(
+                    raw_data, validate=True), json.loads(raw_data))
+            if json_codec.msgspec is not None:
+                self.assertEqual(print_mock.called, not valid)
+
+    @unittest.skipIf(json_codec.msgspec is None, "validation needs msgspec")
+    def test_invalid_packets_are_printed_truncated(self):
+        raw_data = json.dumps({"type": "tick", "payload": {"tick": "1", "events": [{"type": "x" * 10000}]}})
+        with mock.patch("builtins.print") as print_mock:
+            json_codec.decode_packet(raw_data, validate=True)
+        self.assertLess(len(print_mock.call_args[0][0]), 500)
+
+    def test_state_encoder_output_matches_json_dumps(self):
+        with open(replay_path) as replay_file:
+            state = json.load(replay_file).get("payload").get("initial_state")
+        state_with_connection = {**state, "connection": {
+            "id": 1, "role": "agent", "agent_id": "a"}}
+        next_state = {**state, "entities": state.get("entities")[1:] + [
+            {"created": 1, "x": 0, "y": 0, "type": "b", "unit_id": "c", "agent_id": "a", "expires": 31, "hp": 1, "blast_diameter": 3}]}
+        for backend in ["json", json_codec.backend]:
+            with mock.patch.object(json_codec, "backend", backend):
+                encoder = json_codec.StateEncoder()
+                self.assertEqual(json.loads(encoder.encode(
+                    state_with_connection)), state)
+                self.assertEqual(json.loads(
+                    encoder.encode(next_state)), next_state)
+        self.assertIn("connection", state_with_connection)
+        with mock.patch.object(json_codec, "backend", "json"):
+            self.assertEqual(json_codec.StateEncoder().encode(
+                state_with_connection), json.dumps(state))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import copy
+import json
+import os
+import random
+import unittest
+from unittest import IsolatedAsyncioTestCase
+from gym import Gym
+from local_forward_model import LocalForwardModel, default_config, evaluate_next_state, generate_growing_fire_progression
+from dev_gym import mock_6x6_state
+
+fixtures_path = os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), "forward_model_fixtures.json")
+
+
+class TestLocalForwardModel(IsolatedAsyncioTestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open(fixtures_path) as fixtures_file:
+            cls.fixtures = json.load(fixtures_file)
+        cls.config = {**default_config, **cls.fixtures.get("config")}
+
+    def test_fire_progression_matches_engine(self):
+        for size, expected in self.fixtures.get("fire_progressions").items():
+            width, height = [int(n) for n in size.split("x")]
+            self.assertEqual(
+                generate_growing_fire_progression(width, height), expected, size)
+
+    def test_matches_recorded_engine_steps(self):
+        for scenario in self.fixtures.get("scenarios"):
+            state = scenario.get("initial_state")
+            for step in scenario.get("steps"):
+                result = evaluate_next_state(
+                    state, step.get("actions"), self.config, random.Random(0))
+                self.assertEqual(result.get("tick_result"), step.get(
+                    "tick_result"), scenario.get("name"))
+                self.assertEqual(result.get("is_complete"),
+                                 step.get("is_complete"), scenario.get("name"))
+                state = result.get("next_state")
+            self.assertEqual(state, scenario.get(
+                "final_state"), scenario.get("name"))
+
+    def test_does_not_mutate_input_state(self):
+        state = copy.deepcopy(mock_6x6_state)
+        evaluate_next_state(state, [{"agent_id": "a", "action": {
+                            "type": "bomb", "unit_id": "c"}}])
+        self.assertEqual(state, mock_6x6_state)
+
+    async def test_send_next_state_calls_back_with_sequence_id(self):
+        results = []
+
+        async def on_next_state(payload):
+            results.append(payload)
+        fwd_model = LocalForwardModel()
+        fwd_model.set_next_state_callback(on_next_state)
+        await fwd_model.send_next_state(7, mock_6x6_state, [])
+        self.assertEqual(results[0].get("sequence_id"), 7)
+        self.assertEqual(results[0].get("tick_result").get("tick"), 1)
+        self.assertEqual(results[0].get("next_state").get("tick"), 1)
+
+    async def test_gym_steps_without_engine(self):
+        gym = Gym(None)
+        await gym.connect()
+        # units count as stunned while `stunned >= tick`, so nobody can act on tick 0
+        initial_state = {**mock_6x6_state, "tick": 1}
+        env = gym.make("in-process", initial_state)
+        state, is_complete, events = await env.step([{"agent_id": "a", "action": {
+            "type": "move", "move": "up", "unit_id": "c"}}])
+        self.assertEqual(state.get("unit_state").get(
+            "c").get("coordinates"), [0, 2])
+        self.assertFalse(is_complete)
+        self.assertEqual(events[0].get("type"), "unit")
+        await gym.close()
+
+    async def test_vec_env_steps_and_resets_finished_envs(self):
+        gym = Gym(None)
+        await gym.connect()
+        # agent "b" has no units left, so the second environment finishes straight away
+        finished_state = copy.deepcopy(mock_6x6_state)
+        for unit_id in finished_state.get("agents").get("b").get("unit_ids"):
+            finished_state.get("unit_state").get(unit_id)["hp"] = 0
+        vec_env = gym.make_vec("vec", [mock_6x6_state, finished_state])
+        observations, dones, infos = await vec_env.step([[], []])
+        self.assertEqual(vec_env.num_envs, 2)
+        self.assertEqual(dones, [False, True])
+        self.assertEqual([observation.get("tick")
+                         for observation in observations], [1, 1])
+        observations, dones, infos = await vec_env.step([[], []])
+        self.assertEqual([observation.get("tick")
+                         for observation in observations], [2, 1])
+        await gym.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
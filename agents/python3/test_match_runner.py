@@ -0,0 +1,112 @@
+import asyncio
+import json
+import shlex
+import sys
+import tempfile
+import time
+import unittest
+from unittest import IsolatedAsyncioTestCase, mock
+from admin_state import AdminState
+from game_analytics import AnalyticsWriter, load_analytics
+from match_runner import MatchRunner, parse_seed_pairs
+from test_game_analytics import mock_endgame_payload
+
+
+class RecordingConnection():
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, raw_data):
+        self.sent.append(json.loads(raw_data))
+
+
+# accepts the admin and then never ends the game, or exits once the admin is connected with FAKE_ENGINE=crash
+fake_engine = """
+import asyncio, os, websockets
+async def handler(connection, path):
+    if os.environ.get("FAKE_ENGINE") == "crash":
+        os._exit(3)
+    await asyncio.sleep(60)
+async def main():
+    await websockets.serve(handler, "127.0.0.1", int(os.environ["PORT"]))
+    await asyncio.sleep(60)
+asyncio.run(main())
+"""
+
+
+class RecordingAnalytics():
+    def __init__(self):
+        self.flushes = 0
+
+    def flush(self):
+        self.flushes += 1
+
+
+class TestMatchRunner(IsolatedAsyncioTestCase):
+    async def run_failing_games(self, engine_env, game_timeout):
+        analytics = RecordingAnalytics()
+        runner = MatchRunner(f"{shlex.quote(sys.executable)} -c {shlex.quote(fake_engine)}",
+                             f"{shlex.quote(sys.executable)} -c 'import time; time.sleep(60)'", analytics,
+                             instances=1, base_port=4390, game_timeout=game_timeout, engine_env=engine_env)
+        start = time.perf_counter()
+        await asyncio.wait_for(runner.run([(1, 1), (2, 2)]), 30)
+        self.assertEqual(runner.games_played, 0)
+        self.assertEqual(runner.games_failed, 2)
+        self.assertEqual(analytics.flushes, 1)
+        return time.perf_counter() - start
+
+    async def test_timed_out_games_are_skipped(self):
+        await self.run_failing_games({}, 0.5)
+
+    async def test_engine_crash_is_noticed_before_the_timeout(self):
+        self.assertLess(await self.run_failing_games({"FAKE_ENGINE": "crash"}, 600), 30)
+
+    async def test_instance_failure_still_flushes(self):
+        analytics = RecordingAnalytics()
+        runner = MatchRunner("./no-such-engine", "./no-such-agent", analytics, instances=2, base_port=4390)
+        with self.assertRaises(OSError):
+            await runner.run([(1, 1), (2, 2), (3, 3)])
+        self.assertEqual(analytics.flushes, 1)
+
+    async def test_admins_share_one_store_and_leave_resets_to_the_caller(self):
+        with tempfile.TemporaryDirectory() as directory:
+            analytics = AnalyticsWriter(directory)
+            endgames = []
+            admins = [AdminState("", analytics=analytics, world_seed=seed, prng_seed=seed + 10)
+                      for seed in range(2)]
+            for admin in admins:
+                admin.connection = RecordingConnection()
+                admin.set_endgame_callback(
+                    lambda payload, admin=admin: self._on_endgame(endgames, admin))
+
+            for admin in admins:
+                await admin._on_data({"type": "endgame_state", "payload": mock_endgame_payload})
+            self.assertEqual(admins[0].connection.sent, [])
+            await admins[0].request_game_reset(5, 6)
+            self.assertEqual(admins[0].connection.sent, [
+                             {"type": "request_game_reset", "world_seed": 5, "prng_seed": 6}])
+            await admins[0]._on_data({"type": "endgame_state", "payload": mock_endgame_payload})
+            analytics.close()
+
+            self.assertEqual(endgames, [admins[0], admins[1], admins[0]])
+            games = load_analytics(directory, "games")
+            self.assertEqual(list(games.get("games.game")), [0, 1, 2])
+            self.assertEqual(list(games.get("games.world_seed")), [0, 1, 5])
+            self.assertEqual(list(games.get("games.prng_seed")), [10, 11, 6])
+
+    async def test_admin_stores_every_game_without_close(self):
+        with tempfile.TemporaryDirectory() as directory:
+            admin = AdminState("", analytics_directory=directory)
+            with mock.patch("builtins.print"):
+                await admin._on_data({"type": "endgame_state", "payload": mock_endgame_payload})
+            self.assertEqual(list(load_analytics(directory, "games").get("games.game")), [0])
+
+    async def _on_endgame(self, endgames, admin):
+        endgames.append(admin)
+
+    def test_parse_seed_pairs(self):
+        self.assertEqual(parse_seed_pairs("1:2,3:4"), [(1, 2), (3, 4)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,30 @@
+import asyncio
+import unittest
+from unittest import IsolatedAsyncioTestCase
+from dev_gym import mock_6x6_state
+from local_forward_model import LocalForwardModel
+from mcts import MCTSPlanner, get_state_key
+
+
+class TestMCTSPlanner(IsolatedAsyncioTestCase):
+    async def test_plans_within_deadline(self):
+        planner = MCTSPlanner(LocalForwardModel(seed=1), "a", seed=1)
+        state = {**mock_6x6_state, "tick": 1}
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + 0.2
+        joint_action = await planner.plan(state, deadline)
+        self.assertLess(loop.time(), deadline + 0.5)
+        self.assertEqual(list(joint_action.keys()), ["c", "e", "g"])
+        self.assertGreater(planner.last_simulations, 0)
+        # every expanded state is stored once in the transposition table
+        self.assertLessEqual(len(planner._table),
+                             planner.last_simulations + 1)
+        self.assertEqual(state.get("tick"), 1)
+
+    def test_state_key_ignores_connection(self):
+        state = {**mock_6x6_state, "connection": {"agent_id": "a"}}
+        self.assertEqual(get_state_key(state), get_state_key(mock_6x6_state))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from model_loader import export_saved_model, load_policy
+from observation_encoder import NUM_FEATURES, NUM_PLANES
+from tick_timing import StartupTimings
+
+try:
+    import create_cnn
+    from tflite_model import export_tflite
+except ImportError:
+    create_cnn = None
+
+input_shape = (15, 15, NUM_PLANES)
+
+
+@unittest.skipIf(create_cnn is None, "tensorflow is not installed")
+class TestModelLoader(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.model = create_cnn.create_cnn(input_shape, NUM_FEATURES, 6, 16)
+        cls.directory = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(0)
+        cls.spatial = rng.random((1, *input_shape), dtype=np.float32)
+        cls.non_spatial = rng.random((2, NUM_FEATURES), dtype=np.float32)
+        cls.expected = cls.model([np.repeat(cls.spatial, 2, axis=0), cls.non_spatial], training=False).numpy()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def check_policy(self, path):
+        timings = StartupTimings()
+        policy = load_policy(path, input_shape, NUM_FEATURES, timings=timings)
+        self.assertEqual(list(timings.summary().keys()), ["import_runtime", "load_model", "warm_up"])
+        actions, probabilities = policy(self.spatial, self.non_spatial)
+        np.testing.assert_allclose(probabilities, self.expected, atol=1e-5)
+        np.testing.assert_array_equal(actions, np.argmax(self.expected, axis=1))
+
+    def test_saved_model(self):
+        path = os.path.join(self.directory.name, "saved_model")
+        export_saved_model(self.model, path)
+        self.check_policy(path)
+
+    def test_tflite(self):
+        path = os.path.join(self.directory.name, "cnn.tflite")
+        export_tflite(self.model, path)
+        self.check_policy(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+from unittest import IsolatedAsyncioTestCase
+from game_state import GameState
+from observation_encoder import ObservationEncoder, METAL_PLANE, WOOD_PLANE, BOMB_PLANE, OWN_UNIT_PLANE, ENEMY_UNIT_PLANE, HP_FEATURE, BOMBS_FEATURE, STUN_FEATURE
+from test_game_state import copy_object, create_mock_tick_packet, mock_state_packet, mock_tick_unit_action_packet
+
+
+class TestObservationEncoder(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.client = GameState("")
+        self.encoder = ObservationEncoder()
+        self.client.add_state_listener(self.encoder)
+        await self.client._on_data(copy_object(mock_state_packet))
+
+    def test_initial_planes(self):
+        spatial, non_spatial = self.encoder.get_inputs(0)
+        self.assertEqual(spatial.shape, (1, 15, 15, 8))
+        self.assertEqual(non_spatial.shape, (3, 4))
+        self.assertEqual(spatial[0, 7, 11, METAL_PLANE], 1)
+        self.assertEqual(spatial[0, 3, 1, WOOD_PLANE], 1)
+        # the mock connection is agent "b", so unit "d" at [11, 10] is ours
+        self.assertEqual(spatial[0, 10, 11, OWN_UNIT_PLANE], 1)
+        self.assertEqual(spatial[0, 10, 3, ENEMY_UNIT_PLANE], 1)
+        self.assertEqual(non_spatial[0, HP_FEATURE], 3)
+
+    async def test_events_update_touched_cells(self):
+        spatial, non_spatial = self.encoder.get_inputs(0)
+        await self.client._on_data(copy_object(mock_tick_unit_action_packet))
+        self.assertEqual(spatial[0, 10, 3, ENEMY_UNIT_PLANE], 0)
+        self.assertEqual(spatial[0, 10, 4, ENEMY_UNIT_PLANE], 1)
+
+        await self.client._on_data(create_mock_tick_packet(6, [
+            {"type": "entity_spawned", "data": {"created": 6, "x": 11, "y": 10, "type": "b",
+                                                "unit_id": "d", "agent_id": "b", "expires": 46, "hp": 1, "blast_diameter": 3}},
+            {"type": "unit_state", "data": {"coordinates": [11, 10], "hp": 3, "inventory": {"bombs": 2},
+                                            "blast_diameter": 3, "unit_id": "d", "agent_id": "b", "invulnerable": 0, "stunned": 9}},
+            {"type": "entity_expired", "data": [1, 3]}]))
+        next_spatial, next_non_spatial = self.encoder.get_inputs(6)
+        self.assertIs(next_spatial, spatial)
+        self.assertIs(next_non_spatial, non_spatial)
+        self.assertEqual(spatial[0, 10, 11, BOMB_PLANE], 1)
+        self.assertEqual(spatial[0, 3, 1, WOOD_PLANE], 0)
+        self.assertEqual(non_spatial[0, BOMBS_FEATURE], 2)
+        self.assertEqual(non_spatial[0, STUN_FEATURE], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import asyncio
+import os
+import tempfile
+import unittest
+import numpy as np
+from dev_gym import mock_6x6_state
+from observation_encoder import NUM_FEATURES
+from ppo import PPOActor, PPOLearner, _create_model, compute_gae, save_weights
+from trajectory_buffer import TrajectoryBuffer
+
+
+def compute_gae_per_row(rewards, values, dones, gamma, lam):
+    advantages = np.zeros(len(rewards))
+    advantage = 0
+    for index in reversed(range(len(rewards))):
+        next_value = values[index] if index == len(
+            rewards) - 1 else values[index + 1]
+        not_done = 1 - dones[index]
+        delta = rewards[index] + gamma * next_value * \
+            not_done - values[index]
+        advantage = delta + gamma * lam * not_done * advantage
+        advantages[index] = advantage
+    return advantages
+
+
+class TestPPO(unittest.TestCase):
+    def test_gae_matches_per_stream_recursion(self):
+        random = np.random.default_rng(0)
+        rows = 200
+        rewards = random.normal(size=rows).astype(np.float32)
+        values = random.normal(size=rows).astype(np.float32)
+        dones = random.random(rows) < 0.1
+        streams = random.integers(0, 5, rows)
+        steps = random.permutation(rows)
+        advantages, returns = compute_gae(
+            rewards, values, dones, streams, steps, 0.9, 0.8)
+        for stream in range(5):
+            rows_of_stream = np.flatnonzero(streams == stream)
+            rows_of_stream = rows_of_stream[np.argsort(steps[rows_of_stream])]
+            expected = compute_gae_per_row(
+                rewards[rows_of_stream], values[rows_of_stream], dones[rows_of_stream], 0.9, 0.8)
+            np.testing.assert_allclose(
+                advantages[rows_of_stream], expected, rtol=1e-4, atol=1e-5)
+        np.testing.assert_allclose(returns, advantages + values)
+
+    def test_actor_rollout_feeds_learner_update(self):
+        with tempfile.TemporaryDirectory() as directory:
+            model, input_shape = _create_model(mock_6x6_state)
+            buffer = TrajectoryBuffer(os.path.join(
+                directory, "buffer"), 256, input_shape, NUM_FEATURES)
+            weights_path = os.path.join(directory, "weights.npz")
+            save_weights(model, weights_path)
+            actor = PPOActor(model, buffer, weights_path,
+                             mock_6x6_state, envs=2, seed=0)
+            asyncio.run(actor.run(max_steps=64))
+            self.assertEqual(buffer.total_steps, actor.steps)
+            self.assertTrue(set(buffer.fields["stream"][:actor.steps]) <= set(range(4 * 16)))
+
+            learner = PPOLearner(model, buffer, weights_path,
+                                 rollout_size=48, batch_size=16, epochs=1, first_step=0)
+            stats = learner.update()
+            self.assertEqual(stats.get("samples"), 48)
+            self.assertTrue(np.isfinite(stats.get("policy_loss")))
+            buffer.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,181 @@
+import asyncio
+import copy
+import json
+import random
+import unittest
+from unittest import IsolatedAsyncioTestCase
+import websockets
+from admin_state import AdminState
+from dev_gym import mock_6x6_state
+from game_state import GameState
+from observation_encoder import OWN_UNIT_PLANE, ObservationEncoder
+from reconnect import Backoff, connect_with_backoff
+
+
+def game_state_packet(unit_x):
+    state = copy.deepcopy(mock_6x6_state)
+    state["connection"] = {"id": 0, "role": "agent", "agent_id": "a"}
+    state["unit_state"]["c"]["coordinates"] = [unit_x, 0]
+    return json.dumps({"type": "game_state", "payload": state})
+
+
+def tick_packet(tick):
+    return json.dumps({"type": "tick", "payload": {"tick": tick, "events": []}})
+
+
+def endgame_packet():
+    return json.dumps({"type": "endgame_state", "payload": {
+        "initial_state": mock_6x6_state, "history": [], "winning_agent_id": "a"}})
+
+
+async def serve(handler):
+    server = await websockets.serve(handler, "127.0.0.1", 0)
+    return server, f"ws://127.0.0.1:{server.sockets[0].getsockname()[1]}/?role=agent&agentId=agentA"
+
+
+class TestBackoff(unittest.TestCase):
+    def test_delays_grow_with_jitter_up_to_the_maximum(self):
+        backoff = Backoff(0.1, 1.0, random.Random(0))
+        delays = [backoff.next_delay() for _ in range(8)]
+        for attempt, delay in enumerate(delays):
+            self.assertGreaterEqual(delay, 0)
+            self.assertLessEqual(delay, min(1.0, 0.1 * 2 ** attempt))
+        self.assertGreater(max(delays[4:]), 0.2)
+        backoff.reset()
+        self.assertLessEqual(backoff.next_delay(), 0.1)
+
+
+class TestReconnect(IsolatedAsyncioTestCase):
+    async def test_connect_retries_until_it_succeeds(self):
+        attempts = []
+
+        async def connect():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise ConnectionRefusedError()
+            return "connection"
+        backoff = Backoff(0.001, 0.01)
+        self.assertEqual(await connect_with_backoff(connect, backoff), "connection")
+        self.assertEqual(len(attempts), 3)
+        # only a session that got a game_state resets the backoff
+        self.assertEqual(backoff.attempts, 2)
+
+    async def test_resyncs_and_reports_actions_sent_while_disconnected(self):
+        connections = []
+
+        async def handler(connection, path=None):
+            connections.append(connection)
+            if len(connections) == 1:
+                # drops the connection while the agent is deciding on tick 1
+                await connection.send(game_state_packet(0))
+                await connection.send(tick_packet(1))
+                await asyncio.sleep(0.05)
+                await connection.close()
+            else:
+                await connection.send(game_state_packet(3))
+                await connection.send(tick_packet(2))
+                await connection.recv()
+                await connection.send(endgame_packet())
+                await connection.close()
+        server, url = await serve(handler)
+
+        client = GameState(url)
+        encoder = ObservationEncoder()
+        client.add_state_listener(encoder)
+        ticks = []
+        dropped = []
+        outages = []
+
+        async def on_tick(tick_number, game_state):
+            ticks.append((tick_number, list(game_state.get("unit_state").get("c").get("coordinates"))))
+            if tick_number == 1:
+                while not client.connection.closed:
+                    await asyncio.sleep(0.001)
+            dropped.extend(await client.send_actions([{"type": "bomb", "unit_id": "c"}]))
+
+        async def on_reconnect(outage, unsent_actions):
+            outages.append((outage, unsent_actions))
+        client.set_game_tick_callback(on_tick)
+        client.set_reconnect_callback(on_reconnect)
+        await asyncio.wait_for(client.run(max_games=1), 5)
+        server.close()
+        await server.wait_closed()
+
+        self.assertEqual(ticks, [(1, [0, 0]), (2, [3, 0])])
+        self.assertEqual(dropped, [({"type": "bomb", "unit_id": "c"}, "not connected")])
+        self.assertEqual(client.reconnects, 1)
+        self.assertEqual(client.unsent_action_count, 1)
+        self.assertEqual(len(outages), 1)
+        self.assertLess(outages[0][0], 1.0)
+        self.assertEqual(outages[0][1], [{"tick": 1, "action": {"type": "bomb", "unit_id": "c"}, "reason": "not connected"}])
+        # the listener was kept and resynced from the second game_state
+        self.assertEqual(encoder.spatial[0, 0, 3, OWN_UNIT_PLANE], 1)
+        self.assertEqual(encoder.spatial[0, 0, 0, OWN_UNIT_PLANE], 0)
+
+    async def test_finished_games_are_not_outages(self):
+        connections = []
+
+        async def handler(connection, path=None):
+            connections.append(connection)
+            await connection.send(game_state_packet(0))
+            await connection.send(endgame_packet())
+            await asyncio.sleep(0.05)
+            await connection.close()
+        server, url = await serve(handler)
+
+        client = GameState(url)
+        outages = []
+
+        async def on_reconnect(outage, unsent_actions):
+            outages.append(outage)
+        client.set_reconnect_callback(on_reconnect)
+        await asyncio.wait_for(client.run(max_games=2), 5)
+        server.close()
+        await server.wait_closed()
+
+        self.assertEqual(len(connections), 2)
+        self.assertEqual(client.games_finished, 2)
+        self.assertEqual(client.reconnects, 0)
+        self.assertEqual(outages, [])
+
+    async def test_rejected_connections_back_off(self):
+        connections = []
+
+        async def handler(connection, path=None):
+            connections.append(connection)
+            if len(connections) < 3:
+                await connection.close()
+                return
+            await connection.send(game_state_packet(0))
+            await connection.send(endgame_packet())
+            await asyncio.sleep(0.05)
+            await connection.close()
+        server, url = await serve(handler)
+
+        client = GameState(url)
+        client._backoff = Backoff(0.001, 0.01)
+        await asyncio.wait_for(client.run(max_games=1), 5)
+        server.close()
+        await server.wait_closed()
+
+        # the rejected connections did not use up the game
+        self.assertEqual(len(connections), 3)
+        self.assertEqual(client.games_finished, 1)
+        self.assertEqual(client._backoff.attempts, 0)
+
+    async def test_unsent_actions_are_packets(self):
+        client = GameState("")
+        client._state = {"tick": 4}
+        await client.send_move("up", "c")
+        self.assertEqual(client.unsent_actions, [
+                         {"tick": 4, "action": {"type": "move", "move": "up", "unit_id": "c"}, "reason": "not connected"}])
+
+    async def test_admin_keeps_packets_sent_while_disconnected(self):
+        admin = AdminState("", analytics=object())
+        await admin.request_game_reset(1, 2)
+        self.assertEqual(admin.unsent_packets, [
+                         {"type": "request_game_reset", "world_seed": 1, "prng_seed": 2}])
+
+
+if __name__ == '__main__':
+    unittest.main()
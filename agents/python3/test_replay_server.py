@@ -0,0 +1,96 @@
+import asyncio
+import json
+import os
+import unittest
+from unittest import IsolatedAsyncioTestCase
+from game_state import GameState
+from replay_server import ReplayServer
+
+replay_path = os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), "..", "replay.json")
+
+
+class TestReplayServer(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        with open(replay_path) as replay_file:
+            self.payload = json.load(replay_file).get("payload")
+
+    async def start(self, speed):
+        self.replay = ReplayServer(self.payload, speed, ack_timeout=0.5, agent_secret_id_map={
+                                   "agentA": "a", "agentB": "b"})
+        self.server = await self.replay.serve("127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def play(self, agent_secret="agentA", send_actions=True):
+        client = GameState(
+            f"ws://127.0.0.1:{self.port}/?role=agent&agentId={agent_secret}&name=test")
+        ticks = []
+
+        async def on_tick(tick_number, game_state):
+            ticks.append(tick_number)
+            if not send_actions:
+                return
+            agent_id = game_state.get("connection").get("agent_id")
+            unit_ids = game_state.get("agents").get(agent_id).get("unit_ids")
+            await client.send_actions([{"type": "move", "move": "up", "unit_id": unit_id} for unit_id in unit_ids
+                                       if game_state.get("unit_state").get(unit_id).get("hp") > 0])
+        client.set_game_tick_callback(on_tick)
+        connection = await client.connect()
+        if connection is None:
+            # closed by the server right after the handshake
+            return client, ticks
+        await asyncio.wait_for(client._handle_messages(connection), 10)
+        return client, ticks
+
+    async def test_replays_the_recorded_game_and_records_actions(self):
+        await self.start("ack")
+        client, ticks = await self.play()
+        last_tick = self.payload.get("history")[-1].get("tick")
+        self.assertEqual(ticks, list(range(1, last_tick + 1)))
+
+        expected = GameState("")
+        await expected._on_data({"type": "game_state", "payload": self.payload.get("initial_state")})
+        for tick in self.payload.get("history"):
+            await expected._on_data({"type": "tick", "payload": tick})
+        self.assertEqual(client._state.get("unit_state"), expected._state.get("unit_state"))
+        self.assertEqual(client._state.get("connection"), {"id": 0, "role": "agent", "agent_id": "a"})
+
+        session = self.replay.sessions[0]
+        self.assertEqual(session.agent_id, "a")
+        self.assertEqual(session.ticks_sent, last_tick)
+        self.assertEqual(session.acks_timed_out, 0)
+        self.assertGreater(len(session.actions), last_tick)
+        # every action is filed under the tick it answered
+        actions_per_tick = {}
+        for action in session.actions:
+            actions_per_tick.setdefault(action["tick"], []).append(action["packet"])
+        self.assertEqual(sorted(actions_per_tick.keys()), ticks)
+        self.assertTrue(all(packet["type"] == "move" for packets in actions_per_tick.values() for packet in packets))
+
+    async def test_timed_and_unthrottled_speeds(self):
+        await self.start(20.0)
+        _, ticks = await self.play(send_actions=False)
+        tick_rate_hz = self.payload.get("initial_state").get("config").get("tick_rate_hz")
+        self.assertGreaterEqual(self.replay.sessions[0].duration, (len(ticks) - 1) / (tick_rate_hz * 20.0))
+        self.server.close()
+        await self.server.wait_closed()
+
+        await self.start("max")
+        _, max_ticks = await self.play("b", send_actions=False)
+        self.assertEqual(max_ticks, ticks)
+        self.assertEqual(self.replay.sessions[0].agent_id, "b")
+        self.assertEqual(self.replay.sessions[0].actions, [])
+
+    async def test_rejects_unknown_agents(self):
+        await self.start("max")
+        client, ticks = await self.play("agentC")
+        self.assertIsNone(client._state)
+        self.assertEqual(self.replay.sessions, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import asyncio
+import copy
+import json
+import unittest
+from unittest import IsolatedAsyncioTestCase
+import websockets
+from dev_gym import mock_6x6_state
+from game_state import GameState
+
+
+class RecordingConnection():
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, raw_data):
+        self.sent.append(json.loads(raw_data))
+
+
+class TestSendActions(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        state = copy.deepcopy(mock_6x6_state)
+        state["connection"] = {"id": 1, "role": "agent", "agent_id": "a"}
+        state["unit_state"]["g"]["hp"] = 0
+        state["entities"].append({"created": 0, "x": 0, "y": 1, "type": "b",
+                                  "unit_id": "c", "agent_id": "a", "expires": 40, "hp": 1, "blast_diameter": 3})
+        self.client = GameState("")
+        self.client._on_game_state(state)
+        self.client.connection = RecordingConnection()
+
+    async def test_valid_actions_are_sent_and_invalid_ones_reported(self):
+        actions = [
+            {"type": "move", "move": "up", "unit_id": "c"},
+            {"type": "detonate", "coordinates": [0, 1], "unit_id": "e"},
+            {"type": "bomb", "unit_id": "e"},
+            {"type": "bomb", "unit_id": "c"},
+            {"type": "move", "move": "north", "unit_id": "e"},
+            {"type": "bomb", "unit_id": "d"},
+            {"type": "bomb", "unit_id": "g"},
+            {"type": "jump", "unit_id": "e"},
+        ]
+        dropped = await self.client.send_actions(actions)
+        self.assertEqual(self.client.connection.sent, [actions[0], actions[2]])
+        self.assertEqual([action for action, _ in dropped], actions[1:2] + actions[3:])
+        self.assertEqual([reason for _, reason in dropped], [
+            "no bomb of the unit at the coordinates", "unit already has an action this tick", "unknown move north",
+            "unit belongs to another agent", "unit is dead", "unknown action type jump"])
+
+    async def test_own_bomb_can_be_detonated(self):
+        action = {"type": "detonate", "coordinates": [0, 1], "unit_id": "c"}
+        self.assertEqual(await self.client.send_actions([action]), [])
+        self.assertEqual(self.client.connection.sent, [action])
+
+    async def test_batch_is_written_in_order_with_one_flush(self):
+        received = []
+        done = asyncio.Event()
+
+        async def handler(connection, path=None):
+            async for raw_data in connection:
+                received.append(json.loads(raw_data))
+                if len(received) == 2:
+                    done.set()
+        server = await websockets.serve(handler, "127.0.0.1", 0)
+        self.client._connection_string = f"ws://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+        connection = await self.client.connect()
+        drain = connection.drain
+        drains = []
+
+        async def counting_drain():
+            drains.append(1)
+            await drain()
+        connection.drain = counting_drain
+
+        actions = [{"type": "detonate", "coordinates": [0, 1], "unit_id": "c"},
+                   {"type": "bomb", "unit_id": "e"}]
+        self.assertEqual(await self.client.send_actions(actions), [])
+        await asyncio.wait_for(done.wait(), 5)
+        flushes = len(drains)
+        await connection.close()
+        server.close()
+        await server.wait_closed()
+
+        self.assertEqual(received, actions)
+        self.assertEqual(flushes, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+from unittest import IsolatedAsyncioTestCase
+from game_state import GameState
+from state_snapshot import StateSnapshot, thaw
+from test_game_state import (copy_object, mock_state_packet, mock_tick_bomb_spawn_packet,
+                             mock_tick_entity_state_packet, mock_tick_expired_packet, mock_tick_spawn_packet,
+                             mock_tick_unit_action_packet, mock_tick_unit_state_packet)
+
+
+def sort_entities(entities):
+    return sorted(entities, key=lambda entity: sorted(entity.items()))
+
+
+class TestStateSnapshot(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.client = GameState("")
+        self.client.enable_snapshots(history_length=3)
+
+        async def on_tick(tick_number, game_state):
+            pass
+        self.client.set_game_tick_callback(on_tick)
+
+    async def test_snapshots_follow_live_state(self):
+        await self.client._on_data(copy_object(mock_state_packet))
+        for packet in [mock_tick_unit_action_packet, mock_tick_spawn_packet, mock_tick_bomb_spawn_packet,
+                       mock_tick_entity_state_packet, mock_tick_unit_state_packet, mock_tick_expired_packet]:
+            await self.client._on_data(copy_object(packet))
+            snapshot = thaw(self.client.snapshots.latest)
+            expected = copy_object(self.client._state)
+            self.assertEqual(sort_entities(snapshot.pop("entities")),
+                             sort_entities(expected.pop("entities")))
+            self.assertEqual(snapshot, expected)
+        self.assertEqual(len(self.client.snapshots), 3)
+        self.assertEqual(self.client.snapshots.latest.tick, 62)
+        self.assertEqual(self.client.snapshots.get_tick(30).tick, 30)
+        self.assertIsNone(self.client.snapshots.get_tick(5))
+
+    async def test_unchanged_parts_are_shared(self):
+        await self.client._on_data(copy_object(mock_state_packet))
+        await self.client._on_data(copy_object(mock_tick_unit_action_packet))
+        await self.client._on_data(copy_object(mock_tick_spawn_packet))
+        initial, moved, spawned = self.client.snapshots
+        self.assertEqual(initial["unit_state"]["c"]["coordinates"], (3, 10))
+        self.assertEqual(moved["unit_state"]["c"]["coordinates"], (4, 10))
+        self.assertIs(moved["unit_state"]["c"]["inventory"],
+                      initial["unit_state"]["c"]["inventory"])
+        self.assertIs(moved["unit_state"]["d"], initial["unit_state"]["d"])
+        self.assertIs(moved["world"], initial["world"])
+        self.assertIs(moved._rows, initial._rows)
+        self.assertIs(spawned["unit_state"], moved["unit_state"])
+        for y, row in enumerate(spawned._rows):
+            if y == 3:
+                self.assertEqual(len(row), len(moved._rows[3]) + 1)
+            else:
+                self.assertIs(row, moved._rows[y])
+
+    async def test_snapshots_are_immutable(self):
+        await self.client._on_data(copy_object(mock_state_packet))
+        snapshot = self.client.snapshots.latest
+        with self.assertRaises(TypeError):
+            snapshot["tick"] = 1
+        with self.assertRaises(TypeError):
+            snapshot["unit_state"]["c"]["hp"] = 0
+        with self.assertRaises(TypeError):
+            snapshot["entities"][0]["hp"] = 0
+        self.client._state["unit_state"]["c"]["hp"] = 0
+        self.assertEqual(snapshot["unit_state"]["c"]["hp"], 3)
+
+    async def test_branching_leaves_the_original_unchanged(self):
+        await self.client._on_data(copy_object(mock_state_packet))
+        root = self.client.snapshots.latest
+        left = root.apply_tick(1, [{"type": "unit", "data": {"type": "move", "move": "left", "unit_id": "c"}}])
+        bomb = root.apply_tick(1, [{"type": "entity_spawned", "data": {
+                               "created": 1, "x": 3, "y": 10, "type": "b", "unit_id": "c"}}])
+        self.assertEqual(root["unit_state"]["c"]["coordinates"], (3, 10))
+        self.assertEqual(left["unit_state"]["c"]["coordinates"], (2, 10))
+        self.assertEqual(root.get_at(3, 10), [])
+        self.assertEqual(left.get_at(3, 10), [])
+        self.assertEqual(bomb.get_at(3, 10)[0]["type"], "b")
+        self.assertEqual(len(bomb["entities"]), len(root["entities"]) + 1)
+        self.assertEqual(root.tick, 0)
+
+    def test_from_state_without_game_state(self):
+        snapshot = StateSnapshot.from_state({"unit_state": {}, "entities": [{"x": 1, "y": 0, "type": "m"}],
+                                             "world": {"width": 2, "height": 2}, "tick": 4})
+        self.assertEqual(snapshot.to_dict(), {"unit_state": {}, "entities": [{"x": 1, "y": 0, "type": "m"}],
+                                              "world": {"width": 2, "height": 2}, "tick": 4})
+        self.assertEqual(snapshot.without_entities_at(0, 0), snapshot)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from observation_encoder import NUM_FEATURES, NUM_PLANES
+from tflite_model import TFLiteRunner, compare, export_tflite, load_observations
+
+replay_path = os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), "..", "replay.json")
+
+try:
+    import create_cnn
+except ImportError:
+    create_cnn = None
+
+
+@unittest.skipIf(create_cnn is None, "tensorflow is not installed")
+class TestTFLiteModel(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.model = create_cnn.create_cnn(
+            (15, 15, NUM_PLANES), NUM_FEATURES, 6, 16)
+        cls.observations = load_observations([replay_path], 40)
+        cls.directory = tempfile.TemporaryDirectory()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def predict_keras(self, spatial, non_spatial):
+        return self.model([np.repeat(spatial, len(non_spatial), axis=0), non_spatial], training=False).numpy()
+
+    def test_load_observations(self):
+        self.assertEqual(len(self.observations), 40)
+        spatial, non_spatial = self.observations[-1]
+        self.assertEqual(spatial.shape, (1, 15, 15, NUM_PLANES))
+        self.assertEqual(non_spatial.shape[1], NUM_FEATURES)
+
+    def test_float_model_matches_keras(self):
+        path = os.path.join(self.directory.name, "float.tflite")
+        export_tflite(self.model, path)
+        runner = TFLiteRunner(path)
+        # the number of units changes between calls
+        for spatial, non_spatial in [self.observations[0], (self.observations[1][0], self.observations[1][1][:1])]:
+            actions, probabilities = runner.policy(spatial, non_spatial)
+            expected = self.predict_keras(spatial, non_spatial)
+            np.testing.assert_allclose(probabilities, expected, atol=1e-5)
+            np.testing.assert_array_equal(actions, np.argmax(expected, axis=1))
+
+    def test_int8_model_is_close(self):
+        float_path = os.path.join(self.directory.name, "reference.tflite")
+        int8_path = os.path.join(self.directory.name, "int8.tflite")
+        float_size = export_tflite(self.model, float_path)
+        int8_size = export_tflite(self.model, int8_path, self.observations)
+        self.assertLess(int8_size, float_size)
+        results = compare(self.predict_keras, {"int8": TFLiteRunner(int8_path).predict}, self.observations, repeat=1)
+        self.assertEqual(results["reference"]["max_abs_error"], 0)
+        self.assertLess(results["int8"]["max_abs_error"], 0.1)
+        self.assertGreater(results["int8"]["us_per_call"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
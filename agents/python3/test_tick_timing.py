@@ -0,0 +1,92 @@
+import asyncio
+import copy
+import json
+import random
+import unittest
+from unittest import IsolatedAsyncioTestCase
+import websockets
+from game_state import GameState
+from dev_gym import mock_6x6_state
+from tick_timing import LatencyHistogram, StartupTimings
+
+
+class ScriptedConnection():
+    def __init__(self, packets):
+        self._packets = [json.dumps(packet) for packet in packets]
+        self.sent = []
+
+    async def recv(self):
+        if len(self._packets) == 0:
+            raise websockets.exceptions.ConnectionClosed(None, None)
+        return self._packets.pop(0)
+
+    async def send(self, raw_data):
+        self.sent.append(raw_data)
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    def test_percentiles_are_within_bucket_precision(self):
+        random_values = random.Random(0)
+        values = sorted(random_values.randint(0, 10 ** 7)
+                        for _ in range(10000))
+        histogram = LatencyHistogram()
+        for value in values:
+            histogram.record(value)
+        for q in (0.5, 0.9, 0.99):
+            exact = values[int(q * len(values) + 0.5) - 1]
+            self.assertAlmostEqual(histogram.percentile(q) / exact, 1, delta=1 / 64)
+        self.assertEqual(histogram.percentile(1), values[-1])
+
+    def test_small_values_are_exact(self):
+        histogram = LatencyHistogram()
+        for value in range(100):
+            histogram.record(value)
+        self.assertEqual(histogram.percentile(0.5), 49)
+
+
+class TestTickTimings(IsolatedAsyncioTestCase):
+    async def test_stages_and_deadline_misses_are_recorded(self):
+        state = copy.deepcopy(mock_6x6_state)
+        state["config"]["tick_rate_hz"] = 50
+        ticks = [{"type": "tick", "payload": {"tick": tick, "events": []}}
+                 for tick in range(1, 4)]
+        connection = ScriptedConnection(
+            [{"type": "game_state", "payload": state}, *ticks])
+        client = GameState("")
+        client.connection = connection
+        client.enable_timing()
+
+        async def on_game_tick(tick_number, game_state):
+            await client.send_move("up", "c")
+            if tick_number == 2:
+                await asyncio.sleep(0.03)
+        client.set_game_tick_callback(on_game_tick)
+        await client._handle_messages(connection)
+
+        summary = client.timings.summary()
+        self.assertEqual(summary.get("ticks"), 3)
+        self.assertEqual(summary.get("deadline_misses"), 1)
+        self.assertEqual(summary.get("stages").get("send").get("count"), 3)
+        self.assertGreaterEqual(summary.get("stages").get("callback").get("max_ms"), 30)
+        self.assertEqual(len(connection.sent), 3)
+
+    def test_timing_is_off_by_default(self):
+        self.assertIsNone(GameState("").timings)
+
+
+class TestStartupTimings(unittest.TestCase):
+    def test_overlapping_phases(self):
+        timings = StartupTimings(origin=0)
+        timings.phases = {"load_model": [1000000, 5000000], "connect": [0, 2000000], "first_tick": [5000000, -1]}
+        summary = timings.summary()
+        # by start, unfinished phases are left out
+        self.assertEqual(list(summary.keys()), ["connect", "load_model"])
+        self.assertEqual(summary["load_model"], {"start_ms": 1.0, "end_ms": 5.0, "duration_ms": 4.0})
+        self.assertIn("startup took 5.0ms", timings.format_summary())
+        timings.start("warm_up")
+        timings.end("warm_up")
+        self.assertGreater(timings.summary()["warm_up"]["end_ms"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import multiprocessing
+import tempfile
+import unittest
+import numpy as np
+from trajectory_buffer import TrajectoryBuffer
+
+spatial_shape = (3, 3, 2)
+num_features = 4
+
+
+def create_rows(rows: int, first_action: int):
+    actions = np.arange(first_action, first_action + rows)
+    spatial = np.ones((rows, *spatial_shape), dtype=np.float32) * \
+        actions[:, None, None, None]
+    non_spatial = np.ones((rows, num_features), dtype=np.float32)
+    return spatial, non_spatial, actions, np.zeros(rows), np.ones(rows), np.zeros(rows, dtype=bool)
+
+
+def append_from_process(directory: str, first_action: int):
+    buffer = TrajectoryBuffer(directory, 64, spatial_shape, num_features)
+    for i in range(10):
+        buffer.append(*create_rows(2, first_action + i * 2), stream=first_action)
+    buffer.close()
+
+
+class TestTrajectoryBuffer(unittest.TestCase):
+    def test_ring_wraps_and_survives_reopening(self):
+        with tempfile.TemporaryDirectory() as directory:
+            buffer = TrajectoryBuffer(
+                directory, 5, spatial_shape, num_features)
+            self.assertEqual(buffer.append(*create_rows(3, 0)), 0)
+            self.assertEqual(buffer.append(*create_rows(3, 3)), 3)
+            buffer.close()
+
+            buffer = TrajectoryBuffer(
+                directory, 5, spatial_shape, num_features)
+            self.assertEqual(buffer.total_steps, 6)
+            self.assertEqual(len(buffer), 5)
+            rows = buffer.get(0, 5)
+            self.assertEqual(list(rows.get("action")), [5, 1, 2, 3, 4])
+            self.assertEqual(list(rows.get("step")), [5, 1, 2, 3, 4])
+            self.assertTrue(np.all(rows.get("spatial")[0] == 5))
+            with self.assertRaises(ValueError):
+                TrajectoryBuffer(directory, 6, spatial_shape, num_features)
+            buffer.close()
+
+    def test_shared_spatial_observation_is_broadcast(self):
+        with tempfile.TemporaryDirectory() as directory:
+            buffer = TrajectoryBuffer(
+                directory, 5, spatial_shape, num_features)
+            spatial = np.full((1, *spatial_shape), 7, dtype=np.float32)
+            buffer.append(spatial, np.zeros((3, num_features)), [0, 1, 2], 0.0, 0.0, False)
+            self.assertTrue(np.all(buffer.get(0, 3).get("spatial") == 7))
+            buffer.close()
+
+    def test_minibatches_are_views_covering_every_row(self):
+        with tempfile.TemporaryDirectory() as directory:
+            buffer = TrajectoryBuffer(
+                directory, 10, spatial_shape, num_features)
+            buffer.append(*create_rows(10, 0))
+            actions = []
+            for batch in buffer.minibatches(4, np.random.default_rng(0)):
+                self.assertTrue(np.shares_memory(
+                    batch.get("spatial"), buffer.fields.get("spatial")))
+                actions.extend(batch.get("action"))
+            self.assertEqual(sorted(actions), list(range(10)))
+            buffer.close()
+
+    def test_processes_append_to_one_buffer(self):
+        with tempfile.TemporaryDirectory() as directory:
+            context = multiprocessing.get_context("spawn")
+            processes = [context.Process(target=append_from_process, args=(
+                directory, first_action)) for first_action in (0, 100)]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+            buffer = TrajectoryBuffer(
+                directory, 64, spatial_shape, num_features)
+            self.assertEqual(buffer.total_steps, 40)
+            rows = buffer.get(0, 40)
+            self.assertEqual(sorted(rows.get("step")), list(range(40)))
+            self.assertEqual(sorted(rows.get("action")), list(
+                range(20)) + list(range(100, 120)))
+            for stream in (0, 100):
+                actions = rows.get("action")[rows.get("stream") == stream]
+                self.assertEqual(list(actions), sorted(actions))
+            buffer.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
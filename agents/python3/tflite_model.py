@@ -0,0 +1,202 @@
+from observation_encoder import ObservationEncoder, NUM_FEATURES, NUM_PLANES
+from typing import Callable, Dict, List, Optional, Tuple
+import json
+import os
+import time
+import numpy as np
+
+_directory = os.path.dirname(os.path.abspath(__file__))
+
+# keras weights of the create_cnn model to export, random weights when not set
+model_weights_path = os.environ.get("MODEL_WEIGHTS")
+
+tflite_path = os.environ.get("TFLITE_MODEL_PATH") or os.path.join(
+    _directory, "cnn.tflite")
+
+# "int8" exports a model quantized with observations from TFLITE_CALIBRATION_REPLAYS, "float" (default) does not
+quantization = os.environ.get("TFLITE_QUANTIZATION") or "float"
+
+calibration_paths = (os.environ.get("TFLITE_CALIBRATION_REPLAYS") or ",".join([
+    os.path.join(_directory, "..", "replay.json"),
+    os.path.join(_directory, "..", "..", "engine",
+                 "bomberland-engine", "replay.json"),
+])).split(",")
+
+# observations used for calibration and for the comparison, at most
+max_observations = int(os.environ.get("TFLITE_OBSERVATIONS") or 500)
+
+input_shape = (15, 15, NUM_PLANES)
+num_actions = 6
+hidden_units = 64
+
+
+"""
+the ObservationEncoder inputs ((1, H, W, planes), (units, features)) of
+every agent at every tick of the recorded `endgame_state` packets in
+`paths`, as copies
+"""
+def load_observations(paths: List[str], max_observations: Optional[int] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+    observations = []
+    for path in paths:
+        with open(path) as replay_file:
+            payload = json.load(replay_file).get("payload")
+        initial_state = payload.get("initial_state")
+        encoders = []
+        for agent_id in initial_state.get("agents"):
+            encoder = ObservationEncoder(agent_id)
+            encoder.on_game_state(json.loads(json.dumps(initial_state)))
+            encoders.append(encoder)
+        for tick in payload.get("history"):
+            tick_number = tick.get("tick")
+            for encoder in encoders:
+                for event in json.loads(json.dumps(tick.get("events"))):
+                    encoder.on_event(tick_number, event)
+                spatial, non_spatial = encoder.get_inputs(tick_number)
+                if len(non_spatial) > 0:
+                    observations.append((spatial.copy(), non_spatial.copy()))
+    if max_observations is not None and len(observations) > max_observations:
+        # spread over the whole games rather than the first ticks
+        step = len(observations) / max_observations
+        observations = [observations[int(index * step)]
+                        for index in range(max_observations)]
+    return observations
+
+
+"""
+converts a create_cnn model to a TFLite flatbuffer (inputs and output as
+in keras, one row per unit). With `calibration` observations the weights
+and activations are quantized to int8; the inputs and the output stay
+float32, so the runner works with both.
+"""
+def export_tflite(model, path: str, calibration: Optional[List[Tuple[np.ndarray, np.ndarray]]] = None) -> int:
+    import tensorflow as tf
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if calibration is not None:
+        def representative_dataset():
+            for spatial, non_spatial in calibration:
+                yield [np.repeat(spatial, len(non_spatial), axis=0), non_spatial]
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+    flatbuffer = converter.convert()
+    with open(path, "wb") as model_file:
+        model_file.write(flatbuffer)
+    return len(flatbuffer)
+
+
+def load_interpreter_type():
+    # the standalone runtimes are a few megabytes, tensorflow is the fallback
+    try:
+        from tflite_runtime.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    import tensorflow as tf
+    return tf.lite.Interpreter
+
+
+class TFLiteRunner:
+    """
+    Runs a model exported by `export_tflite` with the TFLite interpreter
+    only: `predict(spatial, non_spatial)` returns (units, num_actions)
+    probabilities and `policy(spatial, non_spatial)` the greedy action of
+    every unit along with them. The spatial observation is repeated per
+    unit into a preallocated batch and the interpreter is only resized when
+    the number of units changes.
+    """
+
+    def __init__(self, path: str, num_threads: Optional[int] = None):
+        self._interpreter = load_interpreter_type()(
+            model_path=path, num_threads=num_threads)
+        inputs = {detail["name"]: detail["index"]
+                  for detail in self._interpreter.get_input_details()}
+        self._spatial_index = next(index for name, index in inputs.items() if "non_spatial" not in name)
+        self._non_spatial_index = next(index for name, index in inputs.items() if "non_spatial" in name)
+        self._output_index = self._interpreter.get_output_details()[0]["index"]
+        self._spatial_batch = np.zeros(0, dtype=np.float32)
+
+    def predict(self, spatial: np.ndarray, non_spatial: np.ndarray) -> np.ndarray:
+        interpreter = self._interpreter
+        num_units = len(non_spatial)
+        if num_units != len(self._spatial_batch):
+            self._spatial_batch = np.zeros(
+                (num_units, *spatial.shape[1:]), dtype=np.float32)
+            interpreter.resize_tensor_input(
+                self._spatial_index, self._spatial_batch.shape)
+            interpreter.resize_tensor_input(
+                self._non_spatial_index, non_spatial.shape)
+            interpreter.allocate_tensors()
+        self._spatial_batch[:] = spatial
+        interpreter.set_tensor(self._spatial_index, self._spatial_batch)
+        interpreter.set_tensor(self._non_spatial_index, non_spatial)
+        interpreter.invoke()
+        return interpreter.get_tensor(self._output_index)
+
+    def policy(self, spatial: np.ndarray, non_spatial: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        probabilities = self.predict(spatial, non_spatial)
+        return np.argmax(probabilities, axis=1), probabilities
+
+
+"""
+for every predict function (observation -> probabilities), the time per
+call (fastest of `repeat` passes over the observations), how far its
+probabilities are from the reference's and how often it picks the same
+greedy action
+"""
+def compare(reference: Callable, candidates: Dict[str, Callable], observations: List[Tuple[np.ndarray, np.ndarray]],
+            repeat: int = 3) -> Dict[str, Dict]:
+    expected = [np.asarray(reference(*observation))
+                for observation in observations]
+    results = {}
+    for name, predict in [("reference", reference), *candidates.items()]:
+        durations = []
+        for _ in range(repeat):
+            start = time.perf_counter_ns()
+            outputs = [np.asarray(predict(*observation))
+                       for observation in observations]
+            durations.append(time.perf_counter_ns() - start)
+        errors = np.concatenate([np.abs(output - target).max(axis=1)
+                                for output, target in zip(outputs, expected)])
+        agreement = np.concatenate([np.argmax(output, axis=1) == np.argmax(target, axis=1)
+                                    for output, target in zip(outputs, expected)])
+        results[name] = {
+            "us_per_call": min(durations) / len(observations) / 1000,
+            "max_abs_error": float(errors.max()),
+            "mean_abs_error": float(errors.mean()),
+            "action_agreement": float(agreement.mean()),
+        }
+    return results
+
+
+def format_comparison(results: Dict[str, Dict]) -> str:
+    lines = [f"{'model':<12}{'us/call':>10}{'max error':>12}{'mean error':>12}{'same action':>13}"]
+    for name, result in results.items():
+        lines.append(f"{name:<12}{result['us_per_call']:>10.1f}{result['max_abs_error']:>12.5f}"
+                     f"{result['mean_abs_error']:>12.5f}{result['action_agreement']:>13.1%}")
+    return "\n".join(lines)
+
+
+def main():
+    import create_cnn
+    model = create_cnn.create_cnn(
+        input_shape, NUM_FEATURES, num_actions, hidden_units)
+    if model_weights_path:
+        model.load_weights(model_weights_path)
+    observations = load_observations(calibration_paths, max_observations)
+    calibration = observations if quantization == "int8" else None
+    size = export_tflite(model, tflite_path, calibration)
+    print(f"exported {quantization} model to {tflite_path} ({size} bytes)")
+
+    policy = create_cnn.create_policy_fn(model, input_shape, NUM_FEATURES)
+    runner = TFLiteRunner(tflite_path)
+    print(f"{len(observations)} recorded observations")
+    print(format_comparison(compare(lambda spatial, non_spatial: policy(spatial, non_spatial)[1].numpy(),
+                                    {quantization: runner.predict}, observations)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+import time
+from typing import Dict, List, Optional
+
+# stages of a tick, in the order they happen
+STAGES = ["decode", "apply", "callback", "send", "total"]
+
+
+class LatencyHistogram:
+    """
+    HDR-style histogram of durations in microseconds: values below
+    2 * `sub_buckets` are counted exactly, larger ones in buckets of
+    `sub_buckets` per power of two, so every value is kept with a relative
+    error below 1 / `sub_buckets` in a fixed amount of memory. Recording is
+    a few integer operations and one list increment.
+    """
+
+    def __init__(self, sub_buckets: int = 64, max_value_bits: int = 40):
+        self._sub_bucket_bits = sub_buckets.bit_length() - 1
+        self._sub_buckets = 1 << self._sub_bucket_bits
+        self._counts: List[int] = [
+            0] * ((max_value_bits - self._sub_bucket_bits + 1) << self._sub_bucket_bits)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, value: int):
+        if value < 0:
+            value = 0
+        shift = value.bit_length() - self._sub_bucket_bits - 1
+        if shift <= 0:
+            index = value
+        else:
+            index = (shift << self._sub_bucket_bits) + (value >> shift)
+        self._counts[min(index, len(self._counts) - 1)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    """
+    value at quantile `q` (0 to 1), reported as the upper bound of its bucket
+    """
+    def percentile(self, q: float) -> int:
+        if self.count == 0:
+            return 0
+        target = max(int(q * self.count + 0.5), 1)
+        seen = 0
+        for index, count in enumerate(self._counts):
+            seen += count
+            if seen >= target:
+                return min(self._get_upper_bound(index), self.max)
+        return self.max
+
+    def _get_upper_bound(self, index: int) -> int:
+        if index < 2 * self._sub_buckets:
+            return index
+        shift = index // self._sub_buckets - 1
+        return ((index - (shift << self._sub_bucket_bits)) << shift) + (1 << shift) - 1
+
+    def reset(self):
+        self._counts = [0] * len(self._counts)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+
+class TickTimings:
+    """
+    Per-stage latency of every tick handled by GameState (enable it with
+    `GameState.enable_timing()` or TICK_TIMING=1). GameState marks the time
+    a tick packet was received, decoded, applied to the state and handed
+    back by the tick callback, and adds up the time spent in sends:
+
+    - decode: receive to decoded packet
+    - apply: decoded to state (and state listeners) updated
+    - callback: the tick callback, including its sends
+    - send: time spent in send_* calls during the callback
+    - total: receive to callback done, compared against the tick period
+
+    The timestamps of the last tick are in `last_tick` (perf_counter_ns).
+    """
+
+    def __init__(self):
+        self.histograms: Dict[str, LatencyHistogram] = {
+            stage: LatencyHistogram() for stage in STAGES}
+        self.ticks = 0
+        self.deadline_misses = 0
+        self.tick_period_ns: Optional[int] = None
+        self.last_tick: Dict[str, int] = {}
+        self._received = 0
+        self._decoded = 0
+        self._applied = 0
+        self._send_ns = 0
+
+    def set_tick_rate(self, tick_rate_hz: float):
+        self.tick_period_ns = int(1e9 / tick_rate_hz)
+
+    def on_received(self):
+        self._received = time.perf_counter_ns()
+        self._send_ns = 0
+
+    def on_decoded(self):
+        self._decoded = time.perf_counter_ns()
+
+    def on_applied(self):
+        self._applied = time.perf_counter_ns()
+
+    def add_send(self, duration_ns: int):
+        self._send_ns += duration_ns
+
+    def on_callback_done(self):
+        done = time.perf_counter_ns()
+        histograms = self.histograms
+        histograms["decode"].record((self._decoded - self._received) // 1000)
+        histograms["apply"].record((self._applied - self._decoded) // 1000)
+        histograms["callback"].record((done - self._applied) // 1000)
+        histograms["send"].record(self._send_ns // 1000)
+        total = done - self._received
+        histograms["total"].record(total // 1000)
+        self.ticks += 1
+        if self.tick_period_ns is not None and total > self.tick_period_ns:
+            self.deadline_misses += 1
+        self.last_tick = {"received": self._received, "decoded": self._decoded, "applied": self._applied,
+                          "callback_done": done, "send_ns": self._send_ns}
+
+    """
+    {stage: {count, mean_ms, p50_ms, p90_ms, p99_ms, max_ms}} plus the
+    number of ticks and deadline misses
+    """
+    def summary(self) -> Dict:
+        stages = {}
+        for stage, histogram in self.histograms.items():
+            stages[stage] = {
+                "count": histogram.count,
+                "mean_ms": histogram.total / histogram.count / 1000 if histogram.count > 0 else 0.0,
+                "p50_ms": histogram.percentile(0.5) / 1000,
+                "p90_ms": histogram.percentile(0.9) / 1000,
+                "p99_ms": histogram.percentile(0.99) / 1000,
+                "max_ms": histogram.max / 1000,
+            }
+        return {"ticks": self.ticks, "deadline_misses": self.deadline_misses, "stages": stages}
+
+    def format_summary(self) -> str:
+        summary = self.summary()
+        period = f"{self.tick_period_ns / 1e6:.1f}ms" if self.tick_period_ns is not None else "unknown"
+        lines = [
+            f"{summary['ticks']} ticks, {summary['deadline_misses']} over the {period} tick period"]
+        for stage, stats in summary["stages"].items():
+            lines.append(
+                f"{stage:>8}: mean {stats['mean_ms']:.3f}ms, p50 {stats['p50_ms']:.3f}ms, p90 {stats['p90_ms']:.3f}ms, "
+                f"p99 {stats['p99_ms']:.3f}ms, max {stats['max_ms']:.3f}ms")
+        return "\n".join(lines)
+
+    def reset(self):
+        for histogram in self.histograms.values():
+            histogram.reset()
+        self.ticks = 0
+        self.deadline_misses = 0
+
+
+class StartupTimings:
+    """
+    Start and end of every startup phase (importing, loading the model,
+    connecting, warming up, waiting for the first tick) in nanoseconds
+    since `origin`. Phases can overlap, the connection is opened while the
+    model loads, and can be recorded from any thread.
+    """
+
+    def __init__(self, origin: Optional[int] = None):
+        self.origin = time.perf_counter_ns() if origin is None else origin
+        self.phases: Dict[str, List[int]] = {}
+
+    def start(self, phase: str):
+        self.phases[phase] = [time.perf_counter_ns() - self.origin, -1]
+
+    def end(self, phase: str):
+        self.phases[phase][1] = time.perf_counter_ns() - self.origin
+
+    """
+    {phase: {start_ms, end_ms, duration_ms}} of the finished phases, by start
+    """
+    def summary(self) -> Dict[str, Dict]:
+        return {phase: {"start_ms": start / 1e6, "end_ms": end / 1e6, "duration_ms": (end - start) / 1e6}
+                for phase, (start, end) in sorted(self.phases.items(), key=lambda item: item[1][0]) if end >= 0}
+
+    def format_summary(self) -> str:
+        summary = self.summary()
+        lines = [f"startup took {max((stats['end_ms'] for stats in summary.values()), default=0.0):.1f}ms"]
+        for phase, stats in summary.items():
+            lines.append(f"{phase:>12}: {stats['duration_ms']:.1f}ms ({stats['start_ms']:.1f}ms - "
+                         f"{stats['end_ms']:.1f}ms)")
+        return "\n".join(lines)
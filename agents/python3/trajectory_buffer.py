@@ -0,0 +1,142 @@
+import fcntl
+import os
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+import numpy as np
+
+# per row fields besides the observation, one row is one unit step
+_scalar_fields = {
+    "action": np.int32,
+    "log_prob": np.float32,
+    "reward": np.float32,
+    "done": np.bool_,
+    "value": np.float32,
+    # id of the trajectory the row belongs to (e.g. actor * units + unit), rows of
+    # one stream are in step order so returns can be computed per stream
+    "stream": np.int32,
+}
+
+
+class TrajectoryBuffer:
+    """
+    Fixed capacity ring buffer of PPO steps stored as one memory-mapped
+    `.npy` file per field in `directory`, so it can hold far more steps than
+    fit in RAM and survives restarts (the write position is stored in
+    `cursor.npy`). Opening an existing directory with different shapes
+    raises ValueError.
+
+    Any number of processes can open the same directory: `append` reserves
+    rows under a file lock and writes them straight into the mapped files,
+    nothing is pickled. `step` holds the global index of every row and is
+    written last, rows that are empty or being written hold -1.
+    Reads (`get`, `minibatches`) return views of the mapped files, no copies.
+    """
+
+    def __init__(self, directory: str, capacity: int, spatial_shape: Tuple[int, ...], num_features: int):
+        self.capacity = capacity
+        os.makedirs(directory, exist_ok=True)
+        self._lock_file = open(os.path.join(directory, "lock"), "a")
+        specs = {
+            "spatial": (np.float32, (capacity, *spatial_shape)),
+            "non_spatial": (np.float32, (capacity, num_features)),
+            **{name: (dtype, (capacity,)) for name, dtype in _scalar_fields.items()},
+            "step": (np.int64, (capacity,)),
+        }
+        with self._locked():
+            self.fields: Dict[str, np.memmap] = {name: _open_array(os.path.join(directory, f"{name}.npy"), dtype, shape,
+                                                                   -1 if name == "step" else 0)
+                                                 for name, (dtype, shape) in specs.items()}
+            self._cursor = _open_array(os.path.join(
+                directory, "cursor.npy"), np.int64, (1,), 0)
+
+    """
+    total number of steps ever appended, the buffer holds the last `capacity` of them
+    """
+    @property
+    def total_steps(self) -> int:
+        return int(self._cursor[0])
+
+    def __len__(self) -> int:
+        return min(self.total_steps, self.capacity)
+
+    """
+    appends n rows, every argument has n entries along its first axis.
+    Scalars and a (1, ...) spatial observation shared by all units are
+    broadcast. Returns the global step index of the first row
+    """
+    def append(self, spatial: np.ndarray, non_spatial: np.ndarray, action, log_prob, reward, done,
+               value=0.0, stream=0) -> int:
+        rows = len(non_spatial)
+        if rows > self.capacity:
+            raise ValueError(
+                f"cannot append {rows} rows to a buffer of capacity {self.capacity}")
+        with self._locked():
+            first_step = int(self._cursor[0])
+            self._cursor[0] = first_step + rows
+        # a ring wrap splits the rows into two slices
+        start = first_step % self.capacity
+        split = min(rows, self.capacity - start)
+        parts = [(slice(start, start + split), slice(0, split)),
+                 (slice(0, rows - split), slice(split, rows))]
+        values = {"spatial": spatial, "non_spatial": non_spatial, "action": action, "log_prob": log_prob,
+                  "reward": reward, "done": done, "value": value, "stream": stream}
+        step = self.fields["step"]
+        for target, source in parts:
+            step[target] = -1
+        for name, data in values.items():
+            data = np.asarray(data)
+            for target, source in parts:
+                # scalars and a single shared spatial observation broadcast over the rows
+                self.fields[name][target] = data[source] if data.ndim > 0 and len(data) == rows else data
+        for target, source in parts:
+            step[target] = np.arange(first_step + source.start, first_step + source.stop)
+        return first_step
+
+    """
+    zero-copy views of rows `start` to `stop` (positions in the files, not
+    step indices)
+    """
+    def get(self, start: int, stop: int) -> Dict[str, np.ndarray]:
+        return {name: array[start:stop] for name, array in self.fields.items()}
+
+    """
+    yields every stored row once as views of `batch_size` consecutive rows,
+    in random order. Rows are only shuffled between minibatches so that
+    each minibatch stays one contiguous, zero-copy slice
+    """
+    def minibatches(self, batch_size: int, rng: Optional[np.random.Generator] = None) -> Iterator[Dict[str, np.ndarray]]:
+        rng = rng or np.random.default_rng()
+        size = len(self)
+        for start in rng.permutation(np.arange(0, size, batch_size)):
+            yield self.get(start, min(start + batch_size, size))
+
+    def flush(self):
+        for array in self.fields.values():
+            array.flush()
+        self._cursor.flush()
+
+    def close(self):
+        self.flush()
+        self._lock_file.close()
+
+    @contextmanager
+    def _locked(self):
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+
+def _open_array(path: str, dtype, shape: Tuple[int, ...], fill_value) -> np.memmap:
+    if not os.path.exists(path):
+        array = np.lib.format.open_memmap(
+            path, mode="w+", dtype=dtype, shape=shape)
+        if fill_value != 0:
+            array.fill(fill_value)
+        return array
+    array = np.lib.format.open_memmap(path, mode="r+")
+    if array.dtype != np.dtype(dtype) or array.shape != shape:
+        raise ValueError(
+            f"{path} holds {array.dtype} {array.shape}, expected {np.dtype(dtype)} {shape}")
+    return array